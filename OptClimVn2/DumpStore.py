@@ -0,0 +1,122 @@
+"""
+Provide a content-addressed store for model start dumps.
+
+HadCM3 runs of a study start from the same, large, atmosphere and ocean dumps. Rather than copy them into the work
+directory of every run each dump is held once in a store directory, named by the sha256 of its contents, and
+runs get a clone, hard link or symbolic link to the stored file. Identical dumps (from different reference
+directories or, if the store is shared, different studies) are only held once.
+
+Stored files are read only. Removing the store only loses the sharing -- runs that clone or hard link their
+dumps keep them.
+"""
+
+import hashlib
+import os
+import pathlib
+import stat
+import threading
+
+import optClimLib
+
+__version__ = '0.1.0'
+
+_digests = dict()  # (path, size, mtime, inode) -> sha256 of files already hashed. See DumpStore.digest.
+_digestsLock = threading.Lock()
+
+
+class DumpStore(object):
+    """
+    Content-addressed (sha256) store of model dumps.
+
+    Example use:
+        store = DumpStore(rootDir/'.dumpStore')
+        store.place(refDir/'xnmea.astart', runDir/'W'/'xnmea.astart') # store the dump (once) and link it in.
+    """
+    chunkSize = 2 ** 20  # bytes read at a time when hashing.
+
+    def __init__(self, path):
+        """
+        Create DumpStore instance. The store directory is created when the first dump is added.
+        :param path: path to the store directory.
+        """
+        self.path = pathlib.Path(path)
+
+    @classmethod
+    def digest(cls, path):
+        """
+        sha256 of a file. Digests are cached keyed by path, size, mtime and inode so an unchanged
+          file is only read once per process.
+        :param path: path to file
+        :return: hex digest.
+        """
+        path = pathlib.Path(path).resolve()
+        st = path.stat()
+        key = (str(path), st.st_size, st.st_mtime_ns, st.st_ino)
+        with _digestsLock:
+            digest = _digests.get(key)
+        if digest is None:
+            sha = hashlib.sha256()
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(cls.chunkSize), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+            with _digestsLock:
+                _digests[key] = digest
+        return digest
+
+    def objectPath(self, digest):
+        """
+        :param digest: digest of a stored dump
+        :return: path to the stored dump.
+        """
+        return self.path / 'objects' / digest[0:2] / digest[2:]
+
+    def _store(self, path, make):
+        """
+        Store a file. It is made as a temporary file which is made read only and then renamed so a partly
+          made file is never seen. When two processes store the same file the last one wins.
+        :param path: path in the store.
+        :param make: function that makes the file given the temporary path.
+        :return: path
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.parent / f'.{path.name}.{os.getpid()}_{threading.get_ident()}.tmp'
+        try:
+            make(tmp)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return path
+
+    def add(self, src):
+        """
+        Add a dump to the store (if not already there). The dump is cloned or copied -- never hard linked as
+          the source might be changed.
+        :param src: path to dump.
+        :return: digest of the dump.
+        """
+        digest = self.digest(src)
+        path = self.objectPath(digest)
+        if not path.exists():
+            self._store(path, lambda tmp: optClimLib.cowCopy(src, tmp, link=False))
+        return digest
+
+    def place(self, src, dst, symlink=False):
+        """
+        Store a dump and put it at dst.
+        :param src: path to dump.
+        :param dst: where the dump is wanted. Anything already there is removed.
+        :param symlink (default False): If True dst is a symbolic link to the stored dump otherwise it is
+            a clone or hard link (or, if neither work, a copy) of it.
+        :return: how dst was made -- 'symlink', 'reflink', 'link' or 'copy'.
+        """
+        path = self.objectPath(self.add(src))
+        dst = pathlib.Path(dst)
+        if dst.is_symlink() or dst.exists():
+            dst.unlink()
+        if symlink:
+            os.symlink(path.resolve(), dst)
+            return 'symlink'
+        return optClimLib.cowCopy(path, dst, link=True)
@@ -7,21 +7,26 @@ Class to support HadCM3 in optimisation (and other approaches) work.
 """
 # TODO use pathlib.
 
-import fileinput
+import collections
 # TODO -- now have version 1.0X of f90nml may not need to patch here.
 import functools  # std functools.
 import glob
+import hashlib
 import math
 import os 
 import re
 import shutil
+import tempfile
+import threading
 import pathlib
 import datetime # needed to parse strings
 import f90nml
 # NEEDED because f90nml.patch (as used in ModelSimulation) fails with RECONA. For the moment dealing with this here.
 import numpy as np
 import stat # needed to change file permission bits.
+import DumpStore
 import ModelSimulation
+import optClimLib
 from ModelSimulation import _namedTupClass
 
 # functions to generate parameter values given meta-parameters.
@@ -71,26 +76,32 @@ def IDLinterpol(inyold, inxold, xnew):
     :return: interpolated values
     """
 
+    return IDLinterpolArray(inyold, inxold, xnew)[()]
+
+
+def IDLinterpolArray(inyold, inxold, xnew):
+    """
+    Vectorised version of IDLinterpol -- piecewise linear interpolation.
+    :param inyold: 3 element tupple of y values
+    :param inxold: 3 element tupple of x values
+    :param xnew:  x values (array or scalar) for interpolation
+    :return: interpolated values (same shape as xnew)
+    """
+
     assert len(inyold) == 3, "IDLinterpol has yold len of %d" % (len(inyold))
     assert len(inxold) == 3, "IDLinterpol has yold len of %d" % (len(inxold))
-    from numpy import zeros
-
-    yold = zeros(4)
-    xold = zeros(4)
-    yold[1:] = inyold
-    xold[1:] = inxold
-
-    if xnew < xold[1]:
-        raise NameError("xnew outside function range %f, min was %f" % (xnew, xold[1]))
-    elif xnew <= xold[2]:
-        ynew = (yold[1] - (((yold[2] - yold[1]) / (xold[2] - xold[1])) * xold[1])) + (
-                (yold[2] - yold[1]) / (xold[2] - xold[1])) * xnew
-    elif (xnew <= xold[3]):
-        ynew = (yold[2] - (((yold[3] - yold[2]) / (xold[3] - xold[2])) * xold[2])) + (
-                (yold[3] - yold[2]) / (xold[3] - xold[2])) * xnew
-    else:
-        raise NameError("xnew outside function range %f, max was %f" % (xnew, xold[3]))
-    return ynew
+    yold = np.asarray(inyold, dtype=float)
+    xold = np.asarray(inxold, dtype=float)
+    xnew = np.asarray(xnew)
+
+    if np.any(xnew < xold[0]):
+        raise NameError("xnew outside function range %f, min was %f" % (np.min(xnew), xold[0]))
+    elif np.any(~(xnew <= xold[2])):  # catches NaN too.
+        raise NameError("xnew outside function range %f, max was %f" % (np.max(xnew), xold[2]))
+    slope = (yold[1:] - yold[:-1]) / (xold[1:] - xold[:-1])  # slope of the two line segments
+    intercept = yold[:-1] - slope * xold[:-1]
+    segment = np.where(xnew <= xold[1], 0, 1)
+    return intercept[segment] + slope[segment] * xnew
 
 
 # functions below are used to convert meta parameters to namelist variables.
@@ -106,35 +117,63 @@ def diff_fn(dyndiff, dyndel=6, inverse=False):
     :return:
     """
 
+    return float(diffFnArray(dyndiff, dyndel=dyndel, inverse=inverse))
+
+
+# math.exp & math.log applied element by element. np.exp & np.log can differ from them in the last bit so using them
+# would change the values written to namelists.
+_mathExp = np.frompyfunc(math.exp, 1, 1)
+_mathLog = np.frompyfunc(math.log, 1, 1)
+
+
+def diffFnArray(dyndiff, dyndel=6, inverse=False):
+    """
+    Vectorised version of diff_fn.
+    :param dyndiff: diffusion values (array or scalar)
+    :param dyndel: order of diffusion. 6 is default corresponding to 3rd order.
+    :param inverse (default False) If True return inverse calculation.
+    :return: array (same shape as dyndiff)
+    """
+
     assert dyndel == 6 or dyndel == 4, "invalid dyndel %d" % dyndel
     DPHI = dlat * Pi / 180.
     D2Q = 0.25 * (RADIUS * RADIUS) * (DPHI * DPHI)
+    dyndiff = np.asarray(dyndiff, dtype=float)
     if inverse:
         diff_time = (dyndiff / D2Q) ** (dyndel / 2) * timestep
-        diff_time = -1 / math.log(1 - diff_time)
+        diff_time = -1 / np.asarray(_mathLog(1 - diff_time), dtype=float)
         diff_time = diff_time * timestep / 3600.0
         return diff_time
     else:
         dampn = dyndiff * 3600. / timestep
-        EN = 1 - math.exp(-1. / dampn)
+        EN = 1 - np.asarray(_mathExp(-1. / dampn), dtype=float)
         ENDT = EN / timestep
         return D2Q * ENDT ** (1.0 / int(dyndel / 2))
 
 
 def metaDIFFS(dyndiff=12., dyndel=6):
+    return metaDIFFSArray(dyndiff, dyndel)
+
+
+def metaDIFFSArray(dyndiff=12., dyndel=6):
+    """
+    Vectorised version of metaDIFFS.
+    :param dyndiff: diffusion values (array or scalar)
+    :param dyndel: order of diffusion. 6 is default corresponding to 3rd order.
+    :return: DIFF_COEFF, DIFF_COEFF_Q, DIFF_EXP & DIFF_EXP_Q arrays. Shape is shape of dyndiff + (NLEV,)
+    """
     assert dyndel == 6 or dyndel == 4, "metaDIFFS: invalid dyndel %d" % dyndel
-    val = diff_fn(dyndiff, dyndel)
+    val = diffFnArray(dyndiff, dyndel)
     tmp1 = dyndel / 2  # integral
-    DIFF_COEFF = np.repeat(val, NLEV)
-    DIFF_COEFF[-1] = 4e06
-    DIFF_COEFF_Q = np.repeat(val, NLEV)
-    DIFF_COEFF_Q[-1] = 4e06
-    DIFF_EXP = np.repeat(tmp1, NLEV)
-    DIFF_EXP[-1] = 1
-    DIFF_EXP_Q = np.repeat(tmp1, NLEV)
-    DIFF_EXP_Q[-1] = 1
-    DIFF_COEFF_Q[13:NLEV - 1] = 1.5e08
-    DIFF_EXP_Q[13:NLEV - 1] = 2
+    shape = val.shape + (NLEV,)
+    DIFF_COEFF = np.repeat(val[..., np.newaxis], NLEV, axis=-1)
+    DIFF_COEFF[..., -1] = 4e06
+    DIFF_COEFF_Q = DIFF_COEFF.copy()
+    DIFF_EXP = np.full(shape, tmp1)
+    DIFF_EXP[..., -1] = 1
+    DIFF_EXP_Q = DIFF_EXP.copy()
+    DIFF_COEFF_Q[..., 13:NLEV - 1] = 1.5e08
+    DIFF_EXP_Q[..., 13:NLEV - 1] = 2
     # R gives 7 sig figs, which is managed at the writing to file of these
     # lists.
     return DIFF_COEFF, DIFF_COEFF_Q, DIFF_EXP, DIFF_EXP_Q
@@ -203,6 +242,18 @@ def initHist_nlcfiles(value='NoSuchFile.txt', inverse=False, namelist=False, par
         return {nl: st}
 
 
+def initHistFn(parameter):
+    """
+    Generate meta function for one of the INITHIS files.
+    Uses functools.partial to make initHist_nlcfiles (which has the parameter as an argument) a function of value.
+    :param parameter: name of the parameter (AINITIAL, OINITIAL, ASTART or OSTART)
+    :return: function suitable for registering as a meta function.
+    """
+    fn = functools.partial(initHist_nlcfiles, parameter=parameter)
+    fn.__name__ = parameter.lower() + '_initHist_nlcfiles'
+    return fn
+
+
 def startTime(time_input=[1965, 7, 4], inverse=False, namelist=False):
 
     """
@@ -368,12 +419,23 @@ def gravityWave(kay=2e4, inverse=False, namelist=False):
     elif inverse:
         return kay[gwave]  # extract kay from the info.
     else:  # from MIke's code (in turn from R code)
-        gwd_pt = [1e04, 1.5e04, 2e04]
-        lee_pt = [1.5e05, 2.25e05, 3e05]
-        lee = IDLinterpol(lee_pt, gwd_pt, kay)
+        lee = gravityWaveArray(kay)[lee_gwave][()]
         return {gwave: kay, lee_gwave: lee}
 
 
+def gravityWaveArray(kay):
+    """
+    Vectorised version of gravityWave.
+    :param kay: values of kay (array or scalar)
+    :return: dict containing kay_gwave and kay_lee_gwave arrays.
+    """
+    gwave, lee_gwave = gravityWave(namelist=True)
+    gwd_pt = [1e04, 1.5e04, 2e04]
+    lee_pt = [1.5e05, 2.25e05, 3e05]
+    kay = np.asarray(kay, dtype=float)
+    return {gwave: kay, lee_gwave: IDLinterpolArray(lee_pt, gwd_pt, kay)}
+
+
 def iceAlbedo(alpham=0.5, inverse=False, namelist=False):
     """
     Compute ice albedo values given alpham
@@ -390,12 +452,24 @@ def iceAlbedo(alpham=0.5, inverse=False, namelist=False):
     elif inverse:
         return alpham[alpham_nl]
     else:
-        mins = [0.5, 0.57, 0.65]  # alpham values
-        maxs = [10., 5., 2.]  # corresponding dtice values
-        dtice = IDLinterpol(maxs, mins, alpham)  # from Mike's code.
+        dtice = iceAlbedoArray(alpham)[dtice_nl][()]
         return {dtice_nl: dtice, alpham_nl: alpham}
 
 
+def iceAlbedoArray(alpham):
+    """
+    Vectorised version of iceAlbedo.
+    :param alpham: values of alpham (array or scalar)
+    :return: dict containing alpham and dtice arrays.
+    """
+    alpham_nl, dtice_nl = iceAlbedo(namelist=True)
+    mins = [0.5, 0.57, 0.65]  # alpham values
+    maxs = [10., 5., 2.]  # corresponding dtice values
+    alpham = np.asarray(alpham, dtype=float)
+    dtice = IDLinterpolArray(maxs, mins, alpham)  # from Mike's code.
+    return {dtice_nl: dtice, alpham_nl: alpham}
+
+
 def cloudWater(cw_land=2e-4, inverse=False, namelist=False):
     """
     Compute cw_sea from  cw_land
@@ -410,12 +484,23 @@ def cloudWater(cw_land=2e-4, inverse=False, namelist=False):
     elif inverse:
         return cw_land[cw_land_nl]
     else:
-        cwl = [1e-04, 2e-04, 2e-03]
-        cws = [2e-05, 5e-05, 5e-04]
-        cw_sea = IDLinterpol(cws, cwl, cw_land)
+        cw_sea = cloudWaterArray(cw_land)[cw_sea_nl][()]
         return {cw_land_nl: cw_land, cw_sea_nl: cw_sea}
 
 
+def cloudWaterArray(cw_land):
+    """
+    Vectorised version of cloudWater.
+    :param cw_land: values of cw_land (array or scalar)
+    :return: dict containing cloud_cw_land and cloud_cw_sea arrays.
+    """
+    cw_land_nl, cw_sea_nl = cloudWater(namelist=True)
+    cwl = [1e-04, 2e-04, 2e-03]
+    cws = [2e-05, 5e-05, 5e-04]
+    cw_land = np.asarray(cw_land, dtype=float)
+    return {cw_land_nl: cw_land, cw_sea_nl: IDLinterpolArray(cws, cwl, cw_land)}
+
+
 def cloudRHcrit(rhcrit=0.7, inverse=False, namelist=False):
     """
     Compute rhcrit on multiple model levels
@@ -433,13 +518,23 @@ def cloudRHcrit(rhcrit=0.7, inverse=False, namelist=False):
     elif inverse:
         return rhcrit[rhcrit_nl][3]
     else:
-        cloud_rh_crit = 19 * [rhcrit]
-        cloud_rh_crit[0] = max(0.95, rhcrit)
-        cloud_rh_crit[1] = max(0.9, rhcrit)
-        cloud_rh_crit[2] = max(0.85, rhcrit)
+        cloud_rh_crit = cloudRHcritArray(rhcrit)[rhcrit_nl].tolist()
         return {rhcrit_nl: cloud_rh_crit}
 
 
+def cloudRHcritArray(rhcrit):
+    """
+    Vectorised version of cloudRHcrit.
+    :param rhcrit: values of meta parameter for rhcrit (array or scalar)
+    :return: dict with rh_crit array. Shape is shape of rhcrit + (NLEV,)
+    """
+    rhcrit_nl = list(cloudRHcrit(namelist=True))[0]
+    rhcrit = np.asarray(rhcrit, dtype=float)[..., np.newaxis]
+    cloud_rh_crit = np.repeat(rhcrit, NLEV, axis=-1)
+    cloud_rh_crit[..., 0:3] = np.maximum([0.95, 0.9, 0.85], rhcrit)
+    return {rhcrit_nl: cloud_rh_crit}
+
+
 def cloudEACF(eacf=0.5, inverse=False, namelist=False):
     """
     Compute array of eacf values for each model level. If inverse set work out what meta-parameter is from array.
@@ -455,18 +550,29 @@ def cloudEACF(eacf=0.5, inverse=False, namelist=False):
     elif inverse:
         return eacf[eacf_nl][0]
     else:
-        assert eacf >= 0.5, "eacf seed must be ge 0.5, according to R code but it is %f\n" % eacf
-        eacfbl = [0.5, 0.7, 0.8]
-        eacftrp = [0.5, 0.6, 0.65]
-        five = 5 * [eacf]
-        eacf1 = IDLinterpol(eacftrp, eacfbl, eacf)
-        cloud_eacf = 19 * [eacf1]
-        cloud_eacf[0:5] = five
-        cloud_eacf[5] = (2. * eacf + eacf1) / 3.
-        cloud_eacf[6] = (eacf + 2. * eacf1) / 3.
+        cloud_eacf = cloudEACFArray(eacf)[eacf_nl].tolist()
         return {eacf_nl: cloud_eacf}
 
 
+def cloudEACFArray(eacf):
+    """
+    Vectorised version of cloudEACF.
+    :param eacf: meta-parameter values for eacf (array or scalar)
+    :return: dict with eacf array. Shape is shape of eacf + (NLEV,)
+    """
+    eacf_nl = cloudEACF(namelist=True)[0]
+    eacf = np.asarray(eacf, dtype=float)
+    assert np.all(eacf >= 0.5), "eacf seed must be ge 0.5, according to R code but it is %f\n" % np.min(eacf)
+    eacfbl = [0.5, 0.7, 0.8]
+    eacftrp = [0.5, 0.6, 0.65]
+    eacf1 = np.asarray(IDLinterpolArray(eacftrp, eacfbl, eacf))
+    cloud_eacf = np.repeat(eacf1[..., np.newaxis], NLEV, axis=-1)
+    cloud_eacf[..., 0:5] = eacf[..., np.newaxis]
+    cloud_eacf[..., 5] = (2. * eacf + eacf1) / 3.
+    cloud_eacf[..., 6] = (eacf + 2. * eacf1) / 3.
+    return {eacf_nl: cloud_eacf}
+
+
 def diffusion(diff_time=12.0, namelist=False, inverse=False):
     """
     Compute arrays of diffusion co-efficients for all   levels.
@@ -491,10 +597,21 @@ def diffusion(diff_time=12.0, namelist=False, inverse=False):
         diff_time_hrs = diff_fn(diff_time[diff_coeff_nl][0], dyndel=powerDiff, inverse=inverse)
         return diff_time_hrs
     else:
-        diff_coeff, diff_coeff_q, diff_exp, diff_exp_q = \
-            metaDIFFS(dyndiff=diff_time, dyndel=diff_pwr)
-        return {diff_coeff_nl: diff_coeff, diff_coeff_q_nl: diff_coeff_q, diff_exp_nl: diff_exp,
-                diff_exp_q_nl: diff_exp_q}
+        return diffusionArray(diff_time)
+
+
+def diffusionArray(diff_time):
+    """
+    Vectorised version of diffusion.
+    :param diff_time: times in hours for diffusion (array or scalar)
+    :return: dict of diff_coeff, diff_coeff_q, diff_power & diff_power_q arrays.
+        Shape is shape of diff_time + (NLEV,)
+    """
+    diff_coeff_nl, diff_coeff_q_nl, diff_exp_nl, diff_exp_q_nl = diffusion(namelist=True)
+    diff_coeff, diff_coeff_q, diff_exp, diff_exp_q = \
+        metaDIFFSArray(dyndiff=diff_time, dyndel=diff_pwr)
+    return {diff_coeff_nl: diff_coeff, diff_coeff_q_nl: diff_coeff_q, diff_exp_nl: diff_exp,
+            diff_exp_q_nl: diff_exp_q}
 
 
 def iceDiff(OcnIceDiff=2.5e-5, namelist=False, inverse=False):
@@ -517,6 +634,16 @@ def iceDiff(OcnIceDiff=2.5e-5, namelist=False, inverse=False):
         return {iceDiff_nlNH: OcnIceDiff, iceDiff_nlSH: OcnIceDiff}
 
 
+def iceDiffArray(OcnIceDiff):
+    """
+    Vectorised version of iceDiff.
+    :param OcnIceDiff: Values wanted for ocean ice diffusion coefficient (array or scalar)
+    :return: dict of arrays for NH and SH ocean ice diffusion.
+    """
+    OcnIceDiff = np.asarray(OcnIceDiff, dtype=float)
+    return {nl: OcnIceDiff for nl in iceDiff(namelist=True)}
+
+
 def iceMaxConc(iceMaxConc=0.995, namelist=False, inverse=False):
     """
     Generate namelist for NH and SH ocean ice maximum concentration
@@ -538,6 +665,17 @@ def iceMaxConc(iceMaxConc=0.995, namelist=False, inverse=False):
         return {iceMax_nlNH: iceMaxConc, iceMax_nlSH: min(0.98, iceMaxConc)}
 
 
+def iceMaxConcArray(maxConc):
+    """
+    Vectorised version of iceMaxConc.
+    :param maxConc: Values wanted for ocean max concentration (array or scalar)
+    :return: dict of arrays for NH and SH maximum concentration.
+    """
+    iceMax_nlNH, iceMax_nlSH = iceMaxConc(namelist=True)
+    maxConc = np.asarray(maxConc, dtype=float)
+    return {iceMax_nlNH: maxConc, iceMax_nlSH: np.minimum(0.98, maxConc)}
+
+
 def ocnIsoDiff(ocnIsoDiff=1e3, namelist=False, inverse=False):
     """
     Generate namelist for changes to Ocean isopynical diffusion.
@@ -557,6 +695,23 @@ def ocnIsoDiff(ocnIsoDiff=1e3, namelist=False, inverse=False):
     else:  # set values -- both  to same value
         return {ocnDiff_AM0: ocnIsoDiff, ocnDiff_AM1: ocnIsoDiff}
 
+
+def ocnIsoDiffArray(isoDiff):
+    """
+    Vectorised version of ocnIsoDiff.
+    :param isoDiff: Values for ocean isopynical diffusion (array or scalar)
+    :return: dict of arrays for AM0_SI & AM1_SI
+    """
+    isoDiff = np.asarray(isoDiff, dtype=float)
+    return {nl: isoDiff for nl in ocnIsoDiff(namelist=True)}
+
+
+# vectorised meta functions indexed by parameter name. See nameListArrays.
+metaFnArrays = {'KAY_GWAVE': gravityWaveArray, 'ALPHAM': iceAlbedoArray, 'CW_LAND': cloudWaterArray,
+                'RHCRIT': cloudRHcritArray, 'EACF': cloudEACFArray, 'DYNDIFF': diffusionArray,
+                'OcnIceDiff': iceDiffArray, 'IceMaxConc': iceMaxConcArray, 'OcnIsoDiff': ocnIsoDiffArray}
+
+
 def parse_isoduration(s):
     """ Parse a str ISO-8601 Duration: https://en.wikipedia.org/wiki/ISO_8601#Durations
     Originally copied from:
@@ -596,14 +751,195 @@ def parse_isoduration(s):
 
     return durn
 
+scriptRule = collections.namedtuple('scriptRule', ('name', 'pattern', 'maxLineNo'))  # See ScriptTemplate.
+scriptRule.__new__.__defaults__ = (None,)  # by default rules apply to all lines.
+
+_scriptTemplates = collections.OrderedDict()  # (sha256 of text, rules) -> ScriptTemplate. See ScriptTemplate.get.
+_scriptTemplatesSize = 100  # maximum number of templates held in _scriptTemplates.
+_scriptTemplatesLock = threading.Lock()
+
+
+class ScriptTemplate(object):
+    """
+    A text file (e.g. SCRIPT or SUBMIT) compiled into its lines and the rules each line matches. Rendering
+      applies to each line the first matching rule that has an action and gives the text of the new file which
+      can be written in one go. Templates are cached (keyed by the text and the rules) so each reference file
+      is only compiled once per process. (See ScriptTemplate.get)
+    Example use:
+        rules = (scriptRule('jobid', '^JOBID='),)
+        template = ScriptTemplate.get(text, rules)
+        text = template.render(jobid=lambda line: 'JOBID=a ## modified')
+    """
+
+    def __init__(self, text, rules):
+        """
+        Compile text.
+        :param text: text of the file
+        :param rules: sequence of scriptRule in priority order. A rule matches a line (without its newline)
+            if re.search finds its pattern in the line and (if maxLineNo is not None) the line number
+            (starting from 1) is less than maxLineNo.
+        """
+        self.lines = text.split('\n')
+        if self.lines[-1] == '':  # text ends with a newline
+            self.lines.pop()
+        patterns = [(rule.name, re.compile(rule.pattern), rule.maxLineNo) for rule in rules]
+        self.matches = dict()  # line index -> names of rules that match.
+        for indx, line in enumerate(self.lines):
+            names = tuple(name for name, pattern, maxLineNo in patterns
+                          if (maxLineNo is None or indx + 1 < maxLineNo) and pattern.search(line))
+            if names:
+                self.matches[indx] = names
+
+    @classmethod
+    def get(cls, text, rules):
+        """
+        Get the (cached) template for text and rules.
+        :param text: text of the file
+        :param rules: tuple of scriptRule.
+        :return: ScriptTemplate
+        """
+        key = (hashlib.sha256(text.encode()).hexdigest(), tuple(rules))
+        with _scriptTemplatesLock:
+            template = _scriptTemplates.get(key)
+            if template is not None:
+                _scriptTemplates.move_to_end(key)
+                return template
+        template = cls(text, rules)
+        with _scriptTemplatesLock:
+            _scriptTemplates[key] = template
+            _scriptTemplates.move_to_end(key)
+            while len(_scriptTemplates) > _scriptTemplatesSize:
+                _scriptTemplates.popitem(last=False)
+        return template
+
+    def render(self, **actions):
+        """
+        Render the template.
+        :param actions: functions, indexed by rule name, that take a line (without its newline) and return
+            what replaces it. Rules with no action (or None) are ignored.
+        :return: the rendered text.
+        """
+        lines = list(self.lines)
+        for indx, names in self.matches.items():
+            for name in names:
+                action = actions.get(name)
+                if action is not None:
+                    lines[indx] = action(lines[indx])
+                    break
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def rewrite(path, rules, **actions):
+        """
+        Rewrite a file in one pass. The file is replaced (keeping its permissions) -- no backup is made.
+        :param path: path to the file
+        :param rules: tuple of scriptRule.
+        :param actions: functions, indexed by rule name, passed to render.
+        :return: nothing
+        """
+        path = pathlib.Path(path)
+        text = ScriptTemplate.get(path.read_text(), rules).render(**actions)
+        writeText(path, text, mode=stat.S_IMODE(path.stat().st_mode))
+
+
+def writeText(path, text, mode=None):
+    """
+    Write text to a file through a temporary file so the file is replaced in one go.
+    :param path: path to the file
+    :param text: text to write
+    :param mode (default None): permissions for the file. If None the temporary file's are kept.
+    :return: nothing
+    """
+    path = pathlib.Path(path)
+    with tempfile.NamedTemporaryFile(dir=path.parent, delete=False, mode='w') as tmp:
+        tmp.write(text)
+    try:
+        if mode is not None:
+            os.chmod(tmp.name, mode)
+        os.replace(tmp.name, path)
+    finally:
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+
+
 class HadCM3(ModelSimulation.ModelSimulation):
     """
     HadCM3 class. Sub-class of ModelSimulation.
     It overrides createModelSimulation & setParams.
     It also handles cases where the simulation runs in multiple jobs. The post-processing will be submitted once the
       job has finished. That took some quite hacky UM  engineering...
-
+    Files from the reference directory are cloned or hard linked (see ModelSimulation.createMode) apart from
+      copyFiles -- the scripts, namelists and logs that get changed.
     """
+    createMode = 'link'
+    copyFiles = ('SCRIPT', 'SUBMIT*', 'CNTL*', 'CONTCNTL', 'INITHIS', 'RECONA', 'optclim_finished', '*LOG*')
+    nameListBackup = False  # reference directory has the original namelists.
+    # start dumps are held in a content-addressed store (see DumpStore) in this directory (relative to the study
+    # directory -- make it absolute to share it between studies). If None dumps get copied (see createMode).
+    # Hidden so ModelSubmit does not take it for a model simulation.
+    dumpStoreDir = '.dumpStore'
+    dumpSymlink = False  # If True work directories get symbolic links to stored dumps rather than clones or links.
+    # lines changed by modifyScript, modifySubmit, genContSUBMIT & fixClimFCG. See ScriptTemplate.
+    scriptRules = (scriptRule('modified', '## modified'),
+                   scriptRule('exptid', '^EXPTID='),
+                   scriptRule('jobid', '^JOBID='),
+                   scriptRule('message', '^MESSAGE="Run .* finished. Time=`date`"'),
+                   scriptRule('datadir', '^MY_DATADIR='),
+                   scriptRule('submitchk', '^. submitchk$'),
+                   scriptRule('datadirRunid', r'DATADIR/\$RUNID/'))
+    submitRules = (scriptRule('modified', '## modified'),
+                   scriptRule('runid', '^export RUNID=', 75),
+                   scriptRule('datadir', '^MY_DATADIR=', 75),
+                   scriptRule('datadirRunid', r'DATADIR/\$RUNID/'),
+                   scriptRule('jobdir', '^JOBDIR=', 75),
+                   scriptRule('cjobn', '^CJOBN=', 75),
+                   scriptRule('runTime', '^[NC]RUN_TIME_LIMIT='),
+                   scriptRule('account', '^ACCOUNT='))
+    contSubmitRules = (scriptRule('nrun', '^TYPE=NRUN'),
+                       scriptRule('step1', '^STEP=1'))
+    climFCGRules = (scriptRule('climFCG', r'CLIM_FCG_.*\(1,'),)
+    # Namelist mappings -- built once for the class and shared by all instances. See ModelSimulation.classNameLists.
+    # TODO add documentation to parameters and have way of model instance reporting on known params.
+    # easy case all variables in SLBC21 (in CNTLATM) and which just set the values.
+    simpleNameLists = tuple((var, var.upper(), 'SLBC21', 'CNTLATM') for var in [
+        'VF1', 'ICE_SIZE', 'ENTCOEF', 'CT', 'ASYM_LAMBDA', 'CHARNOCK', 'G0', 'Z0FSEA',  # atmos stuff
+        'N_DROP_MIN', 'IA_AERO_POWER', 'IA_AERO_SCALE',  # indirect aerosol stuff
+        # model here is n_drop = IA_AERO_SCALE*(1-exp(IA_AERO_POWER*N_AERO)) where N_AERO is no of aerosol drops and n_drop is no of cld drolets.
+        # default values are 'N_DROP_MIN': 3.5E7, 'IA_AERO_POWER': -2.5e-9, 'IA_AERO_SCALE': 3.75E8
+        'CLOUDTAU', 'NUM_STAR', 'L0', 'L1', 'OHSCA', 'VOLSCA', 'ANTHSCA', 'RAD_AIT', 'RAD_ACC'
+        # sulphate params.  CLOUDTAU (1.08E4)  air parcel lifetime in cloud, NUM_STAR (1.0E6) threshold concn of accu mode particles
+        # L0=6.5E-5, Scavenging parameter when S < S_threshold
+        # L1=2.955E-5, Scavenging parameter when S > S_threshold
+        # OHSCA=1.0, -- scaling parameter for the OH field.
+        # VOLSCA=1.0, -- scaling parameter for volcanic SO2 emissions
+        # ANTHSCA=1.0, -- scaling parameter for anthropogenic emissions
+        # RAD_AIT -- radius of aitkin mode droplets -- 24e-9
+        # RAD_ACC -- radius of accum mode doplets -- 95E-9
+    ])
+    # ensembleMember has no code to do anything with...
+    # current reconfig code pertubs based on runid anyhow.
+    # TODO add functionality to UM to deal with ensembleMember
+
+    # Hard case ones where we have a function to run or perturb multiple variables are more complex.
+    # for meta-parameter we register function. Functions should return dict indexed by namelist info.
+    metaFunctions = (
+        ('RUNID', runName),  # runid
+        ('KAY_GWAVE', gravityWave),  # gravity wave
+        ('ALPHAM', iceAlbedo),  # ice albedo
+        ('CW_LAND', cloudWater),  # CW_LAND
+        ('RHCRIT', cloudRHcrit),  # RHCRIT meta-param generates array
+        ('EACF', cloudEACF),  # EACF meta-param generates array
+        ('DYNDIFF', diffusion),  # Dynamics Diffusion generates lots of arrays
+        ('RUN_TARGET', runTarget),  # length of simulation -- modifies several namelist vars
+        ('RESUBMIT_INTERVAL', resubInterval),  # resubmission interval -- modifies several namelist vars
+        ('START_TIME', startTime),  # start_Time for run -- modifies several namelist vars
+        ("SPHERICAL_ICE", sph_ice),  # Spherical ice (or not)
+        ("OcnIceDiff", iceDiff),  # Ocean-Ice heat diffusion.
+        ("IceMaxConc", iceMaxConc),  # Maximum ice concentration.
+        ("OcnIsoDiff", ocnIsoDiff),  # Maximum ice concentration.
+    ) + tuple((var, initHistFn(var))  # add AINITIAL, OINITIAL, ASTART & OSTART in inithist
+              for var in ['AINITIAL', 'OINITIAL', 'ASTART', 'OSTART'])
+
 
     def __init__(self, dirPath, obsNames=None,
                  create=False, refDirPath=None, name=None, ppExePath=None,
@@ -666,61 +1002,11 @@ class HadCM3(ModelSimulation.ModelSimulation):
             # this means that the model can run without post-processing
             # as this bit of code also allows the model to resubmit from an NRUN
 
-        ## Set up namelist mappings. #TODO add documentation to parameters and have way of model instance reporting on known params.
-        # easy case all variables in SLBC21 and which just set the values.
-        for var in ['VF1', 'ICE_SIZE', 'ENTCOEF', 'CT', 'ASYM_LAMBDA', 'CHARNOCK', 'G0', 'Z0FSEA',  # atmos stuff
-                    'N_DROP_MIN', 'IA_AERO_POWER', 'IA_AERO_SCALE',  # indirect aerosol stuff
-                    # model here is n_drop = IA_AERO_SCALE*(1-exp(IA_AERO_POWER*N_AERO)) where N_AERO is no of aerosol drops and n_drop is no of cld drolets.
-                    # default values are 'N_DROP_MIN': 3.5E7, 'IA_AERO_POWER': -2.5e-9, 'IA_AERO_SCALE': 3.75E8
-                    'CLOUDTAU', 'NUM_STAR', 'L0', 'L1', 'OHSCA', 'VOLSCA', 'ANTHSCA', 'RAD_AIT', 'RAD_ACC'
-                    # sulphate params.  CLOUDTAU (1.08E4)  air parcel lifetime in cloud, NUM_STAR (1.0E6) threshold concn of accu mode particles
-                    # L0=6.5E-5, Scavenging parameter when S < S_threshold
-                    # L1=2.955E-5, Scavenging parameter when S > S_threshold
-                    # OHSCA=1.0, -- scaling parameter for the OH field.
-                    # VOLSCA=1.0, -- scaling parameter for volcanic SO2 emissions
-                    # ANTHSCA=1.0, -- scaling parameter for anthropogenic emissions
-                    # RAD_AIT -- radius of aitkin mode droplets -- 24e-9
-                    # RAD_ACC -- radius of accum mode doplets -- 95E-9
-                    ]:
-            self.simpleNamelist(var)
-            # ensembleMember has no code to do anything with...
-            # current reconfig code pertubs based on runid anyhow.
-            # TODO add functionality to UM to deal with ensembleMember
-
-        # Hard case ones where we have a function to run or perturb multiple variables are more complex.
-        # for meta-parameter we register function. Functions should return dict indexed by namelist info.
-        # I think these should be class methods to save computing them every time we create a model.
-        # but overhead is likely small
-        # TODO: Convert MetaFn and Namelists to class methods.
-
-        self.registerMetaFn('RUNID', runName, verbose=verbose)  # runid
-        self.registerMetaFn('KAY_GWAVE', gravityWave, verbose=verbose)  # gravity wave
-        self.registerMetaFn('ALPHAM', iceAlbedo, verbose=verbose)  # ice albedo
-        self.registerMetaFn('CW_LAND', cloudWater, verbose=verbose)  # CW_LAND
-        self.registerMetaFn('RHCRIT', cloudRHcrit, verbose=verbose)  # RHCRIT meta-param generates array
-        self.registerMetaFn('EACF', cloudEACF, verbose=verbose)  # EACF meta-param generates array
-        self.registerMetaFn('DYNDIFF', diffusion, verbose=verbose)  # Dynamics Diffusion generates lots of arrays
-        self.registerMetaFn('RUN_TARGET', runTarget,
-                            verbose=verbose)  # length of simulation -- modifies several namelist vars
-        self.registerMetaFn('RESUBMIT_INTERVAL',resubInterval,verbose=verbose)
-        # resubmission interval -- modifies several namelist vars
-        self.registerMetaFn('START_TIME', startTime,
-                            verbose=verbose)  # start_Time for run -- modifies several namelist vars
-        self.registerMetaFn("SPHERICAL_ICE", sph_ice, verbose=verbose)  # Spherical ice (or not)
-        self.registerMetaFn("OcnIceDiff", iceDiff, verbose=verbose)  # Ocean-Ice heat diffusion.
-        self.registerMetaFn("IceMaxConc", iceMaxConc, verbose=verbose)  # Maximum ice concentration.
-        self.registerMetaFn("OcnIsoDiff", ocnIsoDiff, verbose=verbose)  # Maximum ice concentration.
-        # add AINITIAL, OINITIAL, ASTART & OSTART in inithist
-        for var in ['AINITIAL', 'OINITIAL', 'ASTART', 'OSTART']:  # need slightly special code for these variables.
-            # ideas is to use the same basic function which has as argument the parameter.
-            # Then use functools.partial to generate function which gets registered.
-            fn = functools.partial(initHist_nlcfiles, parameter=var)
-            fn.__name__ = var.lower() + '_initHist_nlcfiles'
-            self.registerMetaFn(var, fn, verbose=verbose)
         # got some parameters and either creating or updating -- update namelist.
         if len(parameters) > 0 and (create or update):
             self.setReadOnly(False)  # allow modification
-            self.setParams(parameters, verbose=verbose, fail=True)  # apply namelist etc
+            # when creating, the configuration already holds the parameters so only the namelists need changing.
+            self.setParams(parameters, verbose=verbose, fail=True, write=not create)  # apply namelist etc
             # TODO check if START_TIME special hack  is still needed.
             #
             if 'START_TIME' in parameters:
@@ -742,7 +1028,8 @@ class HadCM3(ModelSimulation.ModelSimulation):
 
     def createWorkDir(self, refDirPath, verbose=False):
         """
-        Create the workdir and if refDirPath has .astart & .ostart copy those into created workDir
+        Create the workdir and if refDirPath has .astart & .ostart put those into created workDir.
+        They come from the study dump store (see dumpStoreDir) so are stored once however many runs use them.
         :param refDirPath -- name of reference directory
         :param (optional) verbobse -- default False. If True be verbose.
         :return: nada
@@ -750,13 +1037,20 @@ class HadCM3(ModelSimulation.ModelSimulation):
 
         workDir = os.path.join(self.dirPath, 'W')
         if not os.path.isdir(workDir): os.makedirs(workDir)  # create the directory
+        store = None
+        if self.dumpStoreDir is not None:
+            store = DumpStore.DumpStore(pathlib.Path(self.dirPath).parent / self.dumpStoreDir)
         for f in ['*.astart', '*.ostart']:  # possible start files
             p = glob.glob(os.path.join(refDirPath, f))  # glob them
             if p is not None and len(p) == 1:  # got one
                 p = p[0]  # copy it.
                 try:
-                    shutil.copy(p, workDir)
-                    if verbose: print("Copied %s to %s" % (p, workDir))
+                    dst = os.path.join(workDir, os.path.basename(p))
+                    if store is not None:
+                        how = store.place(p, dst, symlink=self.dumpSymlink)
+                    else:
+                        how = optClimLib.cowCopy(p, dst, link=(self.createMode == 'link'))  # start dumps only read.
+                    if verbose: print("Copied (%s) %s to %s" % (how, p, workDir))
                 except IOError:
                     pass
 
@@ -780,26 +1074,21 @@ class HadCM3(ModelSimulation.ModelSimulation):
         experID = runid[0:4]
         jobID = runid[4]
         modifystr = '## modified'
-        with fileinput.input(os.path.join(self.dirPath, 'SCRIPT'), inplace=1, backup='.bak') as f:
-            for line in f:
-                if re.search(modifystr, line):
-                    raise Exception("Already modified Script")
-                elif re.match('^EXPTID=', line):
-                    print("EXPTID=%s %s" % (experID, modifystr))
-                elif re.match('^JOBID=', line):
-                    print("JOBID=%s %s" % (jobID, modifystr))
-                elif re.match('MESSAGE="Run .* finished. Time=`date`"', line):
-                    print('MESSAGE="Run %s#%s finished. Time=`date`"' % (experID, jobID))
-                elif re.match('MY_DATADIR=', line):  # fix MY_DATADIR
-                    print("MY_DATADIR=%s %s" % (self.dirPath, modifystr))
-                elif re.match('^. submitchk$', line):  # need to modify SCRIPT to call the postProcessFile.
-                    print(line[0:-1])  # print the line out stripping of the newline
-                    print(f'. $JOBDIR/{self.postProcessFile} {modifystr}')
-                elif r'DATADIR/$RUNID/' in line:  # replace all the DATADIR/$RUNID stuff.
-                    line = line.replace('DATADIR/$RUNID/', 'DATADIR/')
-                    print(line[0:-1], modifystr)
-                else:  # default line
-                    print(line[0:-1])  # remove newline
+
+        def modified(line):
+            raise Exception("Already modified Script")
+
+        ScriptTemplate.rewrite(
+            os.path.join(self.dirPath, 'SCRIPT'), self.scriptRules,
+            modified=modified,
+            exptid=lambda line: "EXPTID=%s %s" % (experID, modifystr),
+            jobid=lambda line: "JOBID=%s %s" % (jobID, modifystr),
+            message=lambda line: 'MESSAGE="Run %s#%s finished. Time=`date`"' % (experID, jobID),
+            datadir=lambda line: "MY_DATADIR=%s %s" % (self.dirPath, modifystr),  # fix MY_DATADIR
+            # need to modify SCRIPT to call the postProcessFile.
+            submitchk=lambda line: line + '\n' + f'. $JOBDIR/{self.postProcessFile} {modifystr}',
+            # replace all the DATADIR/$RUNID stuff.
+            datadirRunid=lambda line: line.replace('DATADIR/$RUNID/', 'DATADIR/') + ' ' + modifystr)
 
     def modifySubmit(self, runTime=None, runCode=None):
         """
@@ -818,35 +1107,30 @@ class HadCM3(ModelSimulation.ModelSimulation):
         # first work out runID
         runid = self.getParams().get('RUNID',
                                      self.name())  # TODO fix this so that if params passed a string it does sensible thing with it...
-        # modify submit
-        maxLineNo = 75  # maximum lines to modify
-        # modify SUBMIT
+        # modify SUBMIT. Changes to RUNID, MY_DATADIR, JOBDIR & CJOBN only made in the first lines (see submitRules).
         modifyStr = '## modified'
-        with fileinput.input(os.path.join(self.dirPath, 'SUBMIT'), inplace=1, backup='.bakR') as f:
-            for line in f:
-                # need to make these changes only once...
-                if re.search(modifyStr, line):
-                    raise Exception("Already modified SUBMIT")
-                elif re.match('export RUNID=', line) and f.filelineno() < maxLineNo:
-                    print("export RUNID=%s %s" % (runid, modifyStr))
-                elif re.match('MY_DATADIR=', line) and f.filelineno() < maxLineNo:
-                    print("MY_DATADIR=%s %s" % (self.dirPath, modifyStr))
-                # now find and replace all the DATADIR/$RUNID stuff.
-                elif r'DATADIR/$RUNID/' in line:
-                    line = line.replace('DATADIR/$RUNID/', 'DATADIR/')
-                    print(line[0:-1], modifyStr)
-                elif re.match('JOBDIR=', line) and f.filelineno() < maxLineNo:
-                    print("JOBDIR=%s %s" % (self.dirPath, modifyStr))
-                elif re.match('CJOBN=', line) and f.filelineno() < maxLineNo:
-                    print("CJOBN=%s %s" % (runid + '000', modifyStr))
-                elif (runTime is not None) and re.match('[NC]RUN_TIME_LIMIT=', line):  # got a time specified
-                    l2 = line.split('=')[0]  # split line at =
-                    print(l2 + '=%d ' % (runTime) + modifyStr)  # add on the time
-                elif (runCode is not None) and re.match('ACCOUNT=', line):  # got a project code specified
-                    l2 = line.split('=')[0]  # split line at =
-                    print(l2 + '=%s ' % (runCode) + modifyStr)  # add on the time
-                else:
-                    print(line[0:-1])  # remove trailing newline
+
+        def modified(line):
+            raise Exception("Already modified SUBMIT")
+
+        if runTime is not None:  # got a time specified
+            runTimeFn = lambda line: line.split('=')[0] + '=%d ' % (runTime) + modifyStr
+        else:
+            runTimeFn = None
+        if runCode is not None:  # got a project code specified
+            accountFn = lambda line: line.split('=')[0] + '=%s ' % (runCode) + modifyStr
+        else:
+            accountFn = None
+        ScriptTemplate.rewrite(
+            os.path.join(self.dirPath, 'SUBMIT'), self.submitRules,
+            modified=modified,
+            runid=lambda line: "export RUNID=%s %s" % (runid, modifyStr),
+            datadir=lambda line: "MY_DATADIR=%s %s" % (self.dirPath, modifyStr),
+            # now find and replace all the DATADIR/$RUNID stuff.
+            datadirRunid=lambda line: line.replace('DATADIR/$RUNID/', 'DATADIR/') + ' ' + modifyStr,
+            jobdir=lambda line: "JOBDIR=%s %s" % (self.dirPath, modifyStr),
+            cjobn=lambda line: "CJOBN=%s %s" % (runid + '000', modifyStr),
+            runTime=runTimeFn, account=accountFn)
 
     def simpleNamelist(self, var, nl='SLBC21', nlFile='CNTLATM'):
         """
@@ -861,14 +1145,11 @@ class HadCM3(ModelSimulation.ModelSimulation):
     def fixClimFCG(self):
         """
         Fix problems with the CLIM_FCG_* namelists so they can be parsed by f90nml. 
-        Generates CNTLATM.bak and modifies CNTLATM
+        Modifies CNTLATM (no backup is made).
         :return: None
         """
-        with fileinput.input(os.path.join(self.dirPath, 'CNTLATM'), inplace=1, backup='.bak') as f:
-            for line in f:
-                if re.search(r'CLIM_FCG_.*\(1,', line):
-                    line = line.replace('(1,', '(:,')  # replace the leading 1 with :
-                print(line[0:-1])  # remove trailing newline.
+        ScriptTemplate.rewrite(os.path.join(self.dirPath, 'CNTLATM'), self.climFCGRules,
+                               climFCG=lambda line: line.replace('(1,', '(:,'))  # replace the leading 1 with :
 
     #
 
@@ -913,17 +1194,11 @@ class HadCM3(ModelSimulation.ModelSimulation):
         # Copy self.SubmitFile to self.submit(=True) and then change it.
         modifyStr = '## modifiedContinue'
         contScript = self.submit('continue')
-        with fileinput.input(self.submit('start')) as f:  # file for input
-            with open(contScript, mode='w') as fout:  # and where the output file is.
-                for line in f:
-                    line = line[0:-1]  # remove trailing newline
-                    if re.match('^TYPE=NRUN', line):  # DEAL with NRUN
-                        line = line.replace('NRUN', 'CRUN', 1) + modifyStr
-                        print(line, file=fout)
-                    elif re.match('^STEP=1', line):  # Deal with STEP=1
-                        print(line.replace('STEP=1', 'STEP=4', 1) + modifyStr, file=fout)
-                    else:
-                        print(line, file=fout)
+        template = ScriptTemplate.get(self.submit('start').read_text(), self.contSubmitRules)
+        text = template.render(nrun=lambda line: line.replace('NRUN', 'CRUN', 1) + modifyStr,  # DEAL with NRUN
+                               step1=lambda line: line.replace('STEP=1', 'STEP=4', 1) + modifyStr)  # STEP=1
+        with open(contScript, mode='w') as fout:  # and where the output file is.
+            fout.write(text)
         # need to make the script +rx for all readers. Might not work on windows
         fstat = contScript.stat().st_mode
         fstat = fstat | stat.S_IRUSR|stat.S_IRGRP|stat.S_IROTH
@@ -954,6 +1229,7 @@ class HadCM3(ModelSimulation.ModelSimulation):
             has completed. This code also modifies the UM so that when a NRUN is fnished it automatically runs the continuation case.
             This HadCM3 implementation generates a file call optclim_finished which is sourced by SCRIPT.
             SCRIPT needs to be modified to actually do this. (See modifySCRIPT).
+            It also records (see runState) the simulation as POSTPROCESSING once finished or RUNNING if not.
 
         
 
@@ -961,6 +1237,8 @@ class HadCM3(ModelSimulation.ModelSimulation):
         import pathlib
         outFile = pathlib.Path(
             self.dirPath) / self.postProcessFile  # needs to be same as used in SCRIPT which actually calls it
+        stateFile = pathlib.Path(self.dirPath).parent / self.runStateFile
+        dirName = pathlib.Path(self.dirPath).name
         with open(outFile, 'w') as fp:
             print(
                 f"""#  script to be run in ksh from UM45 SCRIPT
@@ -973,12 +1251,15 @@ export OUTPUT=$TEMP/output_test_finished.$$ # where the output goes
 export RSUB=$TEMP/rsub1.$$
 qshistprint $PHIST $RSUB # get the status info from the history file
 FLAG=$(grep 'FLAG' $RSUB|cut -f2 -d"=" | sed 's/ *//'g)
+STATEFILE={stateFile} # study run state table. Only written to if it exists.
 if  [ $FLAG = 'N' ]
   then # release the post processing job. 
   {postProcessCmd} ## code inserted
   echo "FINISHED releasing the post-processing"
+  [ -f $STATEFILE ] && echo "{dirName} POSTPROCESSING $(date +%s)" >> $STATEFILE
 else 
      echo "$TYPE: Still got work to do"
+     [ -f $STATEFILE ] && echo "{dirName} RUNNING $(date +%s)" >> $STATEFILE
 fi
 
 # test for NRUN but not finished.
@@ -1001,3 +1282,25 @@ echo "==================================="
 rm -f $RSUB $OUTPUT # remove temp file.
                 """, file=fp)
             return outFile
+
+
+def nameListArrays(params):
+    """
+    Compute namelist values for many parameter sets at once -- e.g. for emulators or history matching.
+    :param params: dict (or DataFrame) of parameter values indexed by parameter name. Each value is an array with
+        one element per parameter set. Parameters must either be simple (see HadCM3.simpleNameLists) or have
+        a vectorised meta function (see metaFnArrays).
+    :return: OrderedDict of arrays indexed by namelist info. Arrays have one row per parameter set
+        and, for values on model levels, one column per level.
+    """
+    convNameList = HadCM3.classNameLists()[0]
+    result = collections.OrderedDict()
+    for param, values in params.items():
+        if param in metaFnArrays:
+            result.update(metaFnArrays[param](values))
+        elif param in convNameList:
+            for nl in convNameList[param]:
+                result[nl] = np.asarray(values, dtype=float)
+        else:
+            raise KeyError(f"No vectorised namelist conversion for {param}")
+    return result
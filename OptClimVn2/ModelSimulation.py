@@ -2,13 +2,18 @@
 Provide class and methods for ModelSimulation"
 """
 import collections
+import collections.abc
+import contextlib
 import copy
+import hashlib
+import io
 import json
 import os
 import pickle
 import shutil
 import stat
 import tempfile
+import threading
 import datetime
 import f90nml  # available from http://f90nml.readthedocs.io/en/latest/
 import netCDF4
@@ -17,9 +22,11 @@ import pandas as pd  # pandas
 import warnings  # so we can turn of warnings..
 import pathlib  # TODO slowly move to use this rather than os.path
 
+import ObsStore
 import optClimLib  # provide std routines
+import RunState
 
-__version__ = '0.2.0'
+__version__ = '0.7.0'
 # subversion properties
 subversionProperties = \
     {
@@ -32,6 +39,8 @@ subversionProperties = \
 
 # import stdRoutines # provide standard routines.
 
+_netCDFLock = threading.Lock()  # netCDF4 is not thread safe so all access to netCDF files goes through this.
+
 
 class modelEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -55,6 +64,361 @@ class modelEncoder(json.JSONEncoder):
             # Let the base class default method try to convert and raise the TypeError
 
 
+class configEncoder(json.JSONEncoder):
+    """
+    Encode model simulation configurations as JSON. Objects JSON does not support, and tuples (which JSON would
+    turn into lists), are written as a dict with a __type__ entry so configDecoder can rebuild them.
+    """
+
+    def iterencode(self, o, _one_shot=False):
+        """
+        Encode o. JSON writes tuples as lists without calling default so they are tagged first.
+        """
+        return super().iterencode(self.tagTuples(o), _one_shot)
+
+    @classmethod
+    def tagTuples(cls, obj):
+        """
+        :param obj: object to be converted
+        :return: obj with all tuples in it (and in the dicts & lists it holds) replaced by tagged dicts.
+        """
+        if isinstance(obj, tuple):
+            return dict(__type__='tuple', data=[cls.tagTuples(v) for v in obj])
+        if isinstance(obj, list):
+            return [cls.tagTuples(v) for v in obj]
+        if isinstance(obj, dict):
+            return collections.OrderedDict((k, cls.tagTuples(v)) for k, v in obj.items())
+        return obj
+
+    def default(self, obj):
+        """
+        Convert obj into something that can be converted to JSON
+        :param obj -- object to be converted
+        :return "primitive" objects that can be converted
+        """
+        if isinstance(obj, datetime.datetime):
+            return dict(__type__='datetime', value=obj.isoformat())
+        if isinstance(obj, pd.Series):
+            return dict(__type__='Series', name=obj.name, index=self.tagTuples(list(obj.index)),
+                        data=self.tagTuples(list(obj.values)))
+        if isinstance(obj, pathlib.PurePath):
+            return dict(__type__='Path', value=str(obj))
+        if isinstance(obj, np.ndarray):
+            return dict(__type__='ndarray', dtype=str(obj.dtype), data=obj.tolist())
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return json.JSONEncoder.default(self, obj)  # raises TypeError
+
+
+def configDecoder(pairs):
+    """
+    Rebuild objects written by configEncoder. Use as object_pairs_hook for json.load
+    :param pairs: list of (key, value) pairs for a JSON object
+    :return: rebuilt object or OrderedDict
+    """
+    obj = collections.OrderedDict(pairs)
+    objType = obj.get('__type__')
+    if objType == 'datetime':
+        return datetime.datetime.fromisoformat(obj['value'])
+    elif objType == 'Series':
+        return pd.Series(obj['data'], index=obj['index'], name=obj['name'], dtype=object).infer_objects()
+    elif objType == 'Path':
+        return pathlib.Path(obj['value'])
+    elif objType == 'ndarray':
+        return np.array(obj['data'], dtype=obj['dtype'])
+    elif objType == 'tuple':
+        return tuple(obj['data'])
+    return obj
+
+
+class JsonConfig(object):
+    """
+    Configuration backend that writes the configuration as compact JSON (see configEncoder) with a schema version.
+    Fast to read and can be read by anything. A backend has a fileName and read & write methods.
+    """
+    fileName = 'simulationConfig.json'
+    schema = 1  # version of the file layout. Files with later versions cannot be read.
+
+    def write(self, config, path):
+        """
+        Write configuration
+        :param config: configuration (dict) to write
+        :param path: path to file to write to
+        """
+        text = json.dumps(dict(schema=self.schema, config=config), cls=configEncoder, separators=(',', ':'))
+        with open(path, 'w') as fp:  # only write once encoded so failures do not leave half written files.
+            fp.write(text)
+
+    def read(self, path):
+        """
+        Read configuration
+        :param path: path to file
+        :return: configuration as an OrderedDict
+        """
+        with open(path, 'r') as fp:
+            data = json.load(fp, object_pairs_hook=configDecoder)
+        if data.get('schema', 0) > self.schema:
+            raise ValueError(f"{path} has schema {data.get('schema')}. Only versions up to {self.schema} can be read")
+        return data['config']
+
+
+class PickleConfig(object):
+    """
+    Configuration backend that pickles the configuration. This is how configurations were originally written so
+    it is kept so existing simulations can be read (and migrated -- see ModelSimulation.migrateConfig).
+    """
+    fileName = 'simulationConfig.cfg'
+
+    def write(self, config, path):
+        """
+        Write configuration
+        :param config: configuration (dict) to write
+        :param path: path to file to write to
+        """
+        with open(path, 'wb') as fp:
+            pickle.dump(config, fp)
+
+    def read(self, path):
+        """
+        Read configuration
+        :param path: path to file
+        :return: configuration
+        """
+        with open(path, 'rb') as fp:
+            return pickle.load(fp)
+
+
+def readConfigFile(dirPath, backends):
+    """
+    Read the configuration of a model simulation
+    :param dirPath: path to model simulation directory
+    :param backends: configuration backends to try in order. The first one whose file exists is used.
+    :return: configuration
+    """
+    for backend in backends:
+        path = os.path.join(dirPath, backend.fileName)
+        if os.path.isfile(path):
+            return backend.read(path)
+    raise FileNotFoundError(f"No configuration in {dirPath}. Tried {[b.fileName for b in backends]}")
+
+
+_obsCache = collections.OrderedDict()  # path -> (stamp, data) for observation files read. See readObsFile.
+_obsCacheSize = 10000  # maximum number of files held in _obsCache.
+_obsCacheLock = threading.Lock()
+
+
+def clearObsCache(path=None):
+    """
+    Forget cached observation files. See readObsFile.
+    :param path (default None): path to forget. If None forget everything.
+    :return: nothing
+    """
+    with _obsCacheLock:
+        if path is None:
+            _obsCache.clear()
+        else:
+            _obsCache.pop(os.path.abspath(path), None)
+
+
+def readObsFile(path, varsWant=()):
+    """
+    Read observations from a post-processing output file (netCDF, json or csv). What is read is kept in an
+      in-process cache keyed by path and the file's (mtime, size) so reading the same unchanged file again costs
+      a stat and a dictionary lookup. A rewritten file gets read again.
+      For netCDF files all wanted variables that have not already been read are read in one pass.
+    :param path: path to file
+    :param varsWant (default ()): names of the variables wanted. (Only used for netCDF files.)
+    :return: what was read or None if the file does not exist.
+       netCDF: dict of values for the wanted variables present in the file.
+       json: OrderedDict of everything in the file.
+       csv: DataFrame.
+      Values are shared with the cache so callers must copy before changing them.
+    """
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_size)
+    fileType = os.path.splitext(path)[1]
+    with _obsCacheLock:
+        entry = _obsCache.get(path)
+        if entry is not None and entry[0] == stamp:
+            _obsCache.move_to_end(path)
+            data = entry[1]
+            if fileType != '.nc' or all([var in data['read'] for var in varsWant]):
+                return data['values'] if fileType == '.nc' else data
+        else:
+            data = None
+
+    if fileType == '.nc':
+        if data is None:
+            data = dict(read=set(), values=dict())
+        toRead = [var for var in varsWant if var not in data['read']]
+        values = dict(data['values'])
+        with _netCDFLock, netCDF4.Dataset(path, "r") as ofile:  # open it up for reading
+            # get depreciation warnings because netCDF4 needs to update as numpy no longer use np.bool (which I guess it does)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                for var in toRead:
+                    if var in ofile.variables:
+                        values[var] = float(ofile.variables[var][0])  # this  will break if obs is not a scalar and masked
+        data = dict(read=data['read'] | set(toRead), values=values)
+    elif fileType == '.json':
+        with open(path, 'r') as fp:
+            data = json.load(fp, object_pairs_hook=collections.OrderedDict)
+    elif fileType == '.csv':  # data is a csv file.
+        data = pd.read_csv(path, header=None, index_col=False)
+    else:  # don't know what to do. So raise an error
+        raise NotImplementedError("Do not recognize %s" % fileType)
+
+    with _obsCacheLock:
+        _obsCache[path] = (stamp, data)
+        _obsCache.move_to_end(path)
+        while len(_obsCache) > _obsCacheSize:
+            _obsCache.popitem(last=False)
+    return data['values'] if fileType == '.nc' else data
+
+
+_nlTemplates = collections.OrderedDict()  # sha256 of namelist text -> NameListTemplate. See nameListTemplate.
+_nlTemplatesSize = 100  # maximum number of templates held in _nlTemplates.
+_nlTemplatesLock = threading.Lock()
+
+
+class NameListTemplate(object):
+    """
+    A parsed namelist file together with the text f90nml writes for each of its namelist groups. Patched
+      files are made by re-writing only the groups that change and splicing them between the cached text
+      of the others. Groups are written by f90nml so the result is byte for byte what f90nml writes for the
+      patched namelist. If the template can not be spliced (the spliced text of the unpatched namelist is not
+      what f90nml writes or groups can not be written on their own) or a patch adds a namelist group or changes
+      a repeated one the whole namelist is written by f90nml.
+    """
+
+    def __init__(self, text):
+        """
+        Parse namelist text and cache the text of each group.
+        :param text: text of the namelist file.
+        """
+        self.nl = f90nml.reads(text)
+        self.nl.end_comma = True
+        self.nl.uppercase = True
+        self.nl.logical_repr = ('.FALSE.', '.TRUE.')  # how to represent false and true
+        self._lock = threading.Lock()  # f90nml keeps state while writing.
+        self.groups = list(self.nl.items())  # (name, variables) for each group in file order.
+        self.index = collections.defaultdict(list)  # lower case group name -> position(s) in groups.
+        for indx, (name, grpVars) in enumerate(self.groups):
+            self.index[name.lower()].append(indx)
+        try:
+            self.groupText = [self._writeGroup(name, grpVars) for name, grpVars in self.groups]
+            self.splice = self._join(self.groupText) == self._write(self.nl)
+        except Exception:  # f90nml internals not as expected.
+            self.groupText = None
+            self.splice = False
+
+    def _writeGroup(self, name, grpVars):
+        """
+        :return: text f90nml writes for one namelist group. Uses f90nml internals so might fail
+          with other versions of f90nml.
+        """
+        stream = io.StringIO()
+        with self._lock:
+            self.nl._newline = False  # so no blank line before the group.
+            self.nl._write_nmlgrp(name, grpVars, stream)
+        return stream.getvalue()
+
+    @staticmethod
+    def _join(groupText):
+        """
+        :return: text of namelist file from text of its groups -- f90nml puts a blank line between groups.
+        """
+        return '\n'.join(groupText)
+
+    @staticmethod
+    def _write(nl):
+        """
+        :return: text f90nml writes for namelist nl.
+        """
+        stream = io.StringIO()
+        nl.write(stream)
+        return stream.getvalue()
+
+    def patch(self, values):
+        """
+        Patch the namelist.
+        :param values: list of (namelist, var, value) tuples. Namelists that do not exist get added.
+        :return: text of the patched namelist file.
+        """
+        changes = collections.OrderedDict()  # namelist -> list of (var, value)
+        for namelist, var, value in values:
+            changes.setdefault(namelist, []).append((var, value))
+        if self.splice and all([len(self.index.get(namelist.lower(), [])) == 1 for namelist in changes.keys()]):
+            try:
+                groupText = list(self.groupText)
+                for namelist, grpValues in changes.items():
+                    indx = self.index[namelist.lower()][0]
+                    name, grpVars = self.groups[indx]
+                    grpVars = copy.deepcopy(grpVars)
+                    for var, value in grpValues:
+                        grpVars[var] = value
+                    groupText[indx] = self._writeGroup(name, grpVars)
+                return self._join(groupText)
+            except Exception:  # f90nml internals not as expected so stop splicing.
+                self.splice = False
+
+        # patch a copy of the whole namelist and let f90nml write it.
+        nl = copy.deepcopy(self.nl)
+        for namelist, grpValues in changes.items():
+            if namelist not in nl:
+                nl[namelist] = collections.OrderedDict()
+            for var, value in grpValues:
+                nl[namelist][var] = value
+        return self._write(nl)
+
+
+def nameListTemplate(text):
+    """
+    Get the NameListTemplate for namelist text. Templates are kept in an in-process cache keyed by a hash of
+      the text so each distinct namelist file (e.g. the CNTLATM of a reference configuration) is parsed once.
+    :param text: text of the namelist file.
+    :return: NameListTemplate
+    """
+    key = hashlib.sha256(text.encode()).hexdigest()
+    with _nlTemplatesLock:
+        template = _nlTemplates.get(key)
+        if template is not None:
+            _nlTemplates.move_to_end(key)
+            return template
+    template = NameListTemplate(text)
+    with _nlTemplatesLock:
+        _nlTemplates[key] = template
+        _nlTemplates.move_to_end(key)
+        while len(_nlTemplates) > _nlTemplatesSize:
+            _nlTemplates.popitem(last=False)
+    return template
+
+
+class readOnlyMap(collections.abc.Mapping):
+    """
+    Read only view of a dict. Unlike types.MappingProxyType it can be pickled and copied (as models are).
+    """
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._data!r})"
+
+
 _namedTupClass = collections.namedtuple('TupClassxx',
                                         ('var', 'namelist', 'file'))  # named tuple for namelist information
 
@@ -64,7 +428,7 @@ class ModelSimulation(object):
     """
     Class to define Model Simulations. This class is top class that
        provides basic functionality. In particular the configuration as updated
-       is written to disk as a pickle file. Each set does this.
+       is written to disk (see configBackend). Each set does this.
        Define new model simulations that do more by sub-classing this class.
        To get the observed values do model.getObs()
        To get parameters do model.getParams()
@@ -76,10 +440,22 @@ class ModelSimulation(object):
 
        TODO -- write more extensive documentation  esp on namelist read/writes.
        TODO -- move namelist stuff out of ModelSimulation into separate module??
-       TODO -- do not use pickle but save as a json file. Though that will make reading in tricky.
+       The configuration is written by configBackend (JSON by default). Configurations written by any of the
+       legacyConfigBackends (pickle by default) are still read and get migrated the next time they are written.
     """
 
-    _simConfigPath = 'simulationConfig.cfg'  # default configuration filename for the Model Simulation.
+    configBackend = JsonConfig()  # how the configuration is written. See JsonConfig.
+    legacyConfigBackends = (PickleConfig(),)  # older ways the configuration might have been written.
+    runStateFile = 'runState.log'  # file, in the study directory, where run states are recorded. See RunState.
+    obsStoreFile = 'studyObs.sqlite'  # file, in the study directory, where observations are stored. See ObsStore.
+    # how files are copied from the reference directory when a simulation is created.
+    #   'copy' -- copy everything. 'link' -- clone or hard link everything except copyFiles (see optClimLib.cowTree).
+    createMode = 'copy'
+    copyFiles = ()  # glob patterns for files changed in place -- never hard linked.
+    nameListBackup = True  # if True writeNameList copies namelist files to <file>_nl.bak before first changing them.
+    # namelist information shared by all instances of the class. See classNameLists.
+    simpleNameLists = ()  # (param, nameListVar, nameListName, nameListFile) for parameters set in one namelist var.
+    metaFunctions = ()  # (param, function) for meta parameters. See registerMetaFn for what function does.
 
     def __init__(self, dirPath, obsNames=None, runTime=None, runCode=None,
                  create=False, refDirPath=None, name=None, ppExePath=None, ppOutputFile=None, parameters=None,
@@ -91,7 +467,7 @@ class ModelSimulation(object):
         :param dirPath -- path to directory where model simulation exists or is to be created.
                         Shell variables and ~ will be expanded
         :param create (optional with default False). If True create new directory and populate it.
-            If directory exists it will be deleted. 
+            An existing directory is never overwritten -- FileExistsError is raised if dirPath exists.
             Afterwards the ModelSimulation will be readOnly.
             These options should be specified when creating a new study otherwise they are optional and ignored
             :param refDirPath -- reference directory. Copy all files from here into dirPath
@@ -109,14 +485,21 @@ class ModelSimulation(object):
         :returns initialised object.
         """
         # stage 1 common initialisation
-        self._convNameList = collections.OrderedDict()  # information on the variable to Namelist mapping
-        self._metaFn = collections.OrderedDict()  # functions used for meta parameters.
+        # information on the variable to Namelist mapping and functions used for meta parameters.
+        # Those declared by the class are shared. genVarToNameList and registerMetaFn add per-instance ones (which
+        # override the class ones). See classNameLists.
+        convNameList, metaFn = self.classNameLists()
+        self._convNameList = collections.ChainMap(collections.OrderedDict(), convNameList)
+        self._metaFn = collections.ChainMap(collections.OrderedDict(), metaFn)
         self.config = collections.OrderedDict()
         self.dirPath = os.path.expandvars(os.path.expanduser(dirPath))  # expand dirPath and store it
         # convert to an absolute path -- needed when jobs get submitted as don't know where we might be running from
         self.dirPath = os.path.abspath(self.dirPath)
         self._readOnly = True  # default is read only.
-        self._configFilePath = os.path.join(self.dirPath, self._simConfigPath)  # full path to configuration file
+        self._batchDepth = 0  # how many batch blocks we are in. See batch.
+        self._batchDirty = False  # True if configuration changed in a batch block.
+        self._nameListCache = dict()  # path -> (stamp, namelist) for namelist files read. See readNameListFile.
+        self._configFilePath = os.path.join(self.dirPath, self.configBackend.fileName)  # full path to configuration file
 
         ppModifyMark = '# =insert post-process script here= # '
         self.postProcessMark = ppModifyMark
@@ -142,17 +525,16 @@ class ModelSimulation(object):
         """
         Equality -- two models are equal if their types, parameters, refDirs and obs are the same
         :param other: an other model to compare with
-        :return: True if equal, False if not
+        :return: True if equal, False if not. NotImplemented if other is a different type
+          (so other's __eq__, e.g. ModelSubmit.RunRecord's, gets used).
         """
 
+        if type(self) != type(other):
+            return NotImplemented
         equal = True
-        equal = equal and (type(self) == type(other))
-        try:
-            equal = equal and (self.refDirPath() == other.refDirPath())  # same refDir
-            equal = equal and (self.getParams() == other.getParams())  # same params
-            equal = equal and (self.getObs() == other.getObs())  # same obs.
-        except AttributeError:  # when other doesn't have methods
-            equal = False
+        equal = equal and (self.refDirPath() == other.refDirPath())  # same refDir
+        equal = equal and (self.getParams() == other.getParams())  # same params
+        equal = equal and (self.getObs() == other.getObs())  # same obs.
 
         return equal
 
@@ -173,12 +555,113 @@ class ModelSimulation(object):
         """
         # TODO replace this by reading parameters, pp stuff and obsnames.
         # let these be overwritten from the init values if set.
-        # pickle makes it difficult to update while running which might be an advantage
-        with open(self._configFilePath, 'rb') as fp:
-            config = pickle.load(fp)
-
+        config = readConfigFile(self.dirPath, self.configBackends())
+        if verbose:
+            print("Read config from %s" % (self.dirPath))
         return config
 
+    @classmethod
+    def configBackends(cls):
+        """
+        :return: tuple of configuration backends to read with -- configBackend then legacyConfigBackends.
+        """
+        return (cls.configBackend,) + tuple(cls.legacyConfigBackends)
+
+    @classmethod
+    def configFiles(cls):
+        """
+        :return: list of names of the files the configuration might be in.
+        """
+        return [backend.fileName for backend in cls.configBackends()]
+
+    def writeConfig(self, verbose=False):
+        """
+        Write the configuration using configBackend. See writeConfigFile. Inside a batch block the write
+          is put off until the block ends.
+        :param verbose (default = False). If true produces verbose output.
+        :return: nothing
+        """
+        if self._batchDepth > 0:
+            self._batchDirty = True
+            return
+        self.writeConfigFile(self.dirPath, self.config, verbose=verbose)
+
+    @contextlib.contextmanager
+    def batch(self, verbose=False):
+        """
+        Context manager that coalesces configuration writes. Inside the block set and set2 (and everything that
+          uses them) only change the configuration in memory. It is written once when the outermost block ends.
+          Read only checks are still made by each set. If the block raises an exception the configuration is
+          restored to what it was and nothing is written.
+        Example:
+            with model.batch():
+                model.set2(history=history)
+                model.set2(perturbList=perturbList)
+        :param verbose (default = False). If true produces verbose output.
+        """
+        outer = (self._batchDepth == 0)
+        if outer:
+            savedConfig = copy.deepcopy(self.config)
+            self._batchDirty = False
+        self._batchDepth += 1
+        ok = False
+        try:
+            yield self
+            ok = True
+        finally:
+            self._batchDepth -= 1
+            if outer:
+                dirty, self._batchDirty = self._batchDirty, False
+                if not ok:
+                    self.config = savedConfig
+                elif dirty:
+                    self.writeConfig(verbose=verbose)
+
+    @classmethod
+    def writeConfigFile(cls, dirPath, config, verbose=False):
+        """
+        Write a configuration using configBackend. The configuration is written to a temporary file,
+          made read only and then renamed over the existing file so a crash never leaves a half written file.
+          Any file written by a legacy backend is removed (so the configuration is migrated).
+        :param dirPath: path to model simulation directory
+        :param config: configuration to write.
+        :param verbose (default = False). If true produces verbose output.
+        :return: nothing
+        """
+        configFilePath = os.path.join(dirPath, cls.configBackend.fileName)
+        tmpPath = configFilePath + f'.{os.getpid()}_{threading.get_ident()}.tmp'
+        try:
+            cls.configBackend.write(config, tmpPath)
+            mode = os.stat(tmpPath).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+            os.chmod(tmpPath, mode)  # set its mode
+            os.replace(tmpPath, configFilePath)  # atomic so readers see the old or new file.
+        finally:
+            if os.path.isfile(tmpPath):  # failed so clean up.
+                os.chmod(tmpPath, stat.S_IWUSR)
+                os.remove(tmpPath)
+        if verbose:
+            print("Written current config to %s with mode %o " % (configFilePath, mode))
+        for backend in cls.legacyConfigBackends:
+            path = os.path.join(dirPath, backend.fileName)
+            if backend.fileName != cls.configBackend.fileName and os.path.isfile(path):
+                os.chmod(path, stat.S_IWUSR)
+                os.remove(path)
+
+    @classmethod
+    def migrateConfig(cls, dirPath, verbose=False):
+        """
+        Rewrite a configuration written by a legacy backend with configBackend. What is on disk is rewritten
+          unchanged so no model needs creating and read only simulations can be migrated.
+        :param dirPath: path to model simulation directory
+        :param verbose (default = False). If true produces verbose output.
+        :return: True if migrated, False if nothing needed doing.
+        """
+        if os.path.isfile(os.path.join(dirPath, cls.configBackend.fileName)):
+            return False
+        config = readConfigFile(dirPath, cls.legacyConfigBackends)
+        cls.writeConfigFile(dirPath, config, verbose=verbose)
+        return True
+
     def readModelSimulation(self, obsNames=None, update=False, ppOutputFile=None, verbose=False):
         """
         Read in information on modelSimulation
@@ -208,6 +691,23 @@ class ModelSimulation(object):
         self.readObs(verbose=verbose)  # and read the observations
         self._readOnly = not update
 
+    @classmethod
+    def readRecord(cls, dirPath, obsNames=None, ppOutputFile=None, verbose=False):
+        """
+        Read just what is needed to describe an existing model simulation -- its name, parameters,
+        reference directory and observations. Only the ModelSimulation initialisation is done so the set up
+        sub-classes do (registering meta-functions, namelist information etc) is skipped.
+        :param dirPath -- path to directory where model simulation exists.
+        :param obsNames -- obs names being used -- if set will override original config
+        :param ppOutputFile -- name of post processing output file. If set overrides original config
+        :param  verbose(default = False) be verbose
+        :return: dict with keys name, dirPath, params, refDirPath & obs
+        """
+        sim = cls.__new__(cls)
+        ModelSimulation.__init__(sim, dirPath, obsNames=obsNames, ppOutputFile=ppOutputFile, verbose=verbose)
+        return dict(name=sim.name(), dirPath=sim.dirPath, params=sim.getParams(), refDirPath=sim.refDirPath(),
+                    obs=sim.get('observations'))
+
     def set(self, keys_values, write=True, verbose=False):  # suspect can do this with object methods...
         """
         sets value in configuration information and writes configuration out.
@@ -224,21 +724,7 @@ class ModelSimulation(object):
             self.config[k] = v
         # write whole of config out to dir.
         if write:
-            if os.path.isfile(self._configFilePath):
-                os.chmod(self._configFilePath, stat.S_IWUSR)  # make it write only so we can delete it
-                os.remove(self._configFilePath)  # remove file
-
-            with open(self._configFilePath, 'wb') as fp:  # create it
-                # TODO replace this dumping to a json file of the current values -- means if object inherits it will need to interface to this.
-                # Easiest way to do is dump the config variable which shoudl contain all information. Documentation to
-                # object shoud be clear that all entries should be json serialisible. Or overwrite read & write methods to do what you want to do!
-                # so perhaps output the configuration to a json file.. with some additional meta data.
-                # But the read will need to try and read the pickle file if the json file is not present...
-                pickle.dump(self.config, fp)
-            mode = os.stat(self._configFilePath).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
-            if verbose:
-                print("Written current config to %s with mode %o " % (self._configFilePath, mode))
-            os.chmod(self._configFilePath, mode)  # set its mode
+            self.writeConfig(verbose=verbose)
 
     def set2(self, write=True, verbose=False, **kwargs):  # suspect can do this with object methods...
         """
@@ -255,16 +741,7 @@ class ModelSimulation(object):
             self.config[k] = v
         # write whole of config out to dir.
         if write:
-            if os.path.isfile(self._configFilePath):
-                os.chmod(self._configFilePath, stat.S_IWUSR)  # make it write only so we can delete it
-                os.remove(self._configFilePath)  # remove file
-
-            with open(self._configFilePath, 'wb') as fp:  # create it
-                pickle.dump(self.config, fp)
-            mode = os.stat(self._configFilePath).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
-            if verbose:
-                print("Written current config to %s with mode %o " % (self._configFilePath, mode))
-            os.chmod(self._configFilePath, mode)  # set its mode
+            self.writeConfig(verbose=verbose)
 
     def get(self, keys=None, verbose=False, default=None):
         """
@@ -293,6 +770,7 @@ class ModelSimulation(object):
                               ppOutputFile=None, refDirPath=None, verbose=False):
         """
         Create (in filesystem) a model simulation. After creation the simulation will be read only.
+        dirPath must not already exist -- FileExistsError is raised if it does.
         :param parameters -- dict of parameter names and values OR pandas series.
         :param ppExePath --  path to post processing executable -- Default None
         :param obsNames -- list of observations being used. -- Default None
@@ -331,32 +809,46 @@ class ModelSimulation(object):
 
         if verbose:   print("Config is ", config)
 
-        if os.path.exists(self.dirPath):  # delete the directory (if it currently exists)
-            shutil.rmtree(self.dirPath, onerror=optClimLib.errorRemoveReadonly)
+        # Make (empty) target directory. Raises FileExistsError if dirPath already exists -- never overwrite a model.
+        parent, base = os.path.split(self.dirPath)
+        os.makedirs(parent, exist_ok=True)
+        os.mkdir(self.dirPath)
 
         if refDirPath is not None:  # copy all files and directories from refDirPath to dirPath and make then user writable
-            mode = os.umask(0)  # get current vale of umask
-            os.umask(mode)  # and reset it
-            mode = mode | stat.S_IWUSR  # mode we want is umask + write
-            if os.path.exists(self.dirPath):  # got directory so need to remove it
-                shutil.rmtree(self.dirPath, onerror=optClimLib.errorRemoveReadonly)  # delete where we are making data.
-            shutil.copytree(refDirPath, self.dirPath)  # copy everything
-            # now change the permissions so user can write
+            # copy into a temporary directory next to dirPath and then rename into place over the (empty) dirPath.
+            # So dirPath never exists half copied and the rename fails if something else has written to dirPath.
+            tmpDir = tempfile.mkdtemp(prefix='.' + base + '_', dir=parent)
+            copyPath = os.path.join(tmpDir, base)
+            try:
+                if self.createMode == 'link':  # clone or link (rather than copy) files that are not changed.
+                    counts = optClimLib.cowTree(refDirPath, copyPath, copyPatterns=self.copyFiles)
+                    if verbose: print("Files cloned, linked & copied:", counts)
+                elif self.createMode == 'copy':
+                    shutil.copytree(refDirPath, copyPath)  # copy everything
+                else:
+                    raise ValueError(f"Unknown createMode {self.createMode}")
+                # now change the permissions so user can write
+                for root, dirs, files in os.walk(copyPath, topdown=True):  # iterate over all directories
+                    mode = os.stat(root).st_mode | stat.S_IWUSR
+                    os.chmod(root, mode)
+                    for name in files:  # iterate over files in directory
+                        fname = os.path.join(root, name)
+                        st = os.stat(fname)
+                        if st.st_nlink > 1:  # hard linked -- changing its mode would change the original.
+                            continue
+                        mode = st.st_mode | stat.S_IWUSR  # mode has user write permission.
+                        #                print "Setting mode on %s  to %d"%(fname,mode)
+                        os.chmod(fname, mode)
+                os.rename(copyPath, self.dirPath)
+            except BaseException:
+                if os.path.isdir(self.dirPath) and len(os.listdir(self.dirPath)) == 0:
+                    os.rmdir(self.dirPath)  # give up our claim on dirPath.
+                raise
+            finally:
+                shutil.rmtree(tmpDir, onerror=optClimLib.errorRemoveReadonly)
             if verbose: print("Copied files from %s to %s " % (refDirPath, self.dirPath))
-            for root, dirs, files in os.walk(self.dirPath, topdown=True):  # iterate
-                for name in dirs:  # iterate over  the directories
-                    dname = os.path.join(root, name)
-                    mode = os.stat(dname).st_mode | stat.S_IWUSR
-                    os.chmod(dname, mode)
-                for name in files:  # iterate over files in directory
-                    fname = os.path.join(root, name)
-                    mode = os.stat(fname).st_mode | stat.S_IWUSR  # mode has user write permission.
-                    #                print "Setting mode on %s  to %d"%(fname,mode)
-                    os.chmod(fname, mode)
-        else:
-            # Make target directory.
-            os.makedirs(self.dirPath)  # create directory
         self.set(config)  # set (and write) configuration
+        self.runState(RunState.CREATED)
         # TODO add setParams call here..
         # and no longer able to write to it.
         self._readOnly = True
@@ -410,50 +902,35 @@ class ModelSimulation(object):
         obsFile = os.path.join(self.dirPath, self.ppOutputFile())
         obs = collections.OrderedDict()
         varsWant = self.get(['observations']).keys()  # extract keys from current obs
-        # TODO -- should read all obs values in rather than just the ones we want..
-        # see if obs file exists or json file exists. If not return dict with Nones.
-        if not os.path.exists(obsFile):
+        fileType = os.path.splitext(obsFile)[1]  # type of file wanted
+        # see if obs file exists or json file exists. If not return None.
+        data = readObsFile(obsFile, varsWant=varsWant)  # cached so cheap if already read.
+        if data is None:
             if verbose: print("File %s not found. Returning None " % (obsFile))
             return None
-
-        fileType = os.path.splitext(obsFile)[1]  # type of file wanted
+        if justRead and fileType == '.nc':
+            raise NotImplementedError("Implement justRead with netcdf4")
 
         if fileType == '.nc':
-            # netcdf file so read in data allowing python stuff to raise exception if it doesn't exist or is corrupt.
-            # current implementation is missing the constraint..
             if verbose:  # provide some helpful info.
-                print("Reading netcdf data from %s " % obsFile)
-                print("For: ", obs.keys())
-
-            with netCDF4.Dataset(obsFile, "r") as ofile:  # open it up for reading
-                # get depreciation warnings because netCDF4 needs to update as numpy no longer use np.bool (which I guess it does)
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    if verbose: print(f"nc file {obsFile}  got {ofile.variables.keys()}")
-                    if justRead: raise NotImplementedError("Implement justRead with netcdf4")
-                    for var in varsWant:  # loop over variables
-                        if var in ofile.variables:  # got it?
-                            obs[var] = float(ofile.variables[var][0])
-                            # this  will break if obs is not a scalar and masked
-                        else:
-                            obs[var] = None  # set to None if we don't have it.
+                print("Read netcdf data from %s " % obsFile)
+                print("For: ", list(varsWant))
+            for var in varsWant:  # loop over variables
+                obs[var] = data.get(var)  # set to None if we don't have it.
         elif fileType == '.json':
             # this should just be a json file.
-            with open(obsFile, 'r') as fp:
-                obs = json.load(fp, object_pairs_hook=collections.OrderedDict)
+            obs = copy.copy(data)
             if verbose: print("json file got ", obs.keys())
             if not justRead:  # add in None for variables not present
                 for var in varsWant:  # loop over variables that we def want.
                     obs[var] = obs.get(var, None)  # get variable returning None if not defined.
 
         elif fileType == '.csv':  # data is a csv file.
-            obsdf = pd.read_csv(obsFile, header=None, index_col=False)
+            obsdf = data
             obs = obsdf.to_dict()
             if not justRead:
                 for k in varsWant:  # loop overs vars we def want
                     obs[k] = obsdf.loc[k].values
-        else:  # don't know what to do. So raise an error
-            raise NotImplementedError("Do not recognize %s" % fileType)
         self.set({'observations': obs}, write=False)
 
         if series:
@@ -462,7 +939,8 @@ class ModelSimulation(object):
 
     def writeObs(self, obs, verbose=False):
         """
-        Write the observations to file. Type of file determines how write done
+        Write the observations to file. Type of file determines how write done. They are also appended to the
+          study observation store (see obsStore).
         :param obs -- observations (dict with keys obsNames) (or pandas series)
         :param verbose: (default False) be verbose if True
         :return: nada!
@@ -475,18 +953,19 @@ class ModelSimulation(object):
         if verbose:
             print(f"Writing data to {file}")
         if fileType == '.nc':  # netcdf file
-            rootgrp = netCDF4.Dataset(file, "w", format="NETCDF4")
-            try:
-                for key, obsV in obs.items():  # iterate over index in series.
-                    if verbose:
-                        print(f"key:{key} value {obsV}")
-                    v = rootgrp.createVariable(key, 'f8')  # create the NetCDF variable
-                    if verbose:
-                        print("Var is ", v, obsV, v.size)
-                    v[:] = obsV  # write to it -- will fail if not a scalar I imagine!
-
-            finally:  # any failure close the netcdf file
-                rootgrp.close()
+            with _netCDFLock:
+                rootgrp = netCDF4.Dataset(file, "w", format="NETCDF4")
+                try:
+                    for key, obsV in obs.items():  # iterate over index in series.
+                        if verbose:
+                            print(f"key:{key} value {obsV}")
+                        v = rootgrp.createVariable(key, 'f8')  # create the NetCDF variable
+                        if verbose:
+                            print("Var is ", v, obsV, v.size)
+                        v[:] = obsV  # write to it -- will fail if not a scalar I imagine!
+
+                finally:  # any failure close the netcdf file
+                    rootgrp.close()
         elif fileType == '.json':  # json file
             with open(file, 'w') as fp:  # just dump the obs to the file.
                 if type(obs) is pd.Series:  # it is a series -- convert to dict to wrte
@@ -498,9 +977,19 @@ class ModelSimulation(object):
             obs.to_csv(file, header=True)
         else:  # don't know what to do. So raise an error
             raise NotImplementedError("Do not recognize %s" % fileType)
+        clearObsCache(file)  # in case the file system does not notice the change.
+        self.obsStore().append(os.path.basename(self.dirPath), obs, name=self.name())
 
         # have read the obs. We should set the obs
         self.set({'observations': obs}, write=False)
+        self.runState(RunState.DONE)
+
+    def obsStore(self):
+        """
+        :return: the study observation store (see ObsStore) -- obsStoreFile in the directory containing dirPath.
+          Observations are only stored if it exists.
+        """
+        return ObsStore.ObsStore(os.path.join(os.path.dirname(self.dirPath), self.obsStoreFile))
 
     def getObs(self, verbose=False, series=False, justRead=False):
         """
@@ -558,6 +1047,26 @@ class ModelSimulation(object):
 
         return p
 
+    @classmethod
+    def classNameLists(cls):
+        """
+        Namelist conversions and meta functions declared by the class (simpleNameLists & metaFunctions).
+          They are built, and the meta functions checked, once per class and shared (read only) by all instances.
+        :return: read only mappings of namelist conversions and meta functions indexed by parameter name.
+        """
+        nameLists = cls.__dict__.get('_classNameLists')  # only want the ones for this class -- not a parent's.
+        if nameLists is None:
+            convNameList = collections.OrderedDict()
+            for param, nameListVar, nameListName, nameListFile in cls.simpleNameLists:
+                convNameList[param] = (_namedTupClass(var=nameListVar, namelist=nameListName, file=nameListFile),)
+            metaFn = collections.OrderedDict()
+            for param, function in cls.metaFunctions:
+                cls.checkMetaFn(function)
+                metaFn[param] = function
+            nameLists = (readOnlyMap(convNameList), readOnlyMap(metaFn))
+            cls._classNameLists = nameLists
+        return nameLists
+
     def registerMetaFn(self, varName, function, verbose=False):
         """
         Register a function to process meta parameters
@@ -575,6 +1084,16 @@ class ModelSimulation(object):
                 print("Registering function %s for %s" % (function.func_name, varName))
             except AttributeError:
                 pass
+        self.checkMetaFn(function)
+        self._metaFn[varName] = function
+
+    @staticmethod
+    def checkMetaFn(function):
+        """
+        Check a meta parameter function works as registerMetaFn expects. Raises an exception if not.
+        :param function: Function to check
+        :return: nothing
+        """
         # verify fn works as expected.
         res = function()  # run it with default value.
         keys = res.keys()
@@ -597,8 +1116,6 @@ class ModelSimulation(object):
             if L:
                 raise Exception("Fn not invertible")
 
-        self._metaFn[varName] = function
-
     def genVarToNameList(self, param, nameListVar, nameListName, nameListFile, verbose=False):
         """
         Generate a conversion list for use in converting model parameter names to namelist values.
@@ -647,7 +1164,9 @@ class ModelSimulation(object):
         # TODO make parameters a simple dict rather than kwargs
         """
         Modify existing namelist files using information generated via genConversion
-        Existing files will be copied to .bak
+        Existing files will be copied to _nl.bak if nameListBackup is True.
+        Each distinct namelist file is parsed once per process and patched by re-writing only the
+          namelist groups that change. See NameListTemplate.
         :param verbose (optional -- default is False). If True provide more information on what is going on.
         :param fail (optional default is False). If True fail if a parameter not found.
         :keyword arguments are parameters and values.
@@ -691,41 +1210,65 @@ class ModelSimulation(object):
             if not os.path.isfile(filePath):
                 # raise IOError("file %s does not exist"%(filePath))
                 continue  # skip this file.
-            backup_file = filePath + "_nl.bak"  # and full path to backup fie.
-            if not os.path.isfile(backup_file):
-                shutil.copyfile(filePath, backup_file)
+            if self.nameListBackup:
+                backup_file = filePath + "_nl.bak"  # and full path to backup fie.
+                if not os.path.isfile(backup_file):
+                    shutil.copyfile(filePath, backup_file)
             # now create the namelist file.
             with open(filePath) as nmlFile:
-                nl = f90nml.read(nmlFile)
-            nl.end_comma = True
-            nl.uppercase = True
-            nl.logical_repr = ('.FALSE.', '.TRUE.')  # how to reprsetn false and true
+                template = nameListTemplate(nmlFile.read())
+            values = []  # construct the patch for the namelist file for all conversion tuples.
+            for (value, conv) in files[file]:
+                if type(value) is np.ndarray:  # convert numpy array to list for writing.
+                    value = value.tolist()
+                elif isinstance(value, str):  # may not be needed at python 3
+                    value = str(value)  # f90nml can't cope with unicode so convert it to string.
+                values.append((conv.namelist, conv.var, copy.copy(value)))  # copy the value rather than the name.
+                if verbose:
+                    print("Setting %s,%s to %s in %s" % (conv.namelist, conv.var, value, filePath))
+            try:
+                text = template.patch(values)
+            except StopIteration:
+                print("Problem in f90nml for %s" % (filePath), template.nl)
+                raise  # raise exception.
             # Need a temp file
             with tempfile.NamedTemporaryFile(dir=self.dirPath, delete=False, mode='w') as tmpNL:
-                # Now construct the patch for the  namelist file for all conversion tuples.
-
-                for (value, conv) in files[file]:
-                    if conv.namelist not in nl:
-                        nl[conv.namelist] = collections.OrderedDict()  # don't have ordered dict so make it
-                    if type(value) is np.ndarray:  # convert numpy array to list for writing.
-                        value = value.tolist()
-                    elif isinstance(value, str):  # may not be needed at python 3
-                        value = str(value)  # f90nml can't cope with unicode so convert it to string.
-                    nl[conv.namelist][conv.var] = copy.copy(
-                        value)  # copy the variable to be stored rather than the name.
-                    if verbose:
-                        print("Setting %s,%s to %s in %s" % (conv.namelist, conv.var, value, filePath))
-                try:
-                    nl.write(tmpNL.name, force=True)
-                except StopIteration:
-                    print("Problem in f90nml for %s writing to %s" % (filePath, tmpNL.name), nl)
-                    raise  # raise exception.
+                tmpNL.write(text)
 
             if verbose: print("Patched %s to %s" % (filePath, tmpNL.name))
             os.replace(tmpNL.name, filePath)  # and copy the modified file back in place.
+            self.clearNameListCache(file)
 
         return params_used
 
+    def readNameListFile(self, file):
+        """
+        Read a namelist file. Namelists read are cached keyed by path and the file's (mtime, size, inode) so
+          reading an unchanged file again costs a stat. writeNameList forgets the files it changes.
+        :param file: name of the namelist file (relative to dirPath)
+        :return: f90nml Namelist. It is shared with the cache so copy it before changing it.
+        """
+        path = os.path.join(self.dirPath, file)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        entry = self._nameListCache.get(path)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, f90nml.read(nml_path=path))
+            self._nameListCache[path] = entry
+        return entry[1]
+
+    def clearNameListCache(self, file=None):
+        """
+        Forget cached namelist files. See readNameListFile.
+        :param file (default None): name of the namelist file (relative to dirPath) to forget.
+            If None forget everything.
+        :return: nothing
+        """
+        if file is None:
+            self._nameListCache.clear()
+        else:
+            self._nameListCache.pop(os.path.join(self.dirPath, file), None)
+
     def readNameList(self, params, fail=False, verbose=False, full=False):
         """
         Read parameter value from registered namelist
@@ -737,13 +1280,22 @@ class ModelSimulation(object):
         :return:An OrderedDict with the values indexed by the param names
         """
         # TODO make work when params is a single string.
+        # work out all the namelist files needed and read each of them once.
+        files = []
+        for param in params:
+            if param in self._metaFn:
+                nlInfo = self._metaFn[param](namelist=True)
+            else:
+                nlInfo = self._convNameList.get(param, [])
+            files.extend([var.file for var in nlInfo if var.file not in files])
+        namelists = {file: self.readNameListFile(file) for file in files}
         result = collections.OrderedDict()
         for param in params:
             # have it as meta function?
             if param in self._metaFn:  # have a meta funcion -- takes priority.
-                result[param] = self.readMetaNameList(param, verbose=verbose, full=full)
+                result[param] = self.readMetaNameList(param, verbose=verbose, full=full, namelists=namelists)
             elif param in self._convNameList:  # in the conversion index
-                nlValue = self.readNameListVar(self._convNameList[param], verbose=verbose)
+                nlValue = self.readNameListVar(self._convNameList[param], verbose=verbose, namelists=namelists)
                 if len(nlValue) != 1: raise ValueError("Should only have one key")
                 for k in nlValue.keys():  # in this case shoudl only have one key and we don't want it as a list
                     result[param] = nlValue[k]
@@ -754,33 +1306,36 @@ class ModelSimulation(object):
                 pass
         return result  # return the result.
 
-    def readNameListVar(self, nameListVars, verbose=False):
+    def readNameListVar(self, nameListVars, verbose=False, namelists=None):
         """
         Read single parameter specified via named tuple defining namelist variable
 
         :param verbose: default False. If True be verbose
         :param NameListVars: list of namelist variables to be retrieved
+        :param namelists (default None): dict of namelists already read indexed by file name.
+            Files not in it are read with readNameListFile.
         :return: an ordered dict indexed by namelist info (if found) with values retrieved.
         """
 
         result = collections.OrderedDict()
-        namelists = {}
+        namelists = dict() if namelists is None else namelists
         # iterate over all parameters reading in namelists.
         for var in nameListVars:
             if var.file not in namelists:  # not already read this namelist.
-                namelists[var.file] = f90nml.read(nml_path=os.path.join(self.dirPath, var.file))
+                namelists[var.file] = self.readNameListFile(var.file)
         # now having read all needed namelists extract the values we want
         for var in nameListVars:
-            nlvalue = namelists[var.file][var.namelist][var.var]
+            nlvalue = copy.deepcopy(namelists[var.file][var.namelist][var.var])  # copy so the cache is safe.
             result[var] = nlvalue
         return result
 
-    def readMetaNameList(self, param, verbose=False, full=False):
+    def readMetaNameList(self, param, verbose=False, full=False, namelists=None):
         """
         Retrieve value of meta parameter  by reading namelists and running inverse function.
         :param param:  name of meta-parameter
         :param verbose: be verbose
         :param full: do not run inverse function -- return all values.
+        :param namelists (default None): dict of namelists already read indexed by file name.
         :return:  value of meta-parameter
         """
         # work out what fn is and run it with default value to work out what namelist values we need to retrieve.
@@ -788,7 +1343,7 @@ class ModelSimulation(object):
         nlInfo = fn(namelist=True)  # get the namelist info by asking the function for it!
         # retrieve appropriate values from namelist
         if verbose: print("Retrieving ", )
-        var = self.readNameListVar(nlInfo, verbose=verbose)  # read from namelist.
+        var = self.readNameListVar(nlInfo, verbose=verbose, namelists=namelists)  # read from namelist.
         if verbose: print("Retrieved", var)
         if full:
             result = var  # skip inverse processing
@@ -838,9 +1393,24 @@ class ModelSimulation(object):
             self.setReadOnly(False)
             self.set2(runStatus=value)
             self.setReadOnly()
+            self.runState(RunState.CREATED)  # ready to be submitted again.
 
         return self.get('runStatus',default='start')
 
+    def runState(self, value=None):
+        """
+        Get (and optionally record) the lifecycle state of the simulation (see RunState).
+        States are kept in a table (runStateFile) in the study directory -- the directory containing dirPath.
+        If that table does not exist (so the simulation is not part of a study) nothing is recorded.
+        :param value (default None): If not None record this state.
+        :return: current state or None if none recorded.
+        """
+        table = RunState.table(os.path.join(os.path.dirname(self.dirPath), self.runStateFile))
+        dirName = os.path.basename(self.dirPath)
+        if value is not None:
+            table.set(dirName, value)
+        return table.state(dirName)
+
 
 
 
@@ -858,8 +1428,9 @@ class ModelSimulation(object):
         cont_list = history.get('cont', [])
         cont_list.append(datetime.datetime.now())
         history['cont'] = cont_list
-        self.set2(history=history)  # store if minimal or not
-        self.runStatus('continue') # will continue the simulation.
+        with self.batch():  # write configuration once.
+            self.set2(history=history)  # store if minimal or not
+            self.runStatus('continue') # will continue the simulation.
         self.setReadOnly(readOnly=True)  # no more writing to the configuration.
         return cont_list
 
@@ -930,14 +1501,14 @@ class ModelSimulation(object):
         perturb.append(datetime.datetime.now())
         perturb.extend(perturbList)
         history.update(perturb=perturb)
-        self.set2(history=history)
-        self.set2(perturbList=perturbList)
+        self.set2(history=history, perturbList=perturbList)  # one write.
         self.setReadOnly(readOnly=True)  # no more writing to the configuration.
         return perturbList
 
     def submit(self, runStatus=None):
         """
-        Provides full path to submit script.
+        Provides full path to submit script. When runStatus is None (as when the submission system calls it)
+          the simulation is recorded as SUBMITTED (see runState).
         :param runStatus (default None)-- If 'start' return path to new submit script (defined in self.SubmitFile)
                                       If 'continue' return path to continuation submit script (defined in self.SubmitFile)
                             If None then use value from runStatus method to chose.
@@ -946,6 +1517,7 @@ class ModelSimulation(object):
 
         if runStatus is None:
             newSubmit = self.runStatus()
+            self.runState(RunState.SUBMITTED)
         else:
             newSubmit = runStatus
         script = pathlib.Path(self.dirPath)/self.SubmitFiles[newSubmit]
@@ -1011,5 +1583,3 @@ class EddieModel(ModelSimulation):
         if studyConfig is not None:
             studyConfig.save(
                 filename=os.path.join(self.dirPath, "config.json"))  # write study configuration for fakemodel.
-
-
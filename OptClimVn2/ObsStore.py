@@ -0,0 +1,155 @@
+"""
+Provide a study-wide store of the observations of each model simulation.
+
+Each model simulation writes its observations to its own small file. Reading a large study means opening
+thousands of them. Post-processing (ModelSimulation.writeObs and so fake_fn, and comp_obs_xarray) also appends the
+observations it writes to a single SQLite file in the study directory -- one row per write. The last row for a
+simulation holds its observations, so the whole observation matrix comes back with one query.
+
+Appends are single SQLite transactions so SQLite's own file locking stops concurrent post-processing jobs
+interfering with each other. Observations are only appended if the store exists -- ModelSubmit creates it.
+Like the study index (see StudyIndex) the store is only a copy -- deleting it loses nothing.
+"""
+
+import collections
+import json
+import math
+import pathlib
+import sqlite3
+import time
+import uuid
+
+import pandas as pd
+
+__version__ = '0.1.0'
+
+# observations for a model simulation as held in the store.
+ObsEntry = collections.namedtuple('ObsEntry', ('dirName', 'name', 'time', 'obs'))
+
+
+class ObsStore(object):
+    """
+    Append-only (SQLite) store of model simulation observations. After the first read only rows appended since
+    the last read get read so reading is cheap.
+
+    Example use:
+        store = ObsStore(rootDir/'studyObs.sqlite', create=True)
+        store.append('zz001', {'OLR': 240.0, 'RSR': 100.0}, name='zz001')
+        store.obs() # dict of ObsEntry indexed by directory name.
+        store.frame(obsNames) # DataFrame of observations -- one row per simulation.
+    """
+
+    def __init__(self, path, create=False, timeout=60.0):
+        """
+        Create ObsStore instance.
+        :param path: path to the SQLite file that holds the store.
+        :param create (default False): If True create the (empty) store if it does not exist.
+        :param timeout (default 60): seconds to wait for other processes that are writing to the store.
+        """
+        self.path = pathlib.Path(path)
+        self.timeout = timeout
+        self._entries = dict()  # dirName -> ObsEntry
+        self._lastRow = 0  # last row read.
+        self._storeId = None  # id of the store read -- changes if the store is replaced.
+        if create:
+            self.create()
+
+    def create(self):
+        """
+        Create the store if it does not exist.
+        :return: nothing
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS obs (dirName TEXT, name TEXT, time REAL, obs TEXT)')
+                conn.execute('CREATE TABLE IF NOT EXISTS store (id TEXT)')  # unique id for this store.
+                if conn.execute('SELECT COUNT(*) FROM store').fetchone()[0] == 0:
+                    conn.execute('INSERT INTO store VALUES (?)', (uuid.uuid4().hex,))
+        finally:
+            conn.close()
+
+    def exists(self):
+        """
+        :return: True if the store exists.
+        """
+        return self.path.exists()
+
+    def append(self, dirName, obs, name=None):
+        """
+        Append observations for a model simulation. Nothing is done if the store does not exist.
+        :param dirName: name of the model simulation directory.
+        :param obs: observations -- dict (or pandas Series) of values indexed by observation name.
+        :param name (default None): name of the model simulation. If None dirName is used.
+        :return: True if appended, False if not.
+        """
+        if not self.exists():
+            return False
+        values = collections.OrderedDict()
+        for key, value in obs.items():  # convert to floats with NaN for missing (or non-scalar) values.
+            try:
+                values[str(key)] = float(value)
+            except (TypeError, ValueError):
+                values[str(key)] = math.nan
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        try:
+            with conn:  # one transaction.
+                conn.execute('INSERT INTO obs VALUES (?,?,?,?)',
+                             (dirName, dirName if name is None else name, time.time(), json.dumps(values)))
+        finally:
+            conn.close()
+        return True
+
+    def obs(self):
+        """
+        Read any new rows in the store.
+        :return: dict of latest ObsEntry indexed by directory name.
+        """
+        if not self.exists():
+            self._entries = dict()
+            self._lastRow = 0
+            self._storeId = None
+            return self._entries
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=self.timeout)
+        try:
+            storeId = conn.execute('SELECT id FROM store').fetchone()[0]
+            if storeId != self._storeId:  # store has been replaced (e.g. study cleaned) so start again.
+                self._entries = dict()
+                self._lastRow = 0
+                self._storeId = storeId
+            rows = conn.execute('SELECT rowid, dirName, name, time, obs FROM obs WHERE rowid > ? ORDER BY rowid',
+                                (self._lastRow,)).fetchall()
+        finally:
+            conn.close()
+        for rowid, dirName, name, t, obs in rows:
+            self._entries[dirName] = ObsEntry(dirName=dirName, name=name, time=t,
+                                              obs=json.loads(obs, object_pairs_hook=collections.OrderedDict))
+            self._lastRow = rowid
+        return self._entries
+
+    def entry(self, dirName):
+        """
+        :param dirName: name of the model simulation directory.
+        :return: latest ObsEntry for dirName or None if there is none.
+        """
+        return self.obs().get(dirName)
+
+    def frame(self, obsNames=None, dirNames=None):
+        """
+        Observations as a DataFrame.
+        :param obsNames (default None): names of observations wanted. If None all observations found.
+        :param dirNames (default None): directory names wanted (in order). If None all in the store (sorted).
+        :return: DataFrame indexed by simulation name with one column per observation (NaN when missing)
+            or None if nothing found.
+        """
+        entries = self.obs()
+        if dirNames is None:
+            dirNames = sorted(entries.keys())
+        rows = [entries[d] for d in dirNames if d in entries]
+        if len(rows) == 0:
+            return None
+        result = pd.DataFrame([pd.Series(e.obs, dtype=float) for e in rows], index=[e.name for e in rows])
+        if obsNames is not None:
+            result = result.reindex(columns=list(obsNames))
+        return result
@@ -0,0 +1,132 @@
+"""
+Provide a numeric index of parameter sets.
+
+ModelSubmit identifies model simulations by a key made from formatted strings of their parameters (see
+ModelSubmit.genKey) and finds exact matches with a dict lookup on that (remembered) key. ParamIndex answers the
+question that can not: "nearest existing parameter set within tolerance". It splits a parameter set into the float
+parameters, which are quantised (to the same number of significant figures as genKey uses) and held as a fixed
+width numpy array, and everything else. A KD-tree over the float parameters then finds the nearest.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+__version__ = '0.1.1'
+
+
+def quantise(values, sigFigs=4):
+    """
+    Round values to a number of significant figures exactly as ModelSubmit.genKey does -- by formatting
+      them with '%.<sigFigs>g' and converting back. (Rounding with np.round differs on boundaries
+      like 302.15 as binary floats are not exact.)
+    :param values: array like values to round
+    :param sigFigs (default 4): number of significant figures. 4 matches the default '%.4g' ModelSubmit.genKey uses.
+    :return: numpy array of rounded values
+    """
+    fpFmt = f'%.{sigFigs}g'
+    values = np.asarray(values, dtype=float)
+    result = np.array([float(fpFmt % v) for v in values.ravel()], dtype=float).reshape(values.shape)
+    result[result == 0] = 0.0  # no negative zeros.
+    return result
+
+
+class ParamIndex(object):
+    """
+    Numeric index of parameter sets. Parameter sets are given as an iterable of (name, value) pairs (see
+    ModelSubmit.keyParams). Float values are quantised and indexed numerically. Other values (strings, ints, lists,
+    paths etc) together with the names of the float parameters select a group -- only parameter sets in the
+    same group can match.
+
+    Example use:
+        index = ParamIndex(scales=dict(VF1=1.5, RHCRIT=0.2))
+        index.add(params, key)
+        index.lookup(params) # key for params (after quantisation) or None
+        index.nearest(params, 0.01) # key for closest params with all float params within 1% of their scale.
+    """
+
+    def __init__(self, sigFigs=4, scales=None):
+        """
+        Create ParamIndex instance
+        :param sigFigs (default 4): number of significant figures float parameters get quantised to.
+        :param scales (default None): dict of scales (e.g. range) for float parameters. Used to normalise
+            float parameters for nearest. Parameters not present have a scale of 1.
+        """
+        self.sigFigs = sigFigs
+        if scales is None:
+            scales = dict()
+        self.scales = dict(scales)
+        self._exact = dict()  # (group, quantised bytes) -> item
+        self._groups = dict()  # group -> dict with names, vectors, items & tree.
+
+    def __len__(self):
+        return len(self._exact)
+
+    def split(self, params):
+        """
+        Split a parameter set into its group and quantised float values.
+        :param params: iterable of (name, value) pairs.
+        :return: group (tuple) and numpy array of quantised float values.
+        """
+        names = []
+        values = []
+        other = []
+        for k, v in params:
+            if isinstance(v, float):
+                names.append(k)
+                values.append(v)
+            else:
+                other.append((k, repr(v)))
+        group = (tuple(names), tuple(other))
+        return group, quantise(values, self.sigFigs)
+
+    def add(self, params, item):
+        """
+        Add a parameter set to the index. If already present item replaces what was there.
+        :param params: iterable of (name, value) pairs.
+        :param item: item (e.g. key) to associate with params
+        :return: nothing
+        """
+        group, values = self.split(params)
+        exactKey = (group, values.tobytes())
+        info = self._groups.setdefault(group, dict(vectors=[], items=[], rows=dict(), tree=None))
+        row = info['rows'].get(exactKey)
+        if row is None:
+            info['rows'][exactKey] = len(info['items'])
+            info['vectors'].append(values)
+            info['items'].append(item)
+            info['tree'] = None  # will need rebuilding.
+        else:
+            info['items'][row] = item
+        self._exact[exactKey] = item
+
+    def lookup(self, params):
+        """
+        Find the item for a parameter set.
+        :param params: iterable of (name, value) pairs.
+        :return: item or None if not found.
+        """
+        group, values = self.split(params)
+        return self._exact.get((group, values.tobytes()))
+
+    def nearest(self, params, tol):
+        """
+        Find the item whose parameters are closest to params with all float parameters within tol.
+        :param params: iterable of (name, value) pairs.
+        :param tol: tolerance as a fraction of each parameters scale.
+        :return: item or None if nothing within tolerance.
+        """
+        group, values = self.split(params)
+        item = self._exact.get((group, values.tobytes()))
+        if item is not None:
+            return item
+        info = self._groups.get(group)
+        if info is None or len(group[0]) == 0:  # nothing in the group or no floats to compare.
+            return None
+        scale = np.array([self.scales.get(name, 1.0) for name in group[0]])
+        if info['tree'] is None:
+            info['tree'] = cKDTree(np.array(info['vectors']) / scale)
+        # Chebyshev (max) distance so every parameter is within tolerance.
+        dist, row = info['tree'].query(values / scale, p=np.inf, distance_upper_bound=tol)
+        if not np.isfinite(dist):
+            return None
+        return info['items'][row]
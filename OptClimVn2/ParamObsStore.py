@@ -0,0 +1,131 @@
+"""
+Provide columnar storage of parameters and observations.
+
+runSubmit stores the (raw) observations and parameters for every evaluation it makes (see ModelSubmit.paramObs).
+ParamObsStore holds them as one numpy array per column, pre-allocated and grown geometrically, with rows
+found from the key ModelSubmit already has for the parameters (see ModelSubmit.canonicalKey). Adding an evaluation is then a few array assignments and
+getting everything back is a single DataFrame construction.
+"""
+
+import numpy as np
+import pandas as pd
+
+__version__ = '0.1.2'
+
+
+class ParamObsStore(object):
+    """
+    Columnar store of observations and parameters. Each row is indexed by a (hashable) key for its parameters and has a name.
+    Columns holding floats are stored as float64 arrays (missing values are nan),
+    anything else (strings, ints, lists...) as object arrays (missing values are None).
+    A row has every column -- values never set for that row are missing.
+
+    Example use:
+        store = ParamObsStore()
+        store.add(key, obs, params) # obs & params are pandas series. obs.name names the row.
+        store.row(key) # series of obs & params for key.
+        store.frame() # everything as a DataFrame
+    """
+
+    def __init__(self, size=64):
+        """
+        Create ParamObsStore instance
+        :param size (default 64): initial number of rows allocated. Doubled each time it runs out.
+        """
+        self._size = size
+        self._nRows = 0
+        self._columns = dict()  # name -> array. Insertion order gives column order.
+        self._names = np.empty(size, dtype=object)  # row names.
+        self._rows = dict()  # key -> row
+
+    def __len__(self):
+        return self._nRows
+
+    def _grow(self):
+        """
+        Double the number of rows allocated.
+        """
+        self._size *= 2
+        self._names = np.resize(self._names, self._size)  # new values get overwritten before being used.
+        for name, values in self._columns.items():
+            new = self._empty(values.dtype)
+            new[:self._nRows] = values[:self._nRows]
+            self._columns[name] = new
+
+    def _empty(self, dtype):
+        """
+        :param dtype: dtype of column
+        :return: array of missing values, of length the allocated number of rows, for a column.
+        """
+        if dtype == np.float64:
+            return np.full(self._size, np.nan)
+        return np.full(self._size, None, dtype=object)
+
+    def _set(self, row, name, value):
+        """
+        Set a value, adding the column if needed and converting a float column to object if needed.
+        """
+        values = self._columns.get(name)
+        isFloat = isinstance(value, float)
+        if values is None:
+            values = self._empty(np.float64 if isFloat else object)
+            self._columns[name] = values
+        elif (values.dtype == np.float64) and not isFloat and (value is not None):
+            missing = np.isnan(values)
+            values = values.astype(object)
+            values[missing] = None
+            self._columns[name] = values
+        values[row] = value
+
+    def add(self, key, obs, params):
+        """
+        Add (or replace) observations and parameters for a parameter set.
+        :param key: hashable key that identifies the parameter set (see ModelSubmit.genKey)
+        :param obs: pandas series of observations. Its name is used as the row name.
+        :param params: pandas series of parameters.
+        :return: row number used.
+        """
+        row = self._rows.get(key)
+        if row is None:
+            if self._nRows == self._size:
+                self._grow()
+            row = self._nRows
+            self._nRows += 1
+            self._rows[key] = row
+        else:  # replacing so clear out what was there.
+            for values in self._columns.values():
+                values[row] = np.nan if values.dtype == np.float64 else None
+        self._names[row] = obs.name
+        for series in (obs, params):
+            for name, value in series.items():
+                self._set(row, name, value)
+        return row
+
+    def row(self, key):
+        """
+        Get observations and parameters for a parameter set.
+        :param key: key that identifies the parameter set.
+        :return: pandas series of observations and parameters.
+        """
+        row = self._rows.get(key)
+        if row is None:
+            raise KeyError(repr(key))
+        data = {name: values[row] for name, values in self._columns.items()}
+        return pd.Series(data, name=self._names[row])
+
+    def frame(self, columns=None):
+        """
+        Get everything as a dataframe.
+        :param columns (default None): columns wanted. If None all columns. Columns not present will be missing.
+        :return: DataFrame with one row per parameter set (indexed by row name) or None if nothing stored.
+        """
+        if self._nRows == 0:
+            return None
+        if columns is None:
+            columns = list(self._columns.keys())
+        n = self._nRows
+        data = dict()
+        for name in columns:
+            values = self._columns.get(name)
+            data[name] = values[:n] if values is not None else np.full(n, np.nan)
+        return pd.DataFrame(data, index=self._names[:n], columns=columns)
@@ -0,0 +1,205 @@
+"""
+Provide a registry of model simulations shared between studies.
+
+Different studies (with different observations or algorithms) often ask for model simulations that another study
+has already done. RunRegistry is a single SQLite file, shared by all studies that use it, which records every
+completed simulation by the content of its reference directory (see fingerprint) and its parameters.
+ModelSubmit (see ModelSubmit.model) looks simulations up in it before asking for a new one and, if it finds one,
+imports it into its own study rather than running the model again.
+
+Like the study index (see StudyIndex) the registry is only an index -- deleting it loses nothing but the chance
+to reuse simulations.
+"""
+
+import collections
+import hashlib
+import os
+import pathlib
+import pickle
+import sqlite3
+
+__version__ = '0.1.0'
+
+# information held for each registered model simulation.
+RegistryEntry = collections.namedtuple('RegistryEntry', ('dirPath', 'fingerprint', 'key', 'name', 'params', 'obs'))
+
+
+def treeStamp(dir):
+    """
+    Generate a stamp for all files below a directory which changes when any of them change.
+    :param dir: path to directory
+    :return: sorted tuple of (relative path, mtime in ns, size) for every file below dir.
+    """
+    dir = pathlib.Path(dir)
+    stamp = []
+    for root, dirs, files in os.walk(dir):
+        for name in files:
+            path = pathlib.Path(root) / name
+            st = os.stat(path)
+            stamp.append((path.relative_to(dir).as_posix(), st.st_mtime_ns, st.st_size))
+    return tuple(sorted(stamp))
+
+
+def fingerprint(dir, blockSize=2 ** 20):
+    """
+    Fingerprint the content of a directory. Directories holding the same files (names and contents) have the
+    same fingerprint wherever they are.
+    :param dir: path to directory
+    :param blockSize (default 1 Mbyte): size of blocks files are read in.
+    :return: sha256 hex digest of names and contents of all files below dir.
+    """
+    dir = pathlib.Path(dir)
+    hash = hashlib.sha256()
+    for relPath, mtime, size in treeStamp(dir):
+        hash.update(relPath.encode() + b'\0')
+        with open(dir / relPath, 'rb') as fp:
+            for block in iter(lambda: fp.read(blockSize), b''):
+                hash.update(block)
+        hash.update(b'\0')
+    return hash.hexdigest()
+
+
+class RunRegistry(object):
+    """
+    Persistent (SQLite) registry of completed model simulations. Each entry is indexed by the path to the simulation
+    directory and holds the fingerprint of its reference directory, its key (see ModelSubmit.registryKey),
+    name, parameters and observations.
+    Reference directory fingerprints are also kept (with a treeStamp) so reference directories only get
+    read again when they change.
+
+    Example use:
+        registry = RunRegistry(path)
+        fp = registry.refDirFingerprint(refDir)
+        registry.register(RegistryEntry(dirPath, fp, key, name, params, obs))
+        registry.find(fp, key) # list of RegistryEntry with same fingerprint and key.
+        registry.commit()
+    """
+    _schema = 1  # version of the table layout. Mismatch means registry gets rebuilt.
+
+    def __init__(self, path, readOnly=False, timeout=60.0):
+        """
+        Create RunRegistry instance. Nothing is opened until needed.
+        :param path: path to the SQLite file that holds the registry.
+        :param readOnly (default False): If True never write to the registry.
+        :param timeout (default 60): seconds to wait for other studies that are writing to the registry.
+        """
+        self.path = pathlib.Path(path)
+        self.readOnly = readOnly
+        self.timeout = timeout
+        self._conn = None
+        self._fingerprints = dict()  # refDir -> fingerprint for refDirs seen by this instance.
+
+    def _connect(self):
+        """
+        Open (and if needed create) the registry.
+        :return: sqlite3 connection or None if no registry available.
+        """
+        if self._conn is not None:
+            return self._conn
+
+        if self.readOnly:
+            if not self.path.exists():
+                return None
+            self._conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, timeout=self.timeout)
+            return self._conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=self.timeout)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != self._schema:  # old (or new) layout -- just throw it away and start again.
+            self._conn.execute('DROP TABLE IF EXISTS runs')
+            self._conn.execute('DROP TABLE IF EXISTS refDirs')
+            self._conn.execute(f'PRAGMA user_version = {self._schema:d}')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS runs ('
+                           'dirPath TEXT PRIMARY KEY, fingerprint TEXT, key TEXT, name TEXT, params BLOB, obs BLOB)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS runsKey ON runs (fingerprint, key)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS refDirs (refDir TEXT PRIMARY KEY, stamp TEXT, fingerprint TEXT)')
+        self._conn.commit()
+        return self._conn
+
+    def refDirFingerprint(self, refDir):
+        """
+        Fingerprint a reference directory (see fingerprint). Fingerprints are kept in the registry and only
+        recomputed when the files in the directory change.
+        :param refDir: path to reference directory
+        :return: fingerprint or None if refDir is None or does not exist.
+        """
+        if refDir is None:
+            return None
+        refDir = os.path.abspath(os.path.expandvars(os.path.expanduser(refDir)))
+        if refDir in self._fingerprints:
+            return self._fingerprints[refDir]
+        if not os.path.isdir(refDir):
+            return None
+        stamp = repr(treeStamp(refDir))
+        conn = self._connect()
+        fp = None
+        if conn is not None:
+            row = conn.execute('SELECT stamp, fingerprint FROM refDirs WHERE refDir = ?', (refDir,)).fetchone()
+            if row is not None and row[0] == stamp:
+                fp = row[1]
+        if fp is None:
+            fp = fingerprint(refDir)
+            if not self.readOnly:
+                conn.execute('INSERT OR REPLACE INTO refDirs VALUES (?,?,?)', (refDir, stamp, fp))
+                conn.commit()
+        self._fingerprints[refDir] = fp
+        return fp
+
+    def register(self, entry):
+        """
+        Add (or replace) a model simulation. Call commit to make the change permanent.
+        :param entry: RegistryEntry to be stored.
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?)',
+                     (str(entry.dirPath), entry.fingerprint, repr(entry.key), entry.name,
+                      pickle.dumps(entry.params), pickle.dumps(entry.obs)))
+
+    def find(self, fingerprint, key):
+        """
+        Find model simulations with a reference directory fingerprint and key
+        :param fingerprint: fingerprint of the reference directory
+        :param key: key for the parameters
+        :return: list of RegistryEntry (empty if none found).
+        """
+        conn = self._connect()
+        if conn is None:
+            return []
+        result = []
+        for row in conn.execute('SELECT dirPath, fingerprint, key, name, params, obs FROM runs '
+                                'WHERE fingerprint = ? AND key = ? ORDER BY dirPath', (fingerprint, repr(key))):
+            dirPath, fp, key, name, params, obs = row
+            result.append(RegistryEntry(dirPath=dirPath, fingerprint=fp, key=key, name=name,
+                                        params=pickle.loads(params), obs=pickle.loads(obs)))
+        return result
+
+    def remove(self, dirPaths):
+        """
+        Remove model simulations. Call commit to make the change permanent.
+        :param dirPaths: iterable of paths to simulation directories.
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        conn.executemany('DELETE FROM runs WHERE dirPath = ?', [(str(d),) for d in dirPaths])
+
+    def commit(self):
+        """
+        Make changes permanent.
+        """
+        if self._conn is not None and not self.readOnly:
+            self._conn.commit()
+
+    def close(self):
+        """
+        Close the registry (committing any changes). It will be reopened if used again.
+        """
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
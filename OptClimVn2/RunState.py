@@ -0,0 +1,196 @@
+"""
+Provide a per-study table of the lifecycle state of each model simulation.
+
+Without it the only way to tell what is queued, running or failed is to read every simulation directory.
+Each model simulation moves through the states:
+   CREATED -> SUBMITTED -> RUNNING -> POSTPROCESSING -> DONE (or FAILED)
+and goes back to CREATED when it is set up to be ran again (see ModelSimulation.runStatus).
+
+The table is a text file in the study directory with one line -- directory name, state and time (seconds since
+1970) -- appended for every change of state. Appending a short line is atomic so the model's own scripts
+(see HadCM3.createPostProcessFile) can record changes with echo. The last line for a directory gives its state.
+Changes are only recorded if the file exists -- ModelSubmit creates it.
+Tables are shared (see table) so a study's file is only read once per process, and ModelSubmit compacts the
+file (see StateTable.compact) so it does not grow without limit.
+"""
+
+import collections
+import os
+import pathlib
+import threading
+import time
+
+__version__ = '0.2.0'
+
+CREATED = 'CREATED'
+SUBMITTED = 'SUBMITTED'
+RUNNING = 'RUNNING'
+POSTPROCESSING = 'POSTPROCESSING'
+DONE = 'DONE'
+FAILED = 'FAILED'
+states = (CREATED, SUBMITTED, RUNNING, POSTPROCESSING, DONE, FAILED)  # in lifecycle order.
+inProgress = (SUBMITTED, RUNNING, POSTPROCESSING)  # states where observations might still appear.
+finished = (DONE, FAILED)  # states where the model and its post-processing have stopped.
+
+_tables = dict()  # path -> StateTable. See table.
+_tablesLock = threading.Lock()
+
+
+def table(path, create=False):
+    """
+    Get the (shared) StateTable for a file. Creating a StateTable re-reads the whole file so use this rather
+      than making a new one every time a state is wanted.
+    :param path: path to the file holding the table.
+    :param create (default False): If True create the (empty) file if it does not exist.
+    :return: StateTable
+    """
+    path = pathlib.Path(path).absolute()
+    with _tablesLock:
+        result = _tables.get(path)
+        if result is None:
+            result = StateTable(path)
+            _tables[path] = result
+    if create and not path.exists():
+        path.touch()
+    return result
+
+
+class StateTable(object):
+    """
+    Table of model simulation states for a study. After the first call only lines appended since the last call
+    get read so querying is cheap.
+
+    Example use:
+        table = StateTable(rootDir/'runState.log', create=True)
+        table.set('zz001', RunState.SUBMITTED)
+        table.state('zz001') # 'SUBMITTED'
+        table.counts() # number of simulations in each state.
+    """
+
+    def __init__(self, path, create=False):
+        """
+        Create StateTable instance.
+        :param path: path to the file holding the table.
+        :param create (default False): If True create the (empty) file if it does not exist.
+        """
+        self.path = pathlib.Path(path)
+        if create and not self.path.exists():
+            self.path.touch()
+        self._states = dict()  # dirName -> (state, time)
+        self._offset = 0  # how far into the file has been read.
+        self._inode = None  # inode of the file read. A new one means the file has been replaced.
+        self._nLines = 0  # number of lines read.
+        self._lock = threading.Lock()
+
+    def set(self, dirName, state):
+        """
+        Record the state of a model simulation. Nothing is done if the file does not exist.
+        :param dirName: name of the model simulation directory.
+        :param state: new state. Must be one of states.
+        :return: True if recorded, False if not.
+        """
+        if state not in states:
+            raise ValueError(f"Unknown state {state}")
+        if not self.path.exists():
+            return False
+        line = f"{dirName} {state} {time.time():.0f}\n"
+        with open(self.path, 'a') as fp:  # append is atomic for short lines.
+            fp.write(line)
+        return True
+
+    def entries(self):
+        """
+        Read any new lines in the table.
+        :return: dict of (state, time) indexed by directory name.
+        """
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+                size, inode = st.st_size, st.st_ino
+            except FileNotFoundError:
+                size, inode = 0, None
+            if size < self._offset or inode != self._inode:  # file replaced (e.g. study cleaned) so start again.
+                self._states = dict()
+                self._offset = 0
+                self._nLines = 0
+                self._inode = inode
+            if size > self._offset:
+                with open(self.path, 'rb') as fp:
+                    fp.seek(self._offset)
+                    data = fp.read(size - self._offset)
+                self._offset += self._parse(data)
+            return self._states
+
+    def _parse(self, data):
+        """
+        Update states from lines of the table.
+        :param data: bytes read from the table.
+        :return: number of bytes used -- only complete lines are used as the last might still be being written.
+        """
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode().splitlines():
+            self._nLines += 1
+            fields = line.split()
+            if len(fields) != 3 or fields[1] not in states:
+                continue  # ignore anything odd.
+            self._states[fields[0]] = (fields[1], float(fields[2]))
+        return end
+
+    def compact(self, minLines=1000):
+        """
+        Rewrite the file with just the last line for each model simulation. The new file is written next to the
+          old one and renamed over it. Lines appended to the old file while that happens are copied over so
+          nothing is lost unless a writer holds the old file open for longer than compaction takes.
+        :param minLines (default 1000): Only compact if the file has at least this many lines and more than
+            twice as many lines as model simulations.
+        :return: True if compacted, False if not.
+        """
+        entries = self.entries()
+        if self._nLines < max(minLines, 2 * len(entries)):
+            return False
+        with self._lock:
+            tmp = self.path.parent / f'.{self.path.name}.{os.getpid()}.tmp'
+            with open(self.path, 'rb') as old:
+                if os.fstat(old.fileno()).st_ino != self._inode:
+                    return False  # replaced since read -- leave it.
+                old.seek(self._offset)
+                extra = old.read()
+                end = extra.rfind(b'\n') + 1
+                self._parse(extra[:end])
+                lines = [f"{dirName} {state} {t:.0f}\n" for dirName, (state, t) in self._states.items()]
+                with open(tmp, 'w') as fp:
+                    fp.writelines(lines)
+                os.replace(tmp, self.path)
+                extra = extra[end:] + old.read()  # anything appended to the old file whilst compacting.
+            end = extra.rfind(b'\n') + 1
+            if end > 0:
+                with open(self.path, 'ab') as fp:
+                    fp.write(extra[:end])
+            self._states = dict()  # re-read the new file.
+            self._offset = 0
+            self._nLines = 0
+            self._inode = None
+        self.entries()
+        return True
+
+    def state(self, dirName):
+        """
+        :param dirName: name of the model simulation directory.
+        :return: state of the model simulation or None if none recorded.
+        """
+        return self.entries().get(dirName, (None, None))[0]
+
+    def states(self):
+        """
+        :return: dict of state indexed by directory name.
+        """
+        return {dirName: state for dirName, (state, t) in self.entries().items()}
+
+    def counts(self):
+        """
+        :return: ordered dict of number of model simulations in each state (in lifecycle order).
+        """
+        counts = collections.OrderedDict([(state, 0) for state in states])
+        for state, t in self.entries().values():
+            counts[state] += 1
+        return counts
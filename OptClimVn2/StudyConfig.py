@@ -453,12 +453,12 @@ class OptClimConfig(dictFile):
     def cacheFile(self):
         """
         Get the pathname relative to the study directory of the cache file.
-        This file holds information (directories in current design) on model simulation directories.
+        This file holds the study index (see StudyIndex) of the model simulation directories.
         :return:  filename relative to studyDir
         """
 
-        fileStore = self.Config['begin'].get('studyCacheFile', 'cache_file.json')
-        if fileStore is None: fileStore = 'cache_file.json'
+        fileStore = self.Config['begin'].get('studyCacheFile', 'cache_file.db')
+        if fileStore is None: fileStore = 'cache_file.db'
         return fileStore
 
     def targets(self, targets=None, obsNames=None, scale=False):
@@ -1543,6 +1543,22 @@ class OptClimConfig(dictFile):
 
         return self.getv('maxDigits', default=None)  # nothing defined -- make it None.
 
+    def nameRadix(self, value=None):
+        """
+        Return (and optionally set) the base used for the numeric part of model run names.
+        10 gives digits only, 36 adds a-z and 62 adds A-Z as well. With 3 digits these allow
+        999, 46,655 and 238,327 names respectively. 62 needs a case sensitive filesystem.
+
+        If not defined return 10.
+
+        :param value -- value to be set -- default is not to set it
+        """
+
+        if value is not None:
+            self.setv('nameRadix', value)
+
+        return self.getv('nameRadix', default=10)  # nothing defined -- make it 10.
+
     def copy(self, filename=None):
         """
         :param filename (optional default None): Name of filename to save to.
@@ -1750,13 +1766,12 @@ class OptClimConfigVn2(OptClimConfig):
     def cacheFile(self):
         """
         Get the pathname relative to the study directory of the cache file.
-        This file holds information (directories in current design) on model simulation directories.
+        This file holds the study index (see StudyIndex) of the model simulation directories.
         :return:  filename relative to studyDir
-        TOD: Don't think this used so remove it.
         """
 
-        fileStore = self.Config.get('studyCacheFile', 'cache_file.json')
-        if fileStore is None: fileStore = 'cache_file.json'
+        fileStore = self.Config.get('studyCacheFile', 'cache_file.db')
+        if fileStore is None: fileStore = 'cache_file.db'
         return fileStore
 
     # do some plotting
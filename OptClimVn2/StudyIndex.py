@@ -0,0 +1,217 @@
+"""
+Provide a persistent index of the model simulations in a study directory.
+
+Reading a study means unpickling the configuration and opening the observations of every model simulation in it.
+For studies with thousands of simulations that dominates the cost of each iteration of the framework. StudyIndex
+keeps, in a single SQLite file in the study directory, what was read from each simulation directory together with
+the modification times (and sizes) of the files it was read from. Only directories where those have changed need
+to be read again.
+
+The index also holds a ledger of the cost of each simulation (see ModelSubmit.runCost) so costs are only computed
+for new simulations.
+
+The index is a cache -- deleting it is always safe. It is rebuilt the next time the study is read.
+"""
+
+import collections
+import os
+import pathlib
+import pickle
+import sqlite3
+
+__version__ = '0.1.0'
+
+# information held for each model simulation directory.
+IndexEntry = collections.namedtuple('IndexEntry',
+                                    ('dirName', 'name', 'key', 'params', 'refDir', 'obs', 'obsFile', 'status',
+                                     'stamp'))
+
+
+def fileStamp(*paths):
+    """
+    Generate a stamp for files which changes when any of them change.
+    :param paths: paths to files
+    :return: tuple of (mtime in ns, size) for each file. Missing files give None.
+    """
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class StudyIndex(object):
+    """
+    Persistent (SQLite) index of model simulations in a study directory. Each entry is indexed by the
+    name of the simulation directory (relative to the study directory) and holds the parameters, observations, key,
+    status and file stamps (see fileStamp) for that simulation.
+
+    Parameters and observations are stored pickled so they come back exactly as they were read.
+
+    Example use:
+        index = StudyIndex(rootDir/config.cacheFile())
+        entries = index.entries() # dict of IndexEntry indexed by dirName
+        index.update(entry) # add/replace an entry
+        index.commit() # and make changes permanent.
+    """
+    _schema = 2  # version of the table layout. Mismatch means index gets rebuilt.
+
+    def __init__(self, path, readOnly=False):
+        """
+        Create StudyIndex instance. Nothing is opened until needed.
+        :param path: path to the SQLite file that holds the index.
+        :param readOnly (default False): If True never write to the index.
+            If the index file does not exist then it will appear empty.
+        """
+        self.path = pathlib.Path(path)
+        self.readOnly = readOnly
+        self._conn = None
+
+    def _connect(self):
+        """
+        Open (and if needed create) the index.
+        :return: sqlite3 connection or None if no index available.
+        """
+        if self._conn is not None:
+            return self._conn
+
+        if self.readOnly:
+            if not self.path.exists():
+                return None
+            self._conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            return self._conn
+
+        self._conn = sqlite3.connect(self.path)
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != self._schema:  # old (or new) layout -- just throw it away and start again.
+            self._conn.execute('DROP TABLE IF EXISTS runs')
+            self._conn.execute('DROP TABLE IF EXISTS costs')
+            self._conn.execute(f'PRAGMA user_version = {self._schema:d}')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS runs ('
+                           'dirName TEXT PRIMARY KEY, name TEXT, key TEXT, params BLOB, refDir TEXT,'
+                           'obs BLOB, obsFile TEXT, status TEXT, stamp TEXT)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS costs ('
+                           'dirName TEXT PRIMARY KEY, name TEXT, cost REAL, signature TEXT)')
+        self._conn.commit()
+        return self._conn
+
+    def entries(self):
+        """
+        Read all entries from the index
+        :return: dict of IndexEntry indexed by dirName
+        """
+        conn = self._connect()
+        result = dict()
+        if conn is None:
+            return result
+        for row in conn.execute('SELECT dirName, name, key, params, refDir, obs, obsFile, status, stamp FROM runs'):
+            dirName, name, key, params, refDir, obs, obsFile, status, stamp = row
+            result[dirName] = IndexEntry(dirName=dirName, name=name, key=key, params=pickle.loads(params),
+                                         refDir=refDir, obs=pickle.loads(obs), obsFile=obsFile,
+                                         status=status, stamp=stamp)
+        return result
+
+    def entry(self, dirName):
+        """
+        Read a single entry from the index
+        :param dirName: name of the simulation directory
+        :return: IndexEntry or None if not found.
+        """
+        conn = self._connect()
+        if conn is None:
+            return None
+        row = conn.execute('SELECT dirName, name, key, params, refDir, obs, obsFile, status, stamp FROM runs '
+                           'WHERE dirName = ?', (dirName,)).fetchone()
+        if row is None:
+            return None
+        dirName, name, key, params, refDir, obs, obsFile, status, stamp = row
+        return IndexEntry(dirName=dirName, name=name, key=key, params=pickle.loads(params),
+                          refDir=refDir, obs=pickle.loads(obs), obsFile=obsFile, status=status, stamp=stamp)
+
+    def update(self, entry):
+        """
+        Add (or replace) an entry. Call commit to make the change permanent.
+        :param entry: IndexEntry to be stored. stamp should be as generated by fileStamp
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        refDir = entry.refDir
+        if refDir is not None:
+            refDir = str(refDir)
+        conn.execute('INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?)',
+                     (entry.dirName, entry.name, repr(entry.key), pickle.dumps(entry.params),
+                      refDir, pickle.dumps(entry.obs), entry.obsFile, entry.status, repr(entry.stamp)))
+
+    def remove(self, dirNames):
+        """
+        Remove entries (and their costs). Call commit to make the change permanent.
+        :param dirNames: iterable of directory names to remove
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        dirNames = [(d,) for d in dirNames]
+        conn.executemany('DELETE FROM runs WHERE dirName = ?', dirNames)
+        conn.executemany('DELETE FROM costs WHERE dirName = ?', dirNames)
+
+    def costs(self, signature):
+        """
+        Read the cost ledger.
+        :param signature: signature of the cost calculation (see ModelSubmit.costSignature).
+            Only costs computed with it are returned.
+        :return: dict of (name, cost) indexed by dirName
+        """
+        conn = self._connect()
+        result = dict()
+        if conn is None:
+            return result
+        for dirName, name, cost in conn.execute('SELECT dirName, name, cost FROM costs WHERE signature = ?',
+                                                (signature,)):
+            result[dirName] = (name, cost)
+        return result
+
+    def updateCosts(self, signature, costs):
+        """
+        Add (or replace) costs in the ledger. Call commit to make the change permanent.
+        :param signature: signature of the cost calculation.
+        :param costs: iterable of (dirName, name, cost)
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        conn.executemany('INSERT OR REPLACE INTO costs VALUES (?,?,?,?)',
+                         [(dirName, name, float(cost), signature) for dirName, name, cost in costs])
+
+    def removeCosts(self, dirNames):
+        """
+        Remove costs from the ledger. Call commit to make the change permanent.
+        :param dirNames: iterable of directory names whose costs are to be removed.
+        :return: nothing
+        """
+        if self.readOnly:
+            return
+        conn = self._connect()
+        conn.executemany('DELETE FROM costs WHERE dirName = ?', [(d,) for d in dirNames])
+
+    def commit(self):
+        """
+        Make changes permanent.
+        """
+        if self._conn is not None and not self.readOnly:
+            self._conn.commit()
+
+    def close(self):
+        """
+        Close the index (committing any changes). It will be reopened if used again.
+        """
+        if self._conn is not None:
+            self.commit()
+            self._conn.close()
+            self._conn = None
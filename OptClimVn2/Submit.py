@@ -7,17 +7,30 @@ It is a place that handles all the models.
 
 """
 
+import collections
+import concurrent.futures
 import copy
 import functools
+import hashlib
+import json
 import logging
 import os
 import pathlib  # needs python 3.6+
 import shutil
+import stat
+import subprocess
+import tempfile
 
 import numpy as np
 import pandas as pd
 
 import optClimLib
+import ParamIndex
+import ParamObsStore
+import ObsStore
+import RunRegistry
+import RunState
+import StudyIndex
 import sys
 
 # check we are version 3.7 or above.
@@ -28,6 +41,158 @@ if (sys.version_info.major < 3) or (sys.version_info.major == 3 and sys.version_
 __version__ = '0.6.0'
 
 
+def dirStamp(modelFn, dir, ppOutputFile):
+    """
+    Stamp the files a model simulation is read from. See StudyIndex.fileStamp
+    :param modelFn: function (normally a class) that creates model instances.
+    :param dir: path to model simulation directory
+    :param ppOutputFile: name of the post-processing output file
+    :return: stamp
+    """
+    dir = pathlib.Path(dir)
+    cfgFiles = getattr(modelFn, 'configFiles', lambda: ['simulationConfig.cfg'])()
+    return StudyIndex.fileStamp(*[dir / cfgFile for cfgFile in cfgFiles], dir / ppOutputFile)
+
+
+def readModel(modelFn, dir, obsNames=None, ppOutputFile=None, verbose=False, record=False):
+    """
+    Read a model simulation from a directory. Changes nothing so safe to run in a thread or process pool.
+    :param modelFn: function (normally a class) that creates model instances.
+    :param dir: path to model simulation directory
+    :param obsNames: observations wanted
+    :param ppOutputFile: name of the post-processing output file
+    :param verbose (default False): If True be verbose
+    :param record (default False): If True, and modelFn provides readRecord, return a RunRecord
+        for simulations that have all their observations. The full model is only read
+        for simulations that are missing observations as they might need to be continued, perturbed or restarted.
+    :return: stamp (taken before reading), model and observations. model and obs are None if reading failed.
+    """
+    dir = pathlib.Path(dir)
+    # stamp files before reading them so changes while reading get picked up next time.
+    stamp = dirStamp(modelFn, dir, ppOutputFile)
+    try:
+        if verbose:
+            print("Reading from %s" % (dir))
+        # configuration overrides what was in the model when created...
+        if record and hasattr(modelFn, 'readRecord'):
+            info = modelFn.readRecord(dir, obsNames=obsNames, ppOutputFile=ppOutputFile)
+            obs = info['obs']
+            if (obs is not None) and all([v is not None for v in obs.values()]):  # got all obs
+                loader = functools.partial(modelFn, dir, obsNames=obsNames, ppOutputFile=ppOutputFile)
+                model = RunRecord(info['name'], info['dirPath'], info['params'], obs,
+                                  refDirPath=info['refDirPath'], loader=loader)
+                return stamp, model, obs
+        model = modelFn(dir, obsNames=obsNames, ppOutputFile=ppOutputFile)
+        obs = model.getObs()
+    except (IOError, EOFError):  # likely failed to read something so error!
+        # IOError when no config file found; EOFError when config file corrupted.
+        if verbose:
+            print("Failed to read from %s" % (dir))
+        return stamp, None, None
+
+    return stamp, model, obs
+
+
+class RunRecord(object):
+    """
+    Light-weight stand-in for a completed model simulation. ModelSubmit stores these, rather than full models,
+    for simulations read from the study index (see StudyIndex) or from a directory.
+    Provides the methods ModelSubmit and its users need (name, getParams, getObs & refDirPath) from what was stored.
+    Anything else is passed through to the full model which is created, by calling loader, the first time it is needed.
+    """
+    __slots__ = ('_name', 'dirPath', '_params', '_obs', '_refDirPath', '_loader', '_model')
+
+    def __init__(self, name, dirPath, params, obs, refDirPath=None, loader=None):
+        """
+        Create RunRecord instance
+        :param name: name of the model simulation
+        :param dirPath: path to the model simulation directory
+        :param params: dict of parameters
+        :param obs: dict of observations
+        :param refDirPath (optional -- default None): reference directory
+        :param loader (optional -- default None): function with no arguments which returns the full model.
+        """
+        self._name = name
+        self.dirPath = dirPath
+        self._params = params
+        self._obs = obs
+        self._refDirPath = refDirPath
+        self._loader = loader
+        self._model = None
+
+    def __getattr__(self, item):
+        """
+        Pass through to the full model anything not provided by the record.
+        """
+        if item.startswith('_'):  # private attributes are never passed through.
+            raise AttributeError(item)
+        return getattr(self.model(), item)
+
+    def __eq__(self, other):
+        """
+        Equality -- equal if the refDirs, parameters and obs are the same.
+        :param other: an other model (or record) to compare with
+        :return: True if equal, False if not. NotImplemented if other is not a model or record.
+        """
+        if not all(callable(getattr(other, m, None)) for m in ('refDirPath', 'getParams', 'getObs')):
+            return NotImplemented
+        return (self.refDirPath() == other.refDirPath()) and (self.getParams() == other.getParams()) and \
+               (self.getObs() == other.getObs())
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def model(self):
+        """
+        :return: the full model -- created the first time it is asked for.
+        """
+        if self._model is None:
+            if self._loader is None:
+                raise ValueError(f"No way of loading model for {self._name}")
+            self._model = self._loader()
+        return self._model
+
+    def name(self):
+        """
+        :return: the name of the model simulation
+        """
+        return self._name
+
+    def refDirPath(self):
+        """
+        :return: the reference directory (or None)
+        """
+        return self._refDirPath
+
+    def getParams(self, verbose=False, params=None, series=False):
+        """
+        Extract the parameter values. See ModelSimulation.getParams for documentation.
+        Once the full model exists it is used as it might have been changed.
+        """
+        if self._model is not None:
+            return self._model.getParams(verbose=verbose, params=params, series=series)
+        p = self._params.copy()
+        if params is not None:  # enforce particular order and select reqd values.
+            p = {pp: p.get(pp) for pp in params}
+        if series:
+            p = pd.Series(p)
+        return p
+
+    def getObs(self, verbose=False, series=False, justRead=False):
+        """
+        Extract the observations. See ModelSimulation.getObs for documentation.
+        Once the full model exists it is used as it might have been changed.
+        """
+        if self._model is not None:
+            return self._model.getObs(verbose=verbose, series=series, justRead=justRead)
+        obs = self._obs
+        if obs is not None:
+            obs = obs.copy()
+        if series:
+            obs = pd.Series(obs).rename(self._name)
+        return obs
+
+
 # TODO:Current design fixed_params are special and fixed per instance of ModelSubmit
 #    but we could (in theory) have multiple runs with different fixed_params in a directory.
 #    Which would be read in when we read the directory. One problem is that if they are in a pandas array
@@ -38,6 +203,10 @@ class ModelSubmit(object):
     """
     provides methods to support working out which models need to be submitted
     """
+    nameCounterFile = 'nameCounter.dat'  # file in rootDir where last number used for names is stored.
+    lockFile = 'study.lock'  # file in rootDir locked while creating new model simulations.
+    trashDir = '.trash'  # hidden directory in rootDir where clean moves directories before deleting them.
+    keyCacheSize = 10000  # maximum number of parameter sets whose keys are remembered. See canonicalKey.
 
     # so replacing modelDirs functionality. (rootDir & config would then be compulsory)
     # TODO add a new argument -- restart (or clean) which if set would remove all stuff in rootDir
@@ -46,7 +215,9 @@ class ModelSubmit(object):
 
     def __init__(self, config, modelFn, submitFn, fakeFn=None,
                  rootDir=None, ignoreKeys=None, verbose=False, readOnly=False, renameRefDir=None,
-                 keyFn=None, noObs='fail', restart=False):
+                 keyFn=None, noObs='fail', restart=False, useIndex=True,
+                 readWorkers=1, readPool='thread', useRecords=True, paramTol=None,
+                 createWorkers=1, createPool='process', registry=None):
         """
         Create ModelSubmit instance
         :param config: configuration information
@@ -70,6 +241,26 @@ class ModelSubmit(object):
             Stored in self. see readModelDir for description.
 
         :param restart (default False).If True clean up use the clean method (see doc)
+        :param useIndex (default True). If True use (and maintain) the study index (see StudyIndex) in
+            rootDir/config.cacheFile() so only simulation directories that have changed get read.
+        :param readWorkers (default 1). Number of workers used to read model simulation directories. If > 1
+           directories are read in parallel. See readDir.
+        :param readPool (default 'thread'). Kind of pool used when readWorkers > 1 -- 'thread' or 'process'.
+           'process' requires models to be picklable.
+        :param useRecords (default True). If True store completed simulations as RunRecords which only hold
+            name, parameters, obs and reference directory. The full model is created when something else is needed.
+        :param paramTol (default None). If not None then model() will return the nearest existing model
+            provided all its float parameters are within paramTol (as a fraction of the parameter range) of
+            those asked for. Lets near duplicate parameter sets reuse existing simulations.
+        :param createWorkers (default 1). Number of workers used to create new model simulations in submit.
+            If > 1 they are created concurrently.
+        :param createPool (default 'process'). Kind of pool used when createWorkers > 1 -- 'process' or 'thread'.
+            Model creation (e.g. HadCM3 editing files with fileinput) is not always thread safe so 'process' is
+            the default.
+        :param registry (default None). If not None path to a run registry (see RunRegistry) shared between studies.
+            Completed simulations are registered in it and, before asking for a new simulation, model() looks
+            for one with the same reference directory content and parameters made by any study. If found
+            it is imported (see importModel) rather than ran again.
 
         :return: instance of ModelSubmit
 
@@ -95,10 +286,15 @@ class ModelSubmit(object):
             self.fakeFn = None
             self.submitFn = None
 
+        self._ignoreKeys = frozenset()
+        self._keyFn = None
+        self._renameRefDir = None
         self.renameRefDir = renameRefDir
         self.keyFn = keyFn
 
         self.readOnly = readOnly
+        self._nameNumbers = dict()  # createDir -> (counterName, number) for names given but not used. See nameUsed.
+        self._dirsRead = set()  # names of directories in rootDir already read or created. See readNewDirs.
         if ignoreKeys is None:
             self.ignoreKeys = ['runCode', 'runTime', 'RUNID']  # values to ignore when generating keys.#
             # TODO consider generalising -- might be too specific and maybe best to come from model gen fn in some way.
@@ -110,6 +306,9 @@ class ModelSubmit(object):
         self.verbose = verbose
         # store models.
         self._models = dict()  # initialise ordered collection where models stored.
+        self.paramTol = paramTol
+        self.createWorkers = createWorkers
+        self.createPool = createPool
 
         # would like to be able to (re)set the configuration.
         # All config (related code is here).
@@ -119,12 +318,35 @@ class ModelSubmit(object):
         # include refDir in the _fixParams if defined
         if self.refDir is not None:
             self._fixParams.update(refDir=self.refDir)
+        # numeric index of model parameters -> keys. Float params normalised by their ranges for nearest lookups.
+        paramRange = self.config.paramRanges()
+        scales = (paramRange.loc['maxParam', :] - paramRange.loc['minParam', :]).to_dict()
+        self._paramIndex = ParamIndex.ParamIndex(scales=scales)
 
         if rootDir is None:  # no rootDir defined. Use the config.
             self.rootDir = pathlib.Path.cwd() / config.name()  # default path
         else:
             self.rootDir = pathlib.Path(rootDir)  # make sure it is a Path.
         self.rootDir.mkdir(parents=True, exist_ok=True)
+        self.readWorkers = readWorkers
+        self.readPool = readPool
+        self.useRecords = useRecords
+        self._index = None
+        if useIndex:
+            self._index = StudyIndex.StudyIndex(self.rootDir / config.cacheFile(), readOnly=readOnly)
+        self._registry = None
+        if registry is not None:
+            self._registry = RunRegistry.RunRegistry(registry, readOnly=readOnly)
+        self._cleanFutures = dict()  # future -> path for paths being deleted in the background by clean.
+        self._costSignature = None  # cost ledger (see runCost) -- signature, costs and best so far.
+        self._costLedger = dict()
+        self._bestCost = None
+        # run states (see RunState). Table only created when study can be changed. clean removes it and
+        # submit then creates it again.
+        self._runStates = RunState.table(self.rootDir / getattr(modelFn, 'runStateFile', 'runState.log'),
+                                         create=not readOnly)
+        # study observation store (see ObsStore). Created, like the run state table, by submit.
+        self._obsStore = ObsStore.ObsStore(self.rootDir / getattr(modelFn, 'obsStoreFile', 'studyObs.sqlite'))
         # potentially clean up dir.
         if restart:
             self.clean()  # that cleans up. Nothing to read either.
@@ -133,28 +355,116 @@ class ModelSubmit(object):
 
         return  # and all done
 
-    def clean(self):
+    def clean(self, dryRun=False, wait=False, workers=4):
         """
         Clean out rootDir by removing all files and directories in it.
         However, .json files in the rootDir will not be removed and if rootDir.name is Configurations then
          an error will be triggered. This is to avoid accidental deletion.
+        Directories are renamed into rootDir/trashDir (so are gone from the study straight away) and then deleted,
+         in parallel, in the background. Anything left in the trash by an earlier clean gets deleted too.
+         Use cleanProgress to see how deletion is going and waitClean to wait for it to finish.
+         Python waits for the deletion to finish before exiting.
+        :param dryRun (default False): If True print, and return, what would be removed but remove nothing.
+        :param wait (default False): If True wait for deletion to finish (see waitClean).
+        :param workers (default 4): number of threads used to delete directories.
+        :return: list of paths (files and directories) removed (or that would be removed if dryRun).
         """
-        import stat  # used for chmod to make writable.
         if self.rootDir.name == 'Configurations':
             print("You will delete configurations -- aborting")
             raise Exception("Attempted to delete configurations")
+        trash = self.rootDir / self.trashDir
         # go and clean all directories  by removing everything EXCEPT jsonFile
         # algorithm -- iterate over all files in rootDir
         # if file is a file and not a .json file delete it. If file is a dir delete it
-        for file in self.rootDir.iterdir():
-            if file.is_file() and file.suffix != '.json':
-                if self.verbose:
-                    print(f"Deleting {file}")
+        files = []
+        dirs = []
+        for file in sorted(self.rootDir.iterdir()):
+            if file == trash:
+                continue
+            if file.is_dir() and not file.is_symlink():
+                dirs.append(file)
+            elif file.suffix != '.json':
+                files.append(file)
+        leftOver = []  # from earlier cleans -- except those still being deleted.
+        if trash.is_dir():
+            busy = set(path.parent for future, path in self._cleanFutures.items() if not future.done())
+            leftOver = [path for path in sorted(trash.iterdir()) if path not in busy]
+        if dryRun:
+            for path in files + dirs + leftOver:
+                print(f"Would delete {path}")
+            return files + dirs + leftOver
+
+        if self._index is not None:  # remove the index whatever it is called.
+            self._index.close()
+            if self._index.path.exists():
+                self._index.path.unlink()
+        for file in files:
+            if self.verbose:
+                print(f"Deleting {file}")
+            try:
+                file.unlink(missing_ok=True)  # remove the file. The index has already gone.
+            except PermissionError:
                 file.chmod(stat.S_IWRITE)
-                file.unlink()  # remove the file
-            elif file.is_dir():
-                if self.verbose: print(f"Deleting {file} and contents")
-                shutil.rmtree(file, onerror=optClimLib.errorRemoveReadonly)
+                file.unlink()
+        toDelete = list(leftOver)
+        if len(dirs) > 0:
+            trash.mkdir(exist_ok=True)
+            tmpDir = pathlib.Path(tempfile.mkdtemp(dir=trash))  # unique name so never clash with earlier cleans.
+            for dir in dirs:
+                if self.verbose:
+                    print(f"Deleting {dir} and contents")
+                os.rename(dir, tmpDir / dir.name)  # atomic so dir is gone from the study straight away.
+                toDelete.append(tmpDir / dir.name)  # each run directory deleted separately so done in parallel.
+        if len(toDelete) > 0:
+            pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+            for path in toDelete:
+                self._cleanFutures[pool.submit(self._removePath, path)] = path
+            pool.shutdown(wait=False)  # threads exit once all work done.
+        self._dirsRead = set()  # all gone so names might be used again.
+        if wait:
+            self.waitClean()
+        return files + dirs + leftOver
+
+    def _removePath(self, path):
+        """
+        Remove a file or directory (and its contents) being deleted by clean.
+        :param path: path to remove
+        """
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path, onerror=optClimLib.errorRemoveReadonly)
+        elif path.exists() or path.is_symlink():
+            path.unlink()
+        if self.verbose:
+            done, total = self.cleanProgress()
+            print(f"Deleted {path}. {done:d} of {total:d} done before this")
+
+    def cleanProgress(self):
+        """
+        Report how deletion of directories removed by clean is going.
+        :return: number of paths deleted and total number of paths to delete.
+        """
+        done = sum([future.done() for future in self._cleanFutures.keys()])
+        return done, len(self._cleanFutures)
+
+    def waitClean(self):
+        """
+        Wait for deletion of directories removed by clean to finish. Raises the first error if any deletion failed.
+        Empty directories left in the trash, and the trash directory itself if then empty, are removed.
+        :return: list of paths deleted.
+        """
+        paths = []
+        for future, path in self._cleanFutures.items():
+            future.result()
+            paths.append(path)
+        self._cleanFutures = dict()
+        trash = self.rootDir / self.trashDir
+        if trash.is_dir():
+            for path in list(trash.iterdir()) + [trash]:
+                try:
+                    path.rmdir()
+                except OSError:  # not empty (or not a directory)
+                    pass
+        return paths
 
     def obsNames(self):
         """
@@ -203,20 +513,27 @@ class ModelSubmit(object):
         """
         return self.config.transMatrix(scale=scale, dataFrame=dataFrame)
 
-    def genModelKey(self, model):
+    def modelParams(self, model):
         """
-        Generate key from model
-        :param model: model for which key gets generated
-        :return: key
+        Generate dict of parameters, including fixed parameters, that identify a model
+        :param model: model
+        :return: dict of parameters
         """
-
         params = {}
         params.update(self.fixedParams())
         params.update(model.getParams(verbose=self.verbose))
         if 'refDir' not in self.fixedParams():
             params.update(refDir=model.refDirPath())
+        return params
+
+    def genModelKey(self, model):
+        """
+        Generate key from model
+        :param model: model for which key gets generated
+        :return: key
+        """
 
-        key = self.genKey(params)  # Generate key.
+        key = self.genKey(self.modelParams(model))  # Generate key.
         return key
 
     def rerunModels(self, model=None):
@@ -233,87 +550,260 @@ class ModelSubmit(object):
 
         return self._modelsRerun
 
-    def readModelDir(self, dir):
+    def readModelDir(self, dir, entry=None):
         """
         Read model configuration from directory, generate key and store it.
+          If the study index has an up to date entry for the directory then a RunRecord made from it is used
+            rather than reading the directory.
+          Behaviour when no observations found depends on self.noObs (see storeModel)
+        :param dir: path to directory where model configuration is to be found
+        :param entry (optional -- default None): index entry for the directory. If None it will be looked up.
+        :return: model if succeeded, None if failed.
+        """
+
+        dir = pathlib.Path(dir)
+        if dir.parent == self.rootDir:
+            self._dirsRead.add(dir.name)
+        if self.useIndex(dir):
+            if entry is None:
+                entry = self._index.entry(dir.name)
+            model = self.indexedModel(dir, entry)
+            if model is not None:  # got an up to date entry so use that.
+                return self.storeModel(dir, model, model.getObs())
+
+        stamp, model, obs = readModel(self.modelFn, dir, obsNames=self.config.obsNames(),
+                                      ppOutputFile=self.config.postProcessOutput(), verbose=self.verbose,
+                                      record=self.useRecords)
+        model = self.storeModel(dir, model, obs, stamp=stamp)
+        self.commit()
+        return model
+
+    def storeModel(self, dir, model, obs, stamp=None):
+        """
+        Generate key for a model that has been read and store it.
           Behaviour when no observations found depends on self.noObs
              'fail': fail!
+             'restart': restart the simulation
              'continue': attempt to continue the simulation
              'perturb': perturb the simulation and restart it.
+             'perturbC': perturb the simulation and continue it.
              'clean': remove the directory.
-        :param dir: path to directory where model configuration is to be found
-        :return: model if succeeded, None if failed.
+          Unless noObs is 'fail' models still in progress (see RunState.inProgress) are left alone.
+          Models without observations are recorded as FAILED once finished (see RunState.finished).
+        :param dir: path to directory where model configuration was found
+        :param model: model (as returned by modelFn or indexedModel). If None nothing is done.
+        :param obs: observations for the model.
+        :param stamp (optional -- default None): file stamp taken before the model was read.
+            If not None and the model has all observations the study index gets updated.
+        :return: model if succeeded, None if failed or still in progress.
         """
+        if model is None:
+            return None
+        keyParams, key = self.canonicalKey(self.modelParams(model))
+        if self.verbose:
+            print("Read Dir %s Key is:\n %s " % (dir, key))
+            if self._models.get(key) is not None:  # warn if verbose on and got duplicate dir.
+                print("Got duplicate dir =  %s " % (dir) + "\n key = " + repr(key))
+        # check model has observations and if not do something!
+        if (obs is None) or any([v is None for v in obs.values()]):  # Obs is None or any  obs are None.
+            state = self._runStates.state(pathlib.Path(dir).name)
+            if self.noObs != 'fail' and state in RunState.inProgress:
+                # still running or post-processing so observations might yet appear -- leave it alone.
+                if self.verbose:
+                    print("%s is %s so not complete" % (dir, state))
+                return None
+            # only a failure if the model (and its post-processing) has finished.
+            if self.noObs == 'fail' or state in RunState.finished:
+                self.setRunState(dir, RunState.FAILED)
+            # deal with noObs cases.
+            if self.noObs == 'fail':
+                raise Exception(f"Some observations for {dir} are none")
+            elif self.noObs == 'restart':  # mark for restart
+                model.restartSimulation()
+            elif self.noObs == 'continue':  # mark for continuation.
+                model.continueSimulation()
+            elif (self.noObs == 'perturb' or self.noObs == 'perturbC'):  # perturb model
+                # tricky -- don't want to change the parameters.
+                # think this is a modelSimulation method. Though not very comfortable with config and state being
+                # inconsistent..
+                param = model.perturbParams()
+                model.perturb(params=param)
+                if self.noObs == 'perturbC':
+                    model.continueSimulation()  # mark for continue
+                else:
+                    model.restartSimulation()  # mark for restart
+            elif self.noObs == 'clean':
+                # remove the directory
+                shutil.rmtree(model.dirPath, onerror=optClimLib.errorRemoveReadonly)
+                print("Cleaned %s" % (model.dirPath))
+                return None  # no model to return.
+            else:  # unknown noObs case.
+                raise Exception(f"Unknown noObs {self.noObs}")
+
+            # if we got to here then model needs to be added to the list of models to be resubmitted.
+            self.rerunModels(model=model)
 
-        try:
-            if self.verbose:
-                print("Reading from %s" % (dir))
-            # configuration overrides what was in the model when created... 
-            config = self.config
-            obsWant = config.obsNames()
-            model = self.modelFn(dir, obsNames=obsWant,
-                                 ppOutputFile=config.postProcessOutput())
-            # read in the model. 
-            # what to do if model crashes but want to continue anyhow???
-            # generate params dict suitable for generating key.
-            key = self.genModelKey(model)
-            if self.verbose:
-                print("Read Dir %s Key is:\n %s " % (dir, key))
-                if self._models.get(key) is not None:  # warn if verbose on and got duplicate dir.
-                    print("Got duplicate dir =  %s " % (dir) + "\n key = " + repr(key))
-            # check model has observations and if not do something!
-            obs = model.getObs()
-            if (obs is None) or any([v is None for v in obs.values()]):  # Obs is None or any  obs are None.
-                # deal with noObs cases.
-                if self.noObs == 'fail':
-                    raise Exception(f"Some observations for {dir} are none")
-                elif self.noObs == 'restart':  # mark for restart
-                    model.restartSimulation()
-                elif self.noObs == 'continue':  # mark for continuation.
-                    model.continueSimulation()
-                elif (self.noObs == 'perturb' or self.noObs == 'perturbC'):  # perturb model
-                    # tricky -- don't want to change the parameters.
-                    # think this is a modelSimulation method. Though not very comfortable with config and state being
-                    # inconsistent..
-                    param = model.perturbParams()
-                    model.perturb(params=param)
-                    if self.noObs == 'perturbC':
-                        model.continueSimulation()  # mark for continue
-                    else:
-                        model.restartSimulation()  # mark for restart
-                elif self.noObs == 'clean':
-                    # remove the directory
-                    shutil.rmtree(model.dirPath, onerror=optClimLib.errorRemoveReadonly)
-                    print("Cleaned %s" % (model.dirPath))
-                    return None  # no model to return.
-                else:  # unknown noObs case.
-                    raise Exception(f"Unknown noObs {self.noObs}")
-
-                # if we got to here then model needs to be added to the list of models to be resubmitted.
-                self.rerunModels(model=model)
+        else:
+            self._models[key] = model  # store the model in modelRuns indexed by its key.
+            self._paramIndex.add(keyParams, key)
+            self.setRunState(dir, RunState.DONE)
+            if stamp is not None:  # (re)read from the directory so any cost might be out of date.
+                self.removeCost(pathlib.Path(dir).name)
+            if stamp is not None and self.useIndex(dir):  # and remember it.
+                self._index.update(StudyIndex.IndexEntry(
+                    dirName=dir.name, name=model.name(), key=key, params=model.getParams(),
+                    refDir=model.refDirPath(), obs=obs, obsFile=self.config.postProcessOutput(), status='complete',
+                    stamp=stamp))
+            self.registerModel(model, keyParams, obs)
 
-            else:
-                self._models[key] = model  # store the model in modelRuns indexed by its key.
+        return model
 
-            return model
+    def setRunState(self, dir, state):
+        """
+        Record the state of a model simulation in rootDir (see RunState). Nothing is recorded if the state is
+          unchanged or dir is not in rootDir.
+        :param dir: path to model simulation directory
+        :param state: state to record
+        :return: nothing
+        """
+        dir = pathlib.Path(dir)
+        if dir.parent != self.rootDir or self.readOnly:
+            return
+        if self._runStates.state(dir.name) != state:
+            self._runStates.set(dir.name, state)
 
-        except (IOError, EOFError):  # likely failed to read something so error!
-            # IOError when no config file found; EOFError when config file corrupted.
-            if self.verbose:
-                print("Failed to read from %s" % (dir))
+    def runStates(self):
+        """
+        Get the state (see RunState) of all model simulations in the study without reading their directories.
+        :return: dict of states indexed by directory name.
+        """
+        return self._runStates.states()
+
+    def stateCounts(self):
+        """
+        :return: ordered dict of the number of model simulations in each state (see RunState).
+        """
+        return self._runStates.counts()
+
+    def commit(self):
+        """
+        Make changes to the study index and run registry permanent.
+        """
+        if self._index is not None:
+            self._index.commit()
+        if self._registry is not None:
+            self._registry.commit()
+
+    @classmethod
+    def registryKey(cls, keyParams):
+        """
+        Generate the key used in the run registry. Like formatKey but without refDir as the registry uses the
+        fingerprint of the reference directory instead of its path.
+        :param keyParams: iterable of (name, value) pairs as produced by keyParams
+        :return: key
+        """
+        return cls.formatKey([(k, v) for k, v in keyParams if k != 'refDir'])
+
+    def registerModel(self, model, keyParams, obs):
+        """
+        Add a completed model to the run registry. Nothing is done if there is no registry or
+        the model's reference directory no longer exists.
+        :param model: model
+        :param keyParams: (name, value) pairs that identify the model (see keyParams)
+        :param obs: observations for the model
+        :return: nothing
+        """
+        if self._registry is None:
+            return
+        fingerprint = self._registry.refDirFingerprint(model.refDirPath())
+        if fingerprint is None:
+            return
+        self._registry.register(RunRegistry.RegistryEntry(
+            dirPath=os.path.abspath(model.dirPath), fingerprint=fingerprint, key=self.registryKey(keyParams),
+            name=model.name(), params=model.getParams(), obs=obs))
+
+    def useIndex(self, dir):
+        """
+        Work out if the study index applies to a model simulation directory.
+        :param dir: path to model simulation directory
+        :return: True if index should be used.
+        """
+        return (self._index is not None) and (pathlib.Path(dir).parent == self.rootDir)
+
+    def indexedModel(self, dir, entry):
+        """
+        Generate a RunRecord from an index entry provided the entry is up to date.
+        :param dir: path to model simulation directory
+        :param entry: index entry for the directory (or None)
+        :return: RunRecord or None if entry is None or out of date.
+        """
+        if (entry is None) or (entry.status != 'complete'):
+            return None
+        if list(entry.obs.keys()) != list(self.config.obsNames()):  # wanted obs changed.
             return None
+        stamp = dirStamp(self.modelFn, dir, self.config.postProcessOutput())
+        if repr(stamp) != entry.stamp:  # files changed since entry made.
+            return None
+        loader = functools.partial(self.modelFn, dir, obsNames=self.config.obsNames(),
+                                   ppOutputFile=self.config.postProcessOutput())
+        return RunRecord(entry.name, str(dir), entry.params, entry.obs, refDirPath=entry.refDir, loader=loader)
 
     def readDir(self, dir):
         """
         reads all model configurations from dir and stores them.
+          When reading rootDir the study index is used and updated. Entries for directories
+          that no longer exist are removed from it.
+          If self.readWorkers > 1 directories not in the index are read in parallel using a pool
+          of self.readPool ('thread' or 'process') workers. Models are then stored, and missing observations
+          handled (see storeModel), one at a time in sorted directory order so results are the same as a serial read.
         :param dir: directory (filePath) where models to found
 
         :return:
         """
 
-        for d in sorted(dir.iterdir()):  # loop over sub-directories etc
-            if d.is_dir():  # only try and read from directories.
-                model = self.readModelDir(d)  # read the configuration. readModelDir traps errors.
+        dir = pathlib.Path(dir)
+        # only try and read from directories. Hidden ones are temporary (see ModelSimulation.createModelSimulation)
+        dirs = [d for d in sorted(dir.iterdir()) if d.is_dir() and not d.name.startswith('.')]
+        entries = dict()
+        if self._index is not None and dir == self.rootDir:
+            entries = self._index.entries()
+        # records from the index -- only need to stat files so done serially.
+        records = dict()
+        for d in dirs:
+            if self.useIndex(d):
+                model = self.indexedModel(d, entries.get(d.name))
+                if model is not None:
+                    records[d] = model
+        toRead = [d for d in dirs if d not in records]
+        reader = functools.partial(readModel, self.modelFn, obsNames=self.config.obsNames(),
+                                   ppOutputFile=self.config.postProcessOutput(), verbose=self.verbose,
+                                   record=self.useRecords)
+        if self.readWorkers > 1 and len(toRead) > 1:
+            if self.readPool == 'process':
+                pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.readWorkers)
+            elif self.readPool == 'thread':
+                pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.readWorkers)
+            else:
+                raise ValueError(f"Unknown readPool {self.readPool}")
+            with pool:
+                readIn = dict(zip(toRead, pool.map(reader, toRead)))
+        else:
+            readIn = dict(zip(toRead, map(reader, toRead)))
+
+        # now store them in order.
+        for d in dirs:
+            if d in records:
+                self.storeModel(d, records[d], records[d].getObs())
+            else:
+                stamp, model, obs = readIn[d]
+                self.storeModel(d, model, obs, stamp=stamp)
+
+        if dir == self.rootDir:
+            seen = set(d.name for d in dirs)
+            self._dirsRead.update(seen)
+            if self._index is not None:
+                self._index.remove([d for d in entries.keys() if d not in seen])
+        self.commit()
 
     def genKey(self, paramDict, fpFmt='%.4g', ):
 
@@ -328,32 +818,22 @@ class ModelSubmit(object):
         # make this a method of the model which would have lots of advantages!
         """
 
-        key = []
-        paramKeys = sorted(paramDict.keys())
-        # deal with possible rewrite on refDir
-        if self.renameRefDir is not None:
-            refDir = paramDict['refDir']
-            refDir = self.renameRefDir.get(refDir, refDir)
-            # if refDir in keys for renameDir will get new value otherwise no change
-            print("Rewritten: %s -> %s " % (paramDict['refDir'], refDir))
-            paramDict['refDir'] = refDir
-
-        # remove ignoreKeys
-        for ignore in self.ignoreKeys:
-            try:
-                paramKeys.remove(ignore)
-            except ValueError:
-                pass
+        if fpFmt == '%.4g':  # default so use the remembered key.
+            return self.canonicalKey(paramDict)[1]
+        return self.formatKey(self.keyParams(paramDict), fpFmt=fpFmt)
 
+    @staticmethod
+    def formatKey(keyParams, fpFmt='%.4g'):
+        """
+        Generate key from (name, value) pairs as produced by keyParams.
+        :param keyParams: iterable of (name, value) pairs
+        :param fpFmt -- format to convert float to string. (Default is %.4g)
+        :return: a tuple as an index. tuple is key_name, value in order of keyParams
+        """
+        key = []
         # deal with variable parameters -- produced by optimisation so have names and values.
-        for k in paramKeys:  # iterate over keys in sorted order.
+        for k, v in keyParams:  # iterate over keys in sorted order.
             key.append(k)
-            v = paramDict[k]
-            try:
-                v = self.keyFn[k](v)  # apply function listed in keyFn
-            except (TypeError, KeyError):
-                pass  # nothing to do
-
             if isinstance(v, float):
                 key.append(fpFmt % v)  # float point number so use formatter.
             else:  # just append the value.
@@ -361,6 +841,121 @@ class ModelSubmit(object):
         key = tuple(key)  # convert to tuple
         return key
 
+    def keyParams(self, paramDict):
+        """
+        Generate the (name, value) pairs, in sorted name order, that identify a parameter set.
+        ignoreKeys are removed, refDir is renamed (if renameRefDir set) and keyFn functions applied.
+        Used by genKey and the numeric parameter index. See canonicalKey.
+        :param paramDict -- a dictionary (or something that behaves likes a dict) of parameters.
+        :return: list of (name, value) pairs
+        """
+        return list(self.canonicalKey(paramDict)[0])
+
+    def canonicalKey(self, paramDict):
+        """
+        Generate the (name, value) pairs (see keyParams) and key (see genKey) for a parameter set.
+          The same parameter sets get asked about many times so results are remembered (in a cache of at most
+          keyCacheSize parameter sets). The name order and the ignoreKeys, renameRefDir and keyFn rules are worked out
+          once (see _keyOrder) and redone only when the rules are changed.
+          If renameRefDir is set then refDir in paramDict is rewritten (as it always has been) and the first rewrite of
+          each refDir printed.
+        :param paramDict -- a dictionary (or something that behaves likes a dict) of parameters.
+        :return: tuple of (name, value) pairs and key.
+        """
+        if self._renameRefDir is not None:  # deal with possible rewrite on refDir
+            refDir = paramDict['refDir']
+            newRefDir = self._renameRefDir.get(refDir, refDir)
+            # if refDir in keys for renameDir will get new value otherwise no change
+            if refDir not in self._rewritten:
+                self._rewritten.add(refDir)
+                print("Rewritten: %s -> %s " % (refDir, newRefDir))
+            paramDict['refDir'] = newRefDir
+        try:
+            cacheKey = frozenset([(k, type(v), v) for k, v in paramDict.items()])
+        except TypeError:  # something not hashable so just work it out.
+            cacheKey = None
+        if cacheKey is not None:
+            result = self._keyCache.get(cacheKey)
+            if result is not None:
+                self._keyCache.move_to_end(cacheKey)
+                return result
+
+        pairs = []
+        for k in self._keyOrder(paramDict.keys()):
+            v = paramDict[k]
+            try:
+                v = self._keyFn[k](v)  # apply function listed in keyFn
+            except (TypeError, KeyError):
+                pass  # nothing to do
+            pairs.append((k, v))
+        pairs = tuple(pairs)
+        result = (pairs, self.formatKey(pairs))
+        if cacheKey is not None:
+            self._keyCache[cacheKey] = result
+            if len(self._keyCache) > self.keyCacheSize:
+                self._keyCache.popitem(last=False)  # forget the least recently used.
+        return result
+
+    def _keyOrder(self, names):
+        """
+        Work out, and remember, the order parameter names appear in keys.
+        :param names: parameter names
+        :return: tuple of names, without ignoreKeys, in sorted order.
+        """
+        names = frozenset(names)
+        order = self._keyOrders.get(names)
+        if order is None:
+            order = tuple(sorted(names - self._ignoreKeys))
+            self._keyOrders[names] = order
+        return order
+
+    def _clearKeyCache(self):
+        """
+        Forget all remembered keys. Called when the rules for making keys change.
+        """
+        self._keyCache = collections.OrderedDict()
+        self._keyOrders = dict()
+        self._rewritten = set()
+
+    @property
+    def ignoreKeys(self):
+        """
+        Model parameters to ignore when generating keys. Setting this forgets all remembered keys.
+        """
+        return self._ignoreKeyList
+
+    @ignoreKeys.setter
+    def ignoreKeys(self, value):
+        self._ignoreKeyList = value
+        self._ignoreKeys = frozenset(value)
+        self._clearKeyCache()
+
+    @property
+    def keyFn(self):
+        """
+        dict of functions applied to parameter values when generating keys (or None).
+        Setting this forgets all remembered keys.
+        """
+        return self._keyFn
+
+    @keyFn.setter
+    def keyFn(self, value):
+        self._keyFn = value
+        self._clearKeyCache()
+
+    @property
+    def renameRefDir(self):
+        """
+        dict like object used to rewrite refDir when generating keys (or None).
+        Setting this forgets all remembered keys.
+        """
+        return self._renameRefDir
+
+    @renameRefDir.setter
+    def renameRefDir(self, value):
+        self._renameRefDir = value
+        self._clearKeyCache()
+
     def modelSubmit(self, keyValue=None):
         """
         Add to list of runs to be submitted if value provided.
@@ -396,10 +991,21 @@ class ModelSubmit(object):
         paramAll.update(self.fixedParams())
         paramAll.update(params)
 
-        key = self.genKey(paramAll)
+        # exact lookup on the (remembered) key. Only if that fails use the numeric index to find a nearby model.
+        keyParams, key = self.canonicalKey(paramAll)
+        if (key not in self._models) and (self.paramTol is not None):
+            nearKey = self._paramIndex.nearest(keyParams, self.paramTol)
+            if nearKey is not None:
+                key = nearKey
+                if doVerbose:
+                    print("Using nearby model with key\n", repr(key))
         if doVerbose:
             print("Key is\n", repr(key), '\n', '-' * 60)
         model = self._models.get(key, None)
+        if (model is None) and update:
+            model = self.importModel(keyParams)
+            if (model is not None) and doVerbose:
+                print("Imported %s for key: %s" % (model.dirPath, repr(key)))
         if (model is None) and update:
             if doVerbose:
                 print("Failed to find", paramAll, '\n using key: ', key)
@@ -407,6 +1013,94 @@ class ModelSubmit(object):
 
         return model
 
+    def importModel(self, keyParams):
+        """
+        Import, from the run registry, a model simulation made by another study.
+          The simulation directory is copied into rootDir, as the model copies its reference directory
+          (see optClimLib.cowTree), so little space is used, and given the next free name. Files that get changed
+          (the model's copyFiles, configuration and observations files) are cloned or copied, never hard linked,
+          so changing them does not change the original simulation.
+          Observations the original simulation does not have are computed by post-processing (see postProcessModel).
+          If that fails the copy is removed and the next matching simulation tried.
+        :param keyParams: (name, value) pairs that identify the model wanted (see keyParams)
+        :return: the imported model or None if nothing imported.
+        """
+        if (self._registry is None) or self.readOnly:
+            return None
+        fingerprint = self._registry.refDirFingerprint(self.refDir)
+        if fingerprint is None:
+            return None
+        ppOutputFile = self.config.postProcessOutput()
+        cfgFiles = getattr(self.modelFn, 'configFiles', lambda: ['simulationConfig.cfg'])()
+        copyPatterns = tuple(getattr(self.modelFn, 'copyFiles', ())) + tuple(cfgFiles) + (ppOutputFile,)
+        missing = []
+        for entry in self._registry.find(fingerprint, self.registryKey(keyParams)):
+            srcDir = pathlib.Path(entry.dirPath)
+            if srcDir.parent == self.rootDir:  # one of ours -- so not complete or would have been found.
+                continue
+            if not srcDir.is_dir():  # gone so forget it.
+                missing.append(entry.dirPath)
+                continue
+            with optClimLib.studyLock(self.rootDir / self.lockFile):
+                createDir, name = next(self.nextName())
+                # copy into a hidden temporary directory (ignored by readDir) then rename into place.
+                tmpDir = tempfile.mkdtemp(prefix='.' + name + '_', dir=self.rootDir)
+                try:
+                    copyPath = pathlib.Path(tmpDir) / name
+                    optClimLib.cowTree(srcDir, copyPath, copyPatterns=copyPatterns)
+                    os.rename(copyPath, createDir)
+                    self.nameUsed(createDir)
+                finally:
+                    shutil.rmtree(tmpDir, onerror=optClimLib.errorRemoveReadonly)
+            model = self.modelFn(createDir, obsNames=self.config.obsNames(), ppOutputFile=ppOutputFile)
+            optClimLib.breakLink(os.path.join(model.dirPath, model.ppOutputFile()))  # in case original used another.
+            obs = model.getObs()
+            if (obs is None) or any([v is None for v in obs.values()]):
+                obs = self.postProcessModel(model, obs)
+            if (obs is None) or any([v is None for v in obs.values()]):
+                print("Failed to import %s" % (srcDir))
+                shutil.rmtree(createDir, onerror=optClimLib.errorRemoveReadonly)
+                continue
+            if self.verbose:
+                print("Imported %s into %s" % (srcDir, createDir))
+            stamp = dirStamp(self.modelFn, createDir, ppOutputFile)
+            model = self.storeModel(createDir, model, obs, stamp=stamp)
+            self._registry.remove(missing)
+            self.commit()
+            return model
+
+        self._registry.remove(missing)
+        self.commit()
+        return None
+
+    def postProcessModel(self, model, obs):
+        """
+        Compute the observations a model is missing by post-processing it. If a fakeFn is set that is used
+          otherwise config.postProcessScript() is ran, in the model directory, as the post-processing job does.
+          Observations the model already has are kept.
+        :param model: model to post process. Should have finished.
+        :param obs: observations the model already has (dict with None for missing values) or None.
+        :return: observations (dict). Values post-processing did not produce are None.
+        """
+        if obs is None:
+            obs = {k: None for k in self.config.obsNames()}
+        try:
+            if self.fakeFn is not None:
+                self.fakeFn(model, self.config)
+            else:
+                cmd = [self.config.postProcessScript(), self.config.fileName(), model.ppOutputFile()]
+                subprocess.run(cmd, cwd=model.dirPath, check=True)
+            newObs = model.readObs()
+        except (OSError, TypeError, subprocess.CalledProcessError) as error:
+            print("Failed to post process %s: %s" % (model.dirPath, error))
+            newObs = None
+        if newObs is None:
+            return obs
+        obs = {k: (v if v is not None else newObs.get(k)) for k, v in obs.items()}
+        if all([v is not None for v in obs.values()]):
+            model.writeObs(obs)  # put back the values we already had.
+        return obs
+
     def rerunModel(self, model):
         """
         Add existing (and maybe modified) model to directory of models to be reran.
@@ -427,6 +1121,12 @@ class ModelSubmit(object):
     def nextName(self):
         """
         generate the next name -- this is a generator function.
+         The last number used for each base name is stored in rootDir (see nameCounterFile) so
+         no search for a free name is needed. When there is no stored value rootDir is listed once to find it.
+         The number is only stored once the directory has been created (see nameUsed) so names given out
+         but not used (e.g. a dry run) get given out again.
+         Names are base + number with number being config.maxDigits() long in base config.nameRadix().
+         If a directory with the chosen name exists (e.g. created by hand) it is skipped.
          :return: iterator that gives names
         """
         # initialisation
@@ -436,6 +1136,7 @@ class ModelSubmit(object):
         maxDigits = self.config.maxDigits()  # get the maximum length of string for model.
         if maxDigits is None:
             maxDigits = 3  # default is 3.
+        radix = self.config.nameRadix()
         # for HadCM3 names > 5 characters cause trouble. 
         # other models are better written but for moment will 
         # restrict to 10 characters.
@@ -444,30 +1145,71 @@ class ModelSubmit(object):
         if lenBase > 10:  # truncate name length to 10 if too long
             useBase = useBase[:10]
 
-        # TODO allow letters a-z as well as numbers 0-9. That gives 36^maxDigits values ~ 46,000 values for 2 letter base
-        # and use lower/upper case to, That gives 62^maxDigits cases or 238,328 cases for 2 letter base or 3844 cases for 3 letter base
-        # or ~1000 values for 3 letter base.
-        maxValue = 10 ** maxDigits - 1  # can't have value larger than this.
+        maxValue = radix ** maxDigits - 1  # can't have value larger than this.
         # Special for maxDigits= 0 where we don't put in a number...
         if maxDigits == 0:
             maxValue = 1
-        num = 0  # start count at zero. Code below will keep going until dir not found.
-        fmtStr = '%%%d.%dd' % (maxDigits, maxDigits)
+        counterName = f'{useBase}:{maxDigits:d}:{radix:d}'
+        num = self.nameCounter(counterName)
+        if num is None:  # never stored so find the largest number in use.
+            num = 0
+            for path in self.rootDir.iterdir():
+                name = path.name
+                if maxDigits > 0 and len(name) == len(useBase) + maxDigits and name.startswith(useBase):
+                    used = optClimLib.decodeRunNumber(name[len(useBase):], radix=radix)
+                    if used is not None:
+                        num = max(num, used)
         while True:  # keep going
             num += 1
             if num > maxValue: raise ValueError("num to large")  # TODO mark as end of iterator ??
             if maxDigits == 0:
                 digitStr = ''
             else:
-                digitStr = fmtStr % num
+                digitStr = optClimLib.encodeRunNumber(num, maxDigits, radix=radix)
             name = useBase + digitStr
-            # check if dir exists.
-            # TODO Consider moving this outside the nextName logic.
             createDir = self.rootDir / name
             if createDir.exists():
                 continue  # go round the loop again.
+            self._nameNumbers[createDir] = (counterName, num)
             yield (createDir, name)  # "return" the directory to be created and the name.
 
+    def nameUsed(self, createDir):
+        """
+        Record that a name given by nextName has been used -- its number is stored (see nameCounter) if
+          createDir exists and is larger than the stored number. Nothing is stored if read only.
+        :param createDir: directory, as given by nextName, that has been created.
+        :return: nothing
+        """
+        if os.path.isdir(createDir):  # created here so never new (see readNewDirs).
+            self._dirsRead.add(pathlib.Path(createDir).name)
+        entry = self._nameNumbers.pop(pathlib.Path(createDir), None)
+        if entry is None or self.readOnly or not os.path.isdir(createDir):
+            return
+        counterName, num = entry
+        last = self.nameCounter(counterName)
+        if last is None or num > last:
+            self.nameCounter(counterName, num)
+
+    def nameCounter(self, counterName, value=None):
+        """
+        Get (and optionally set) the last number used for names. Stored, as json, in rootDir/nameCounterFile.
+        :param counterName: name of counter
+        :param value (default None): If not None value to store. Not stored if read only.
+        :return: last number used or None if never stored.
+        """
+        counterPath = self.rootDir / self.nameCounterFile
+        counters = dict()
+        if counterPath.exists():
+            with open(counterPath, 'r') as fp:
+                counters = json.load(fp)
+        if value is not None and not self.readOnly:
+            counters[counterName] = value
+            tmpPath = counterPath.with_name(counterPath.name + '.tmp')
+            with open(tmpPath, 'w') as fp:
+                json.dump(counters, fp)
+            os.replace(tmpPath, counterPath)  # atomic so never see a half written file.
+        return counters.get(counterName)
+
     def submit(self, resubmit=None, dryRun=False, verbose=None, postProcess=True,
                cost=False, scale=True,
                *args, **kwargs):
@@ -538,26 +1280,35 @@ class ModelSubmit(object):
                 break  # stop generating models as made too many!
             # now go and create new model.
             submitModels.append(model)
-        # and then possible new runs,
-        for param, (createDir, name) in zip(self.modelSubmit(), self.nextName()):
-            # deal with maxRuns logic
-            if (maxRuns is not None) and (len(submitModels) >= maxRuns):
-                print("Created %i with maxRuns= %i" % (len(submitModels), maxRuns))
-                break  # stop generating models as made too many!
-            # now go and create new model.
-            obsNames = self.config.obsNames()
-            param['RUNID'] = name
-            refDir = param.pop('refDir')  # remove refDir from param dict.
-            model = self.modelFn(createDir, obsNames=obsNames, create=True,
-                                 name=name, runTime=runTime, runCode=runCode,
-                                 ppExePath=self.config.postProcessScript(), refDirPath=refDir,
-                                 ppOutputFile=self.config.postProcessOutput(),
-                                 parameters=param, verbose=doVerbose)
-            submitModels.append(model)
-
-            if doVerbose:
-                print("createDir is %s path is %s" % (createDir, os.getcwd()))
-                print("Params are:\n", repr(param), "\n", '-' * 80)
+        # and then possible new runs. Lock the study so other processes using it do not
+        # use the same names or create the same models.
+        with optClimLib.studyLock(self.rootDir / self.lockFile):
+            self.readNewDirs()  # drops models another process has made.
+            # Work out names first so they are the same however models get created.
+            toCreate = []
+            for param, (createDir, name) in zip(self.modelSubmit(), self.nextName()):
+                # deal with maxRuns logic
+                if (maxRuns is not None) and (len(submitModels) + len(toCreate) >= maxRuns):
+                    print("Created %i with maxRuns= %i" % (len(submitModels) + len(toCreate), maxRuns))
+                    break  # stop generating models as made too many!
+                param['RUNID'] = name
+                refDir = param.pop('refDir')  # remove refDir from param dict.
+                toCreate.append((createDir, dict(obsNames=self.config.obsNames(), create=True,
+                                                 name=name, runTime=runTime, runCode=runCode,
+                                                 ppExePath=self.config.postProcessScript(), refDirPath=refDir,
+                                                 ppOutputFile=self.config.postProcessOutput(),
+                                                 parameters=param, verbose=doVerbose)))
+                if doVerbose:
+                    print("createDir is %s path is %s" % (createDir, os.getcwd()))
+                    print("Params are:\n", repr(param), "\n", '-' * 80)
+            # now go and create new models.
+            if len(toCreate) > 0 and not self._runStates.path.exists():  # (re)start the run state table.
+                self._runStates.path.touch()
+            if not self.readOnly:  # keep the table small. Done holding the study lock.
+                self._runStates.compact()
+            if len(toCreate) > 0 and not self._obsStore.exists():  # and the observation store.
+                self._obsStore.create()
+            submitModels.extend(self.createModels(toCreate))
 
         # end of iterating over models  to generate.
         nmodels = len(submitModels)
@@ -577,6 +1328,68 @@ class ModelSubmit(object):
 
         return status, nmodels, finalConfig
 
+    def readNewDirs(self):
+        """
+        Read model simulation directories that have appeared in rootDir (e.g. made by another process) since
+        it was read. Directories already read (by readDir, readModelDir or an earlier readNewDirs) or created by
+        this instance are skipped -- even those whose models do not yet have observations.
+        Models with observations are stored. Models waiting to be created (see modelSubmit)
+        that match any of the new directories are removed so they do not get created twice.
+        :return: list of names of new directories.
+        """
+        known = self._dirsRead | set(pathlib.Path(m.dirPath).name for m in
+                                     list(self._models.values()) + list(self._modelsToRerun.values()))
+        newDirs = []
+        for d in sorted(self.rootDir.iterdir()):
+            if (not d.is_dir()) or d.name.startswith('.') or d.name in known:
+                continue
+            stamp, model, obs = readModel(self.modelFn, d, obsNames=self.config.obsNames(),
+                                          ppOutputFile=self.config.postProcessOutput(), verbose=self.verbose,
+                                          record=self.useRecords)
+            if model is None:
+                continue
+            self._dirsRead.add(d.name)
+            newDirs.append(d.name)
+            key = self.genModelKey(model)
+            if self._modelsToSubmit.pop(key, None) is not None and self.verbose:
+                print("Model for %s already created in %s" % (repr(key), d))
+            if (obs is not None) and all([v is not None for v in obs.values()]):
+                self.storeModel(d, model, obs, stamp=stamp)
+        self.commit()
+        return newDirs
+
+    def createModels(self, toCreate):
+        """
+        Create new models. If self.createWorkers > 1 they are created concurrently using a pool of
+        self.createPool ('process' or 'thread') workers.
+        If creating any model fails then all directories being created are removed and the error raised.
+        :param toCreate: list of (createDir, kwargs) where kwargs are keyword arguments for self.modelFn.
+        :return: list of models in the same order as toCreate.
+        """
+        try:
+            if self.createWorkers > 1 and len(toCreate) > 1:
+                if self.createPool == 'process':
+                    pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.createWorkers)
+                elif self.createPool == 'thread':
+                    pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.createWorkers)
+                else:
+                    raise ValueError(f"Unknown createPool {self.createPool}")
+                with pool:  # waits for everything to finish.
+                    futures = [pool.submit(self.modelFn, createDir, **kwargs) for createDir, kwargs in toCreate]
+                models = [future.result() for future in futures]  # raises the first error.
+            else:
+                models = [self.modelFn(createDir, **kwargs) for createDir, kwargs in toCreate]
+            for createDir, kwargs in toCreate:
+                self.nameUsed(createDir)
+        except Exception:
+            for createDir, kwargs in toCreate:  # clean up.
+                if os.path.exists(createDir):
+                    print("Removing %s" % (createDir))
+                    shutil.rmtree(createDir, onerror=optClimLib.errorRemoveReadonly)
+            raise
+
+        return models
+
     def params(self, includeFixed=False):
         """
         Extract the parameters used in the simulations. Will include ensembleMember -- as a "fake" parameter
@@ -596,12 +1409,12 @@ class ModelSubmit(object):
         names.append('ensembleMember')
 
         for key, model in self.allModels():
-            param = model.getParams(series=True, params=names)
+            param = model.getParams(params=names)
             if includeFixed:  # add refDir
-                param.refDir = model.refDirPath()
+                param['refDir'] = model.refDirPath()
             p.append(param)
             indx.append(model.name())
-        paramsDF = pd.DataFrame(p, index=indx)
+        paramsDF = pd.DataFrame(p, index=indx)  # single construction from list of dicts.
         return paramsDF
 
     def obs(self, scale=True):
@@ -613,25 +1426,79 @@ class ModelSubmit(object):
 
 
         """
-        o = []
-        for key, model in self.allModels():
-            obs = model.getObs(series=True)
-            if scale:  # scale obs.
-                scales = self.config.scales()
-                name = obs.name
-                obs = scales * obs
-                obs = obs.rename(name)
-                # need to reset name
-            o.append(obs)
-        if len(o) == 0:  # empty list
+        obsDF = self.storedObs(scale=scale)
+        if obsDF is not None:
+            return obsDF
+        names, obsNames, obs = self.obsMatrix(scale=scale)
+        if len(names) == 0:  # no models
             return None
 
-        obsDF = pd.DataFrame(o)
+        obsDF = pd.DataFrame(obs, index=names, columns=obsNames)
+        return obsDF
+
+    def storedObs(self, scale=True):
+        """
+        Get the observations of all models from the study observation store (see ObsStore) in one read.
+        Post-processing scripts that write the observation file directly (rather than through
+          ModelSimulation.writeObs) do not update the store so store entries older than the model's
+          observation file are out of date.
+        :param scale (optional; default = True). If True scale the observations.
+        :return: pandas dataframe of observations (as obs) or None if the store does not hold
+          up to date observations for every model in rootDir.
+        """
+        models = list(self._models.values())
+        dirNames = [pathlib.Path(model.dirPath).name for model in models]
+        if len(models) == 0 or any([pathlib.Path(model.dirPath).parent != self.rootDir for model in models]):
+            return None
+        entries = self._obsStore.obs()
+        if any([d not in entries for d in dirNames]):
+            return None
+        obsFile = self.config.postProcessOutput()
+        for model, dirName in zip(models, dirNames):
+            try:
+                mtime = (pathlib.Path(model.dirPath) / obsFile).stat().st_mtime
+            except FileNotFoundError:
+                return None
+            if entries[dirName].time < mtime:  # file written since the store was -- use the files.
+                return None
+        obsDF = self._obsStore.frame(obsNames=self.obsNames(), dirNames=dirNames)
+        obsDF.index = [model.name() for model in models]
+        if scale:
+            obsDF *= self.config.scales(obsNames=self.obsNames()).values
         return obsDF
 
+    def obsMatrix(self, scale=True, obsNames=None, models=None):
+        """
+        Extract the Obs used in the *individual* simulations as a numpy array. Observations
+        for each model are got once and missing observations are nan.
+        :param scale (optional; default = True). If True scale the observations.
+        :param obsNames (optional; default None). Names of observations wanted. If None use self.obsNames()
+        :param models (optional; default None). Models wanted. If None all models.
+        :return: list of model names, list of obsNames and (nModels x nObs) numpy array of observations.
+        """
+        if obsNames is None:
+            obsNames = self.obsNames()
+        obsNames = list(obsNames)
+        if models is None:
+            models = self._models.values()
+        models = list(models)
+        obs = np.full((len(models), len(obsNames)), np.nan)
+        names = []
+        for row, model in enumerate(models):
+            names.append(model.name())
+            modelObs = model.getObs()
+            if modelObs is None:
+                continue
+            obs[row, :] = [np.nan if modelObs.get(k) is None else modelObs.get(k) for k in obsNames]
+        if scale:  # scale all obs in one go.
+            obs *= self.config.scales(obsNames=obsNames).values
+        return names, obsNames, obs
+
     def runCost(self, config, filename=None, scale=True):
         """
         Add information on cost to configuration and return modified config.
+        Costs are kept in a ledger (in the study index if there is one) so they are only computed for
+          simulations that do not have one. See costLedger.
         :param config -- configuration to be copied and have cost added in. Also stores
            best evaluation.
 
@@ -646,24 +1513,34 @@ class ModelSubmit(object):
         """
 
         newConfig = config.copy(filename=filename)
-        obs = self.obs(scale=scale)  # get params & obs
-        if obs is None:  # no data
+        if len(self._models) == 0:  # no data
             if filename is not None:
                 newConfig.save()
             return newConfig  # no data so return the config.
-        obs = obs.loc[:, config.obsNames()]  # extract the obs.
-        tMat = self.transMatrix(scale=scale)  # which puts us into space where totalError is Identity matrix.
-
-        nObs = len(obs.columns)
-        resid = (obs - self.targets(scale=scale)) @ tMat.T
-        cost = np.sqrt((resid ** 2).sum(1).astype(float) / nObs)
+        obsNames = list(config.obsNames())
+        # transform matrix puts us into space where totalError is Identity matrix.
+        tMat = self.transMatrix(scale=scale).loc[:, obsNames].values
+        tgt = self.targets(scale=scale).reindex(obsNames).values
+        ledger = self.costLedger(self.costSignature(obsNames, tgt, tMat, scale))
+        models = dict()
+        for model in self._models.values():
+            models[pathlib.Path(model.dirPath).name] = model
+        new = [dirName for dirName in models.keys() if dirName not in ledger]
+        if len(new) > 0:  # compute costs for new models.
+            names, obsNames, obs = self.obsMatrix(scale=scale, obsNames=obsNames, models=[models[d] for d in new])
+            nObs = len(obsNames)
+            resid = (obs - tgt) @ tMat.T
+            costs = np.sqrt((resid ** 2).sum(1) / nObs)
+            self.addCosts(zip(new, names, costs))
 
         # update newConfig
+        cost = pd.Series([ledger[d][1] for d in models.keys()], index=[ledger[d][0] for d in models.keys()])
         cost = newConfig.cost(cost)
-        # work out best directory by finding minimum cost.
+        # best directory is the one with the minimum cost.
         bestEval = None
-        if len(cost) > 0:
-            bestEval = cost.idxmin()
+        best = self.bestCost()
+        if best is not None:
+            bestEval = best[0]
 
         newConfig.setv('bestEval', bestEval)  # best evaluation
 
@@ -672,6 +1549,85 @@ class ModelSubmit(object):
 
         return newConfig
 
+    @staticmethod
+    def costSignature(obsNames, targets, transMatrix, scale):
+        """
+        Generate a signature for the cost calculation. Costs computed with different signatures are different.
+        :param obsNames: observation names
+        :param targets: targets (numpy array)
+        :param transMatrix: transform matrix (numpy array)
+        :param scale: True if scaling applied.
+        :return: signature (hex string)
+        """
+        info = repr((list(obsNames), np.asarray(targets).tolist(), np.asarray(transMatrix).tolist(), bool(scale)))
+        return hashlib.sha256(info.encode()).hexdigest()
+
+    def costLedger(self, signature):
+        """
+        Get the cost ledger. If the signature has changed it is read from the study index (if there is one).
+        :param signature: signature of the cost calculation (see costSignature).
+        :return: dict of (name, cost) indexed by directory name.
+        """
+        if signature != self._costSignature:
+            self._costSignature = signature
+            self._costLedger = dict()
+            self._bestCost = None
+            if self._index is not None:
+                self._costLedger = self._index.costs(signature)
+            known = set(pathlib.Path(m.dirPath).name for m in self._models.values())
+            for dirName in [d for d in self._costLedger.keys() if d not in known]:  # no model so ignore.
+                del self._costLedger[dirName]
+            for dirName, (name, cost) in self._costLedger.items():
+                self._updateBest(dirName, name, cost)
+        return self._costLedger
+
+    def addCosts(self, costs):
+        """
+        Add costs to the ledger and update the best cost.
+        :param costs: iterable of (dirName, name, cost)
+        :return: nothing
+        """
+        costs = list(costs)
+        for dirName, name, cost in costs:
+            self._costLedger[dirName] = (name, float(cost))
+            self._updateBest(dirName, name, float(cost))
+        if self._index is not None:
+            self._index.updateCosts(self._costSignature, costs)
+            self._index.commit()
+
+    def _updateBest(self, dirName, name, cost):
+        """
+        Update the best (lowest) cost with a new cost. Costs that are not finite (e.g. nan from missing obs)
+          are never the best.
+        """
+        if not np.isfinite(cost):
+            return
+        if (self._bestCost is None) or (cost < self._bestCost[1]):
+            self._bestCost = (name, cost, dirName)
+
+    def removeCost(self, dirName):
+        """
+        Remove the cost for a model simulation directory from the ledger.
+        :param dirName: name of the directory
+        :return: nothing
+        """
+        if self._costLedger.pop(dirName, None) is not None and self._bestCost is not None and \
+                self._bestCost[2] == dirName:  # removed the best so work it out again.
+            self._bestCost = None
+            for d, (name, cost) in self._costLedger.items():
+                self._updateBest(d, name, cost)
+        if self._index is not None:
+            self._index.removeCosts([dirName])
+
+    def bestCost(self):
+        """
+        :return: name and cost of the best (lowest cost) simulation in the ledger or None if nothing in it.
+          The ledger is only updated by runCost.
+        """
+        if self._bestCost is None:
+            return None
+        return self._bestCost[:2]
+
     def runConfig(self, config, filename=None):
         """
         **copy** config and add parameters and obs to it . Config is returned and maybe saved if filename provided.
@@ -685,14 +1641,13 @@ class ModelSubmit(object):
         """
         newConfig = config.copy(filename=filename)
 
-        paramObs = self.paramObs()  # get params & obs
-        if paramObs is None:
+        if self.paramObs() is None:  # initialises store if needed.
             if filename is not None:
                 newConfig.save()
             return newConfig  # no data so return the config.
 
-        params = paramObs.reindex(columns=self.paramNames())
-        obs = paramObs.reindex(columns=self.obsNames())  # extract the obs.
+        params = self._paramObs.frame(columns=self.paramNames())
+        obs = self._paramObs.frame(columns=self.obsNames())  # extract the obs.
 
         # update newConfig with obs & params. As normal all are unscaled.
 
@@ -720,22 +1675,16 @@ class ModelSubmit(object):
 
         # initialise _paramObs.
         if not hasattr(self, '_paramObs'):
-            self._paramObs = dict()  # intitialise _paramObs with empty Dict.
-
-        if obs is not None:
-            # got some obs so store them!
-            key = self.genKey(params.to_dict())
-            # will trigger error if params is None (or technically does not have a to_dict() method)
-            s = obs.append(params).rename(obs.name)
-            self._paramObs[key] = s
+            self._paramObs = ParamObsStore.ParamObsStore()  # intitialise _paramObs with empty store.
 
-        # now to return values.
         if params is not None:
+            # will trigger error if params is None (or technically does not have a to_dict() method)
             key = self.genKey(params.to_dict())
-            return self._paramObs[key]
-
-        # got to here so no params set -- so return everything
-        if len(self._paramObs) == 0:  # nothing there
-            return None
-
-        return pd.DataFrame(list(self._paramObs.values()))  # name coming from obs series.
+            if obs is not None:
+                # got some obs so store them!
+                self._paramObs.add(key, obs, params)
+            # now to return values.
+            return self._paramObs.row(key)
+
+        # got to here so no params set -- so return everything. Name coming from obs series.
+        return self._paramObs.frame()
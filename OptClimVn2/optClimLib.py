@@ -3,9 +3,15 @@
     gatherNetCDF -- read data from postprocessed netcdf file.
    - get_default -- get default value. like get method to dict.
    - copyDir: Copy directory recursively in a sensible way to allow testing
+   - encodeRunNumber/decodeRunNumber -- convert run numbers to/from fixed width strings in base 10, 36 or 62.
+   - studyLock -- context manager for an exclusive lock on a study directory.
+   - breakLink -- replace a (hard linked) file by a copy of itself.
+   - reflink/cowCopy/cowTree -- copy files and directories using copy-on-write clones or hard links where possible.
 
 '''
+import contextlib
 import errno
+import fnmatch
 import os
 import shutil
 import stat
@@ -14,7 +20,12 @@ import netCDF4
 import numpy as np
 import pandas as pd
 
-__version__ = '0.2.0'
+try:
+    import fcntl  # file locking. Not available on windows.
+except ImportError:
+    fcntl = None
+
+__version__ = '0.3.0'
 # subversion properties
 subversionProperties = \
     {
@@ -62,10 +73,13 @@ def delDirContents(dir):
         for entry in entries:
             if entry.is_file() or entry.is_symlink():
                 try:
-                    os.chmod(entry, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-                except WindowsError:  # dam windows.
-                    os.chmod(entry, stat.S_IWRITE)
-                os.remove(entry.path)  # and remove it
+                    os.remove(entry.path)  # and remove it
+                except PermissionError:  # only change mode when needed -- file might be hard linked to another.
+                    try:
+                        os.chmod(entry, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+                    except WindowsError:  # dam windows.
+                        os.chmod(entry, stat.S_IWRITE)
+                    os.remove(entry.path)  # and remove it
             elif entry.is_dir():  # directory -- remove everything in it.
                 shutil.rmtree(entry.path, onerror=errorRemoveReadonly)  # remove all directories
 
@@ -191,3 +205,153 @@ def genSeed(param):
         seed = seed // 2
 
     return seed
+
+
+_runNumberAlphabet = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def encodeRunNumber(num, digits, radix=10):
+    """
+    Convert a run number to a fixed width string. Digits are 0-9 then a-z then A-Z.
+    :param num: non-negative integer to convert
+    :param digits: width of string. Must be large enough for num.
+    :param radix (default 10): base to use -- 10, 36 or 62 (or anything in between).
+    :return: string. For radix 10 this is the same as '%0*d' % (digits, num)
+    """
+    if not 2 <= radix <= len(_runNumberAlphabet):
+        raise ValueError(f"radix {radix} not supported")
+    chars = []
+    for indx in range(digits):
+        num, remainder = divmod(num, radix)
+        chars.append(_runNumberAlphabet[remainder])
+    if num != 0:
+        raise ValueError(f"Need more than {digits} digits")
+    return ''.join(reversed(chars))
+
+
+def decodeRunNumber(string, radix=10):
+    """
+    Convert a string generated by encodeRunNumber back to a number.
+    :param string: string to convert
+    :param radix (default 10): base used.
+    :return: integer or None if string is not valid for radix.
+    """
+    num = 0
+    for char in string:
+        value = _runNumberAlphabet.find(char)
+        if value < 0 or value >= radix:
+            return None
+        num = num * radix + value
+    return num
+
+
+@contextlib.contextmanager
+def studyLock(path):
+    """
+    Context manager that holds an exclusive lock on a file while in the context. Use to stop
+    more than one process changing a study directory at the same time. Blocks until lock acquired.
+    The lock goes when the process holding it dies so stale locks are not a problem.
+    Where file locking is not available (no fcntl) nothing is done.
+    :param path: path to lock file. Created if it does not exist.
+    """
+    with open(path, 'a') as fp:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def breakLink(path):
+    """
+    Replace a (possibly hard linked) file by a copy of itself so it can be changed without changing anything
+    else. Nothing is done if path does not exist.
+    :param path: path to file
+    """
+    if not os.path.isfile(path):
+        return
+    tmpPath = str(path) + '.tmp'
+    shutil.copy2(path, tmpPath)
+    os.replace(tmpPath, path)
+
+
+FICLONE = 0x40049409  # linux ioctl that makes a file a copy-on-write clone of another.
+
+
+def reflink(src, dst):
+    """
+    Make dst a copy-on-write clone (reflink) of src. The clone shares data with src until either is changed so
+    is as cheap as a hard link but safe to change. Needs a file system that supports it (e.g. btrfs, xfs).
+    :param src: path to source file
+    :param dst: path to destination file
+    :return: dst. OSError raised if cloning is not supported.
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported", str(dst))
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+    return dst
+
+
+def cowCopy(src, dst, link=True, useReflink=True):
+    """
+    Copy a file as cheaply as possible. Tries, in order, a copy-on-write clone (see reflink), a hard link (if link
+    is True) and a real copy.
+    :param src: path to source file
+    :param dst: path to destination file
+    :param link (default True): If True hard link when cloning fails. Hard linked files share their data with src
+        so must not be changed in place.
+    :param useReflink (default True): If True try cloning first.
+    :return: how the copy was made -- 'reflink', 'link' or 'copy'
+    """
+    if useReflink:
+        try:
+            reflink(src, dst)
+            return 'reflink'
+        except OSError:
+            pass
+    if link:
+        try:
+            os.link(src, dst)
+            return 'link'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def cowTree(srcDir, dstDir, copyPatterns=()):
+    """
+    Make dstDir a copy of srcDir as cheaply as possible. Each file is cloned (see reflink) when the file
+    system supports it. Otherwise files matching copyPatterns are copied and all others hard linked (falling
+    back to copying). So only files that get changed in place need to be in copyPatterns.
+    Once cloning has failed it is not tried again.
+    :param srcDir: path to source directory
+    :param dstDir: path to destination directory. Should not exist.
+    :param copyPatterns (default ()): glob patterns (matched against the path relative to srcDir and the file name)
+        for files that must not be hard linked.
+    :return: dict counting how files were made -- keys are 'reflink', 'link' and 'copy'.
+    """
+    counts = dict(reflink=0, link=0, copy=0)
+    useReflink = [True]  # list so the copy function can change it.
+
+    def copyFn(src, dst):
+        relPath = os.path.relpath(src, srcDir)
+        name = os.path.basename(src)
+        link = not any([fnmatch.fnmatch(relPath, p) or fnmatch.fnmatch(name, p) for p in copyPatterns])
+        how = cowCopy(src, dst, link=link, useReflink=useReflink[0])
+        useReflink[0] = (how == 'reflink')
+        counts[how] += 1
+        return dst
+
+    shutil.copytree(srcDir, dstDir, copy_function=copyFn)  # symbolic links followed -- as copytree does.
+    return counts
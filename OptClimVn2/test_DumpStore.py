@@ -0,0 +1,84 @@
+"""
+Test cases for DumpStore
+"""
+
+import hashlib
+import os
+import pathlib
+import tempfile
+import unittest
+
+from OptClimVn2 import DumpStore
+
+
+class testDumpStore(unittest.TestCase):
+    """
+    Test cases for DumpStore. There should be one for every method in DumpStore.
+    """
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.testDir = pathlib.Path(self.tmpDir.name)
+        self.store = DumpStore.DumpStore(self.testDir / '.dumpStore')
+        self.dump = self.testDir / 'ref1' / 'xnmea.astart'
+        self.dump.parent.mkdir()
+        self.dump.write_bytes(bytes(range(256)) * 100)
+
+    def tearDown(self):
+        """
+        Clean up
+        :return:
+        """
+        self.tmpDir.cleanup()
+
+    def test_digest(self):
+        """
+        Test digest gives the sha256 of a file and notices when the file changes.
+        :return:
+        """
+        self.assertEqual(self.store.digest(self.dump), hashlib.sha256(self.dump.read_bytes()).hexdigest())
+        self.dump.write_bytes(b'changed')
+        self.assertEqual(self.store.digest(self.dump), hashlib.sha256(b'changed').hexdigest())
+
+    def test_add(self):
+        """
+        Test add stores a dump once and stored dumps are read only.
+        :return:
+        """
+        digest = self.store.add(self.dump)
+        path = self.store.objectPath(digest)
+        self.assertEqual(path.read_bytes(), self.dump.read_bytes())
+        self.assertEqual(path.stat().st_mode & 0o222, 0)  # read only
+        self.assertFalse(os.path.samefile(path, self.dump))  # not linked to the source.
+        # identical dump somewhere else is the same object.
+        dump2 = self.testDir / 'ref2.astart'
+        dump2.write_bytes(self.dump.read_bytes())
+        self.assertEqual(self.store.add(dump2), digest)
+        self.assertEqual(len(list((self.store.path / 'objects').glob('*/*'))), 1)
+
+    def test_place(self):
+        """
+        Test place puts stored dumps where wanted.
+        :return:
+        """
+        for symlink in [False, True]:
+            dst = self.testDir / f'run{symlink}' / 'W' / self.dump.name
+            dst.parent.mkdir(parents=True)
+            how = self.store.place(self.dump, dst, symlink=symlink)
+            self.assertIn(how, ['symlink', 'reflink', 'link', 'copy'])
+            self.assertEqual(how == 'symlink', symlink)
+            self.assertEqual(dst.read_bytes(), self.dump.read_bytes())
+            # place again -- replaces dst.
+            self.store.place(self.dump, dst, symlink=not symlink)
+            self.assertEqual(dst.is_symlink(), not symlink)
+            self.assertEqual(dst.read_bytes(), self.dump.read_bytes())
+        self.assertEqual(len(list((self.store.path / 'objects').glob('*/*'))), 1)
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
@@ -5,6 +5,7 @@ This test routine needs OPTCLIMTOP specified sensibly. (ideally so that $OPTCLIM
 """
 import collections
 import filecmp
+import math
 import os
 import re
 import shutil
@@ -167,6 +168,104 @@ class testHadCM3(unittest.TestCase):
         self.assertListEqual(list(m.getObs().keys()), list(expectObs.keys()))
         self.assertNotEqual(m.getObs(), expectObs)
 
+    def test_classNameLists(self):
+        """
+        Test that the namelist information is shared by all instances and can be overridden per instance.
+        """
+        convNameList, metaFn = HadCM3.HadCM3.classNameLists()
+        self.assertIs(convNameList, HadCM3.HadCM3.classNameLists()[0])  # built once.
+        self.assertEqual(convNameList['VF1'], (HadCM3._namedTupClass(var='VF1', namelist='SLBC21', file='CNTLATM'),))
+        self.assertIs(metaFn['RHCRIT'], HadCM3.cloudRHcrit)
+        self.assertEqual(metaFn['ASTART'].__name__, 'astart_initHist_nlcfiles')
+        with self.assertRaises(TypeError):  # can't change class info
+            convNameList['VF1'] = None
+        model2 = HadCM3.HadCM3(self.model.dirPath)  # read the existing model
+        self.assertEqual(self.model.allParamNames(), model2.allParamNames())
+        # override a parameter for one instance.
+        model2.genVarToNameList('VF1', nameListVar='VF2', nameListName='SLBC21', nameListFile='CNTLATM')
+        self.assertEqual(model2._convNameList['VF1'][0].var, 'VF2')
+        self.assertEqual(self.model._convNameList['VF1'][0].var, 'VF1')
+        self.assertEqual(convNameList['VF1'][0].var, 'VF1')
+        self.assertEqual(self.model.allParamNames(), model2.allParamNames())  # same params in same order.
+
+    def test_metaFnArrays(self):
+        """
+        Test vectorised meta functions give exactly the same values as the scalar ones and as the
+        original (loop based) scalar code.
+        """
+
+        # original scalar code.
+        def IDLinterpol(inyold, inxold, xnew):
+            yold = np.zeros(4)
+            xold = np.zeros(4)
+            yold[1:] = inyold
+            xold[1:] = inxold
+            if xnew <= xold[2]:
+                return (yold[1] - (((yold[2] - yold[1]) / (xold[2] - xold[1])) * xold[1])) + (
+                        (yold[2] - yold[1]) / (xold[2] - xold[1])) * xnew
+            return (yold[2] - (((yold[3] - yold[2]) / (xold[3] - xold[2])) * xold[2])) + (
+                    (yold[3] - yold[2]) / (xold[3] - xold[2])) * xnew
+
+        def diff_fn(dyndiff, dyndel=6):
+            D2Q = 0.25 * (HadCM3.RADIUS * HadCM3.RADIUS) * (HadCM3.dlat * HadCM3.Pi / 180.) ** 2
+            EN = 1 - math.exp(-1. / (dyndiff * 3600. / HadCM3.timestep))
+            return D2Q * (EN / HadCM3.timestep) ** (1.0 / int(dyndel / 2))
+
+        def rhcrit(value):
+            result = 19 * [value]
+            result[0:3] = [max(0.95, value), max(0.9, value), max(0.85, value)]
+            return result
+
+        def eacf(value):
+            eacf1 = IDLinterpol([0.5, 0.6, 0.65], [0.5, 0.7, 0.8], value)
+            result = 5 * [value] + [(2. * value + eacf1) / 3., (value + 2. * eacf1) / 3.] + 12 * [eacf1]
+            return result
+
+        rng = np.random.default_rng(123456)
+        ranges = {'KAY_GWAVE': (1e4, 2e4), 'ALPHAM': (0.5, 0.65), 'CW_LAND': (1e-4, 2e-3), 'RHCRIT': (0.6, 0.99),
+                  'EACF': (0.5, 0.8), 'DYNDIFF': (1., 48.), 'OcnIceDiff': (1e-5, 1e-4), 'IceMaxConc': (0.95, 1.0),
+                  'OcnIsoDiff': (200., 2000.), 'VF1': (0.5, 2.0)}
+        params = {k: np.append(rng.uniform(lo, hi, 500), [lo, (lo + hi) / 2, hi]) for k, (lo, hi) in ranges.items()}
+        arrays = HadCM3.nameListArrays(params)
+        original = {  # namelist info and original code for meta parameters.
+            'KAY_GWAVE': (HadCM3.gravityWave(namelist=True)[1],
+                          lambda v: IDLinterpol([1.5e05, 2.25e05, 3e05], [1e04, 1.5e04, 2e04], v)),
+            'ALPHAM': (HadCM3.iceAlbedo(namelist=True)[1], lambda v: IDLinterpol([10., 5., 2.], [0.5, 0.57, 0.65], v)),
+            'CW_LAND': (HadCM3.cloudWater(namelist=True)[1],
+                        lambda v: IDLinterpol([2e-05, 5e-05, 5e-04], [1e-04, 2e-04, 2e-03], v)),
+            'RHCRIT': (list(HadCM3.cloudRHcrit(namelist=True))[0], rhcrit),
+            'EACF': (HadCM3.cloudEACF(namelist=True)[0], eacf),
+            'DYNDIFF': (HadCM3.diffusion(namelist=True)[0], lambda v: 18 * [diff_fn(v)] + [4e6])}
+        model = self.model
+        for param, values in params.items():
+            fn = model._metaFn.get(param)
+            for indx, value in enumerate(values):
+                value = float(value)
+                if fn is None:  # simple parameter
+                    scalar = {model._convNameList[param][0]: value}
+                else:
+                    scalar = fn(value)
+                for nl, v in scalar.items():
+                    self.assertTrue(np.array_equal(arrays[nl][indx], v), msg=f"{param} {nl} differ for {value}")
+                # and check against the original code.
+                if param in original:
+                    nl, origFn = original[param]
+                    self.assertTrue(np.array_equal(scalar[nl], origFn(value)), msg=f"{param} differs for {value}")
+        # inverse of diffusion matches original.
+        DPHI = HadCM3.dlat * HadCM3.Pi / 180.
+        D2Q = 0.25 * (HadCM3.RADIUS * HadCM3.RADIUS) * (DPHI * DPHI)
+        for value in params['DYNDIFF']:
+            coeff = diff_fn(value)
+            expect = -1 / math.log(1 - (coeff / D2Q) ** 3 * HadCM3.timestep) * HadCM3.timestep / 3600.0
+            self.assertEqual(HadCM3.diff_fn(coeff, inverse=True), expect)
+        # out of range values fail like the scalar code.
+        with self.assertRaises(NameError):
+            HadCM3.gravityWaveArray([1.5e4, 3e4])
+        with self.assertRaises(AssertionError):
+            HadCM3.cloudEACFArray([0.6, 0.4])
+        with self.assertRaises(KeyError):
+            HadCM3.nameListArrays({'RUNID': ['abcde']})
+
     def test_readMetaParams(self):
         """
         Test that HadCM3 specific meta functions all work..by running the inverse function and checking we got
@@ -287,6 +386,28 @@ class testHadCM3(unittest.TestCase):
         self.assertRaises(Exception, self.model.modifyScript)
         #
 
+    def test_scriptTemplate(self):
+        """
+        Test ScriptTemplate and that creating a model leaves no backup files.
+        """
+        backups = [p.name for p in pathlib.Path(self.model.dirPath).iterdir() if p.name.endswith(('.bak', '.bakR'))]
+        self.assertEqual(backups, [])
+        rules = (HadCM3.scriptRule('a', '^A='), HadCM3.scriptRule('b', 'B', 3))
+        text = "A=1 B\nC=2\nB=3\nA=4\n"
+        template = HadCM3.ScriptTemplate.get(text, rules)
+        self.assertIs(template, HadCM3.ScriptTemplate.get(text, rules))  # compiled once
+        self.assertEqual(template.render(), text)
+        self.assertEqual(template.render(a=lambda line: 'A=x', b=lambda line: 'b'), "A=x\nC=2\nB=3\nA=x\n")
+        # first rule with an action is used. B on line 3 is ignored as rule b only applies to lines 1 & 2.
+        self.assertEqual(template.render(b=lambda line: line.lower()), "a=1 b\nC=2\nB=3\nA=4\n")
+        # rewriting a file keeps its permissions.
+        path = pathlib.Path(self.model.dirPath) / 'test_script'
+        path.write_text(text)
+        path.chmod(0o750)
+        HadCM3.ScriptTemplate.rewrite(path, rules, a=lambda line: line + ' ## modified')
+        self.assertEqual(path.read_text(), "A=1 B ## modified\nC=2\nB=3\nA=4 ## modified\n")
+        self.assertEqual(path.stat().st_mode & 0o777, 0o750)
+
     def test_modifySubmit(self):
         """
         Test modifySubmit
@@ -415,6 +536,34 @@ class testHadCM3(unittest.TestCase):
         # no need to run createWorkDIr as already ran by init
         # just check it exists and is a dir
         self.assertTrue(os.path.isdir(os.path.join(self.model.dirPath, 'W')))
+        # start dumps come from the study dump store. Hidden so not taken for a model simulation.
+        self.assertTrue(str(HadCM3.HadCM3.dumpStoreDir).startswith('.'))
+        refDir = self.testDir / 'ref'
+        refDir.mkdir()
+        (refDir / 'xnmea.astart').write_bytes(b'atmos dump')
+        (refDir / 'xnmea.ostart').write_bytes(b'ocean dump')
+        self.model.dumpStoreDir = self.testDir / '.dumpStore'  # absolute so store not in study dir (tmp).
+        self.model.createWorkDir(refDir)
+        store = HadCM3.DumpStore.DumpStore(self.model.dumpStoreDir)
+        for file in ['xnmea.astart', 'xnmea.ostart']:
+            dump = self.testDir / 'W' / file
+            self.assertEqual(dump.read_bytes(), (refDir / file).read_bytes())
+            self.assertEqual(store.objectPath(store.digest(refDir / file)).read_bytes(), dump.read_bytes())
+
+    def test_createMode(self):
+        """
+        Test that files not changed are shared with the reference directory and those changed are not.
+        :return:
+        """
+        for file in ['STASHC', 'SIZES', 'PRESM_A']:  # not changed so cloned or linked
+            path = self.dirPath / file
+            ref = self.refPath / file
+            self.assertEqual(path.read_bytes(), ref.read_bytes())
+            if path.stat().st_nlink > 1:  # hard linked (not cloned) so should be the same file.
+                self.assertTrue(os.path.samefile(path, ref))
+        for file in ['SCRIPT', 'SUBMIT', 'CNTLATM', 'RECONA', 'INITHIS']:  # changed so must be copies.
+            self.assertFalse(os.path.samefile(self.dirPath / file, self.refPath / file))
+            self.assertNotEqual((self.dirPath / file).read_bytes(), (self.refPath / file).read_bytes())
 
     def test_fixClimFCG(self):
         """
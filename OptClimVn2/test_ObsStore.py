@@ -0,0 +1,87 @@
+"""
+Test cases for ObsStore
+"""
+
+import math
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from OptClimVn2 import ObsStore
+
+
+class testObsStore(unittest.TestCase):
+    """
+    Test cases for ObsStore. There should be one for every method in ObsStore.
+    """
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpDir.name, 'studyObs.sqlite')
+        self.store = ObsStore.ObsStore(self.path, create=True)
+
+    def tearDown(self):
+        """
+        Clean up
+        :return:
+        """
+        self.tmpDir.cleanup()
+
+    def test_append(self):
+        """
+        Test append works -- and does nothing when there is no store.
+        :return:
+        """
+        self.assertTrue(self.store.append('zz001', {'OLR': 240.0, 'RSR': None}, name='run1'))
+        entry = self.store.entry('zz001')
+        self.assertEqual(entry.name, 'run1')
+        self.assertEqual(entry.obs['OLR'], 240.0)
+        self.assertTrue(math.isnan(entry.obs['RSR']))
+        store = ObsStore.ObsStore(os.path.join(self.tmpDir.name, 'missing.sqlite'))
+        self.assertFalse(store.append('zz001', {'OLR': 240.0}))
+        self.assertFalse(store.exists())
+        self.assertEqual(store.obs(), {})
+
+    def test_obs(self):
+        """
+        Test obs gives the latest observations and picks up rows appended by others.
+        :return:
+        """
+        self.store.append('zz001', {'OLR': 240.0})
+        self.store.append('zz002', {'OLR': 241.0})
+        self.assertEqual(set(self.store.obs().keys()), {'zz001', 'zz002'})
+        other = ObsStore.ObsStore(self.path)
+        other.append('zz001', {'OLR': 250.0})
+        self.assertEqual(self.store.entry('zz001').obs['OLR'], 250.0)
+        # replace the store.
+        os.remove(self.path)
+        store = ObsStore.ObsStore(self.path, create=True)
+        store.append('zz003', {'OLR': 1.0})
+        self.assertEqual(list(self.store.obs().keys()), ['zz003'])
+
+    def test_frame(self):
+        """
+        Test frame works
+        :return:
+        """
+        self.assertIsNone(self.store.frame())
+        self.store.append('zz002', {'OLR': 241.0, 'RSR': 100.0}, name='b')
+        self.store.append('zz001', {'OLR': 240.0}, name='a')
+        got = self.store.frame()
+        self.assertEqual(list(got.index), ['a', 'b'])
+        self.assertTrue(np.isnan(got.loc['a', 'RSR']))
+        got = self.store.frame(obsNames=['RSR', 'missing'], dirNames=['zz002', 'zz001', 'zz003'])
+        self.assertEqual(list(got.index), ['b', 'a'])
+        self.assertEqual(list(got.columns), ['RSR', 'missing'])
+        self.assertEqual(got.loc['b', 'RSR'], 100.0)
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
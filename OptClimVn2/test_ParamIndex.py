@@ -0,0 +1,102 @@
+"""
+Test cases for ParamIndex
+"""
+
+import unittest
+
+import numpy as np
+
+from OptClimVn2 import ParamIndex
+
+
+class testParamIndex(unittest.TestCase):
+    """
+    Test cases for ParamIndex. There should be one for every method in ParamIndex.
+    """
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.index = ParamIndex.ParamIndex(scales=dict(VF1=2.0, RHCRIT=0.5))
+        self.params = [('RHCRIT', 0.7), ('VF1', 1.0), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.index.add(self.params, 'key1')
+
+    def test_quantise(self):
+        """
+        Test quantise rounds the way '%.4g' does.
+        :return:
+        """
+        values = [1.0200001, -3.14159e-5, 0.0, 123456.7, 2.5e10, -0.0]
+        got = ParamIndex.quantise(values)
+        expect = np.array([float('%.4g' % v) for v in values])
+        np.testing.assert_array_equal(got, expect)
+        # values on rounding boundaries.
+        values = [302.15, 302.25, 1.0005, 1.0015, 2.0025, 0.12345, 0.7005, 12.345]
+        np.testing.assert_array_equal(ParamIndex.quantise(values), [float('%.4g' % v) for v in values])
+        # and index lookups agree with formatted keys.
+        self.index.add([('VF1', 302.2)], 'key302.2')
+        self.assertIsNone(self.index.lookup([('VF1', 302.15)]))  # '%.4g' gives 302.1
+        self.index.add([('VF1', 302.15)], 'key302.1')
+        self.assertEqual(self.index.lookup([('VF1', 302.2)]), 'key302.2')
+        self.assertEqual(self.index.lookup([('VF1', 302.1)]), 'key302.1')
+
+    def test_split(self):
+        """
+        Test split works
+        :return:
+        """
+        group, values = self.index.split(self.params)
+        self.assertEqual(group, (('RHCRIT', 'VF1'), (('ensembleMember', '0'), ('refDir', "'ref'"))))
+        np.testing.assert_array_equal(values, [0.7, 1.0])
+
+    def test_add(self):
+        """
+        Test add works
+        :return:
+        """
+        self.assertEqual(len(self.index), 1)
+        self.index.add(self.params, 'key2')  # replace
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.lookup(self.params), 'key2')
+        params = [('RHCRIT', 0.7), ('VF1', 1.5), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.index.add(params, 'key3')
+        self.assertEqual(len(self.index), 2)
+
+    def test_lookup(self):
+        """
+        Test lookup works
+        :return:
+        """
+        self.assertEqual(self.index.lookup(self.params), 'key1')
+        # small changes get rounded away.
+        params = [('RHCRIT', 0.7000001), ('VF1', 1.0), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.assertEqual(self.index.lookup(params), 'key1')
+        # but not bigger ones
+        params = [('RHCRIT', 0.701), ('VF1', 1.0), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.assertIsNone(self.index.lookup(params))
+        # and non float values must match.
+        params = [('RHCRIT', 0.7), ('VF1', 1.0), ('ensembleMember', 1), ('refDir', 'ref')]
+        self.assertIsNone(self.index.lookup(params))
+
+    def test_nearest(self):
+        """
+        Test nearest works
+        :return:
+        """
+        params = [('RHCRIT', 0.7), ('VF1', 1.5), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.index.add(params, 'key2')
+        close = [('RHCRIT', 0.701), ('VF1', 1.01), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.assertEqual(self.index.nearest(close, 0.01), 'key1')
+        self.assertIsNone(self.index.nearest(close, 0.001))
+        close = [('RHCRIT', 0.701), ('VF1', 1.49), ('ensembleMember', 0), ('refDir', 'ref')]
+        self.assertEqual(self.index.nearest(close, 0.01), 'key2')
+        # different group so nothing
+        close = [('RHCRIT', 0.701), ('VF1', 1.49), ('ensembleMember', 1), ('refDir', 'ref')]
+        self.assertIsNone(self.index.nearest(close, 0.01))
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
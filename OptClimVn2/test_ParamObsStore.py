@@ -0,0 +1,103 @@
+"""
+Test cases for ParamObsStore
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from OptClimVn2 import ParamObsStore, Submit
+
+
+class testParamObsStore(unittest.TestCase):
+    """
+    Test cases for ParamObsStore. There should be one for every method in ParamObsStore.
+    """
+
+    @staticmethod
+    def key(params):
+        """
+        :param params: pandas series of parameters
+        :return: key for params as ModelSubmit makes them.
+        """
+        return Submit.ModelSubmit.formatKey(list(params.items()))
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.store = ParamObsStore.ParamObsStore(size=2)  # small so growth gets tested.
+        self.obs = []
+        self.params = []
+        for indx in range(0, 5):
+            obs = pd.Series({'OLR': 230.0 + indx, 'RSR': 120.0}).rename(f'run{indx}')
+            params = pd.Series({'VF1': float(indx), 'Experiment': 'Coupled', 'ensembleMember': 0})
+            self.store.add(self.key(params), obs, params)
+            self.obs.append(obs)
+            self.params.append(params)
+
+    def test_add(self):
+        """
+        Test add works -- including replacing.
+        :return:
+        """
+        self.assertEqual(len(self.store), 5)
+        obs = self.obs[2].copy()
+        obs.OLR = 0.0
+        row = self.store.add(self.key(self.params[2]), obs, self.params[2])
+        self.assertEqual(row, 2)
+        self.assertEqual(len(self.store), 5)
+        self.assertEqual(self.store.row(self.key(self.params[2])).OLR, 0.0)
+        # new column for a new row.
+        obs = pd.Series({'OLR': 1.0, 'RSR': 2.0, 'NetFlux': 3.0}).rename('new')
+        params = pd.Series({'VF1': 10.0, 'Experiment': 'Coupled', 'ensembleMember': 0})
+        self.store.add(self.key(params), obs, params)
+        got = self.store.frame()
+        self.assertEqual(got.loc['new', 'NetFlux'], 3.0)
+        self.assertTrue(np.isnan(got.loc['run0', 'NetFlux']))
+
+    def test_row(self):
+        """
+        Test row works
+        :return:
+        """
+        for obs, params in zip(self.obs, self.params):
+            expect = pd.concat([obs, params]).rename(obs.name)
+            got = self.store.row(self.key(params))
+            self.assertEqual(got.name, expect.name)
+            self.assertTrue(np.all(got == expect))
+        # nearby but distinct parameters (different genKeys) get their own rows.
+        obs = pd.Series({'OLR': 1.0}).rename('near1')
+        params = pd.Series({'VF1': 100.0, 'Experiment': 'Coupled', 'ensembleMember': 0})
+        self.store.add(self.key(params), obs, params)
+        obs2 = pd.Series({'OLR': 2.0}).rename('near2')
+        params2 = params.copy()
+        params2.VF1 = 100.1
+        self.store.add(self.key(params2), obs2, params2)
+        self.assertEqual(self.store.row(self.key(params)).name, 'near1')
+        self.assertEqual(self.store.row(self.key(params2)).OLR, 2.0)
+        self.assertEqual(len(self.store), len(self.params) + 2)
+        with self.assertRaises(KeyError):
+            self.store.row(self.key(pd.Series({'VF1': 101.0, 'Experiment': 'Coupled', 'ensembleMember': 0})))
+
+    def test_frame(self):
+        """
+        Test frame works
+        :return:
+        """
+        expect = pd.DataFrame([pd.concat([o, p]).rename(o.name) for o, p in zip(self.obs, self.params)])
+        got = self.store.frame()
+        self.assertTrue(np.all(got == expect))
+        self.assertEqual(list(got.index), [o.name for o in self.obs])
+        got = self.store.frame(columns=['VF1', 'missing'])
+        self.assertEqual(list(got.columns), ['VF1', 'missing'])
+        self.assertTrue(np.all(got.VF1 == expect.VF1))
+        self.assertTrue(got.missing.isnull().all())
+        self.assertIsNone(ParamObsStore.ParamObsStore().frame())
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
@@ -0,0 +1,110 @@
+"""
+Test cases for RunRegistry
+"""
+
+import os
+import pathlib
+import tempfile
+import unittest
+
+from OptClimVn2 import RunRegistry
+
+
+class testRunRegistry(unittest.TestCase):
+    """
+    Test cases for RunRegistry. There should be one for every method in RunRegistry.
+    """
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+        root = pathlib.Path(self.tmpDir.name)
+        self.refDir = root / 'ref'
+        (self.refDir / 'sub').mkdir(parents=True)
+        (self.refDir / 'a.txt').write_text('some data')
+        (self.refDir / 'sub' / 'b.txt').write_text('some more data')
+        self.registry = RunRegistry.RunRegistry(root / 'registry.db')
+        self.entry = RunRegistry.RegistryEntry(dirPath=str(root / 'study' / 'zz001'), fingerprint='abc',
+                                               key=('VF1', '1.0'), name='zz001', params=dict(VF1=1.0),
+                                               obs=dict(olr=240.0))
+
+    def test_fingerprint(self):
+        """
+        Test fingerprint depends on content and names but not location.
+        :return:
+        """
+        fp = RunRegistry.fingerprint(self.refDir)
+        copyDir = pathlib.Path(self.tmpDir.name) / 'copy'
+        (copyDir / 'sub').mkdir(parents=True)
+        (copyDir / 'a.txt').write_text('some data')
+        (copyDir / 'sub' / 'b.txt').write_text('some more data')
+        self.assertEqual(RunRegistry.fingerprint(copyDir), fp)
+        (copyDir / 'sub' / 'b.txt').write_text('different data')
+        self.assertNotEqual(RunRegistry.fingerprint(copyDir), fp)
+        os.rename(copyDir / 'sub' / 'b.txt', copyDir / 'sub' / 'c.txt')
+        (copyDir / 'sub' / 'c.txt').write_text('some more data')
+        self.assertNotEqual(RunRegistry.fingerprint(copyDir), fp)
+
+    def test_refDirFingerprint(self):
+        """
+        Test refDirFingerprint works and gets cached.
+        :return:
+        """
+        fp = self.registry.refDirFingerprint(self.refDir)
+        self.assertEqual(fp, RunRegistry.fingerprint(self.refDir))
+        self.assertIsNone(self.registry.refDirFingerprint(None))
+        self.assertIsNone(self.registry.refDirFingerprint(self.refDir / 'missing'))
+        # a new instance gets it from the registry -- check by changing the cached value.
+        self.registry._connect().execute('UPDATE refDirs SET fingerprint = ?', ('cached',))
+        self.registry.commit()
+        registry = RunRegistry.RunRegistry(self.registry.path)
+        self.assertEqual(registry.refDirFingerprint(self.refDir), 'cached')
+        # but changing a file means it gets recomputed.
+        (self.refDir / 'a.txt').write_text('new data')
+        registry = RunRegistry.RunRegistry(self.registry.path)
+        self.assertEqual(registry.refDirFingerprint(self.refDir), RunRegistry.fingerprint(self.refDir))
+
+    def test_register(self):
+        """
+        Test register and find work.
+        :return:
+        """
+        self.registry.register(self.entry)
+        got = self.registry.find('abc', self.entry.key)
+        self.assertEqual(len(got), 1)
+        self.assertEqual(got[0].dirPath, self.entry.dirPath)
+        self.assertEqual(got[0].params, self.entry.params)
+        self.assertEqual(got[0].obs, self.entry.obs)
+        self.assertEqual(self.registry.find('abcd', self.entry.key), [])
+        self.assertEqual(self.registry.find('abc', ('VF1', '2.0')), [])
+        # replace it.
+        self.registry.register(self.entry._replace(obs=dict(olr=250.0)))
+        got = self.registry.find('abc', self.entry.key)
+        self.assertEqual(len(got), 1)
+        self.assertEqual(got[0].obs, dict(olr=250.0))
+        # visible to others once committed.
+        self.registry.commit()
+        registry = RunRegistry.RunRegistry(self.registry.path, readOnly=True)
+        self.assertEqual(len(registry.find('abc', self.entry.key)), 1)
+        registry.close()
+
+    def test_remove(self):
+        """
+        Test remove works
+        :return:
+        """
+        self.registry.register(self.entry)
+        self.registry.remove([self.entry.dirPath])
+        self.assertEqual(self.registry.find('abc', self.entry.key), [])
+
+    def tearDown(self):
+        self.registry.close()
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
@@ -0,0 +1,129 @@
+"""
+Test cases for RunState
+"""
+
+import pathlib
+import tempfile
+import unittest
+
+from OptClimVn2 import RunState
+
+
+class testRunState(unittest.TestCase):
+    """
+    Test cases for RunState. There should be one for every method in StateTable.
+    """
+
+    def setUp(self):
+        """
+        Standard setup for all test cases
+        :return:
+        """
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpDir.cleanup)
+        self.path = pathlib.Path(self.tmpDir.name) / 'runState.log'
+        self.table = RunState.StateTable(self.path, create=True)
+
+    def test_set(self):
+        """
+        Test set works
+        :return:
+        """
+        self.assertTrue(self.table.set('zz001', RunState.CREATED))
+        self.assertTrue(self.table.set('zz001', RunState.SUBMITTED))
+        lines = self.path.read_text().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split()[0:2], ['zz001', 'SUBMITTED'])
+        with self.assertRaises(ValueError):
+            self.table.set('zz001', 'Finished')
+        # no table so nothing recorded.
+        table = RunState.StateTable(pathlib.Path(self.tmpDir.name) / 'missing.log')
+        self.assertFalse(table.set('zz001', RunState.DONE))
+        self.assertIsNone(table.state('zz001'))
+
+    def test_state(self):
+        """
+        Test state works -- including picking up lines written by others.
+        :return:
+        """
+        self.assertIsNone(self.table.state('zz001'))
+        self.table.set('zz001', RunState.CREATED)
+        self.assertEqual(self.table.state('zz001'), RunState.CREATED)
+        with open(self.path, 'a') as fp:  # as the model scripts do.
+            fp.write('zz001 RUNNING 1600000000\n')
+            fp.write('zz002 POSTPR')  # partly written line.
+        self.assertEqual(self.table.state('zz001'), RunState.RUNNING)
+        self.assertIsNone(self.table.state('zz002'))
+        with open(self.path, 'a') as fp:
+            fp.write('OCESSING 1600000001\n')
+        self.assertEqual(self.table.state('zz002'), RunState.POSTPROCESSING)
+        # table replaced so starts again.
+        self.path.write_text('zz003 DONE 1\n')
+        self.assertEqual(self.table.states(), {'zz003': RunState.DONE})
+
+    def test_states(self):
+        """
+        Test states works
+        :return:
+        """
+        self.table.set('zz001', RunState.CREATED)
+        self.table.set('zz002', RunState.CREATED)
+        self.table.set('zz001', RunState.FAILED)
+        self.assertEqual(self.table.states(), {'zz001': RunState.FAILED, 'zz002': RunState.CREATED})
+        # a new table gets the same.
+        self.assertEqual(RunState.StateTable(self.path).states(), self.table.states())
+
+    def test_counts(self):
+        """
+        Test counts works
+        :return:
+        """
+        self.table.set('zz001', RunState.CREATED)
+        self.table.set('zz002', RunState.DONE)
+        self.table.set('zz003', RunState.DONE)
+        counts = self.table.counts()
+        self.assertEqual(list(counts.keys()), list(RunState.states))
+        self.assertEqual(counts[RunState.DONE], 2)
+        self.assertEqual(counts[RunState.CREATED], 1)
+        self.assertEqual(counts[RunState.RUNNING], 0)
+
+    def test_table(self):
+        """
+        Test table gives a shared table.
+        :return:
+        """
+        path = pathlib.Path(self.tmpDir.name) / 'shared.log'
+        table = RunState.table(path)
+        self.assertFalse(path.exists())
+        self.assertIs(RunState.table(path, create=True), table)
+        self.assertTrue(path.exists())
+        table.set('zz001', RunState.RUNNING)
+        self.assertEqual(RunState.table(str(path)).state('zz001'), RunState.RUNNING)
+
+    def test_compact(self):
+        """
+        Test compact works
+        :return:
+        """
+        for state in RunState.states:
+            self.table.set('zz001', state)
+            self.table.set('zz002', state)
+        self.table.set('zz003', RunState.CREATED)
+        expect = self.table.states()
+        other = RunState.StateTable(self.path)
+        other.states()
+        self.assertFalse(self.table.compact())  # too small.
+        self.assertEqual(len(self.path.read_text().splitlines()), 13)
+        self.assertTrue(self.table.compact(minLines=0))
+        self.assertEqual(len(self.path.read_text().splitlines()), 3)
+        self.assertEqual(self.table.states(), expect)
+        self.assertEqual(RunState.StateTable(self.path).states(), expect)
+        # appending still works and other tables notice the file has been replaced.
+        self.table.set('zz003', RunState.SUBMITTED)
+        self.assertEqual(other.state('zz003'), RunState.SUBMITTED)
+        self.assertFalse(self.table.compact(minLines=0))  # nothing to gain.
+
+
+if __name__ == "__main__":
+    print("Running Test Cases")
+    unittest.main()  ## actually run the test cases
@@ -167,7 +167,7 @@ class testStudyConfig(unittest.TestCase):
         :return: 
         """
 
-        expect = 'cache_file.json'
+        expect = 'cache_file.db'
         got = self.config.cacheFile()
         self.assertEqual(got, expect, msg='cache_file different got %s expected %s' % (got, expect))
 
@@ -580,6 +580,15 @@ class testStudyConfig(unittest.TestCase):
         got = self.config.maxDigits()
         self.assertEqual(expect, got, f'Expected {expect} got {got} ')
 
+    def test_nameRadix(self):
+        """
+        test that nameRadix works
+        """
+
+        self.assertEqual(self.config.nameRadix(), 10)  # default
+        self.config.nameRadix(36)
+        self.assertEqual(self.config.nameRadix(), 36)
+
     def test_copy(self):
         """
         Test that copy works
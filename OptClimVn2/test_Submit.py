@@ -7,6 +7,7 @@ import os
 import shutil
 import tempfile
 import unittest
+import unittest.mock
 import numpy as np
 import numpy.testing as nptest
 import pandas as pd
@@ -178,7 +179,78 @@ class testSubmit(unittest.TestCase):
                     outFile)  # copy over a netcdf file of observations.
         m2 = self.mSubmit.readModelDir(dir)
         self.assertEqual(m.getParams(), m2.getParams())
+        self.assertIsInstance(m2, Submit.RunRecord)  # completed models are stored as records
         self.assertEqual(m, m2)
+        self.assertEqual(m2.model(), m)
+        self.assertNotEqual(m2, name)  # not a model so not equal.
+        self.assertNotEqual(m, name)
+
+    def test_index(self):
+        """
+        Test that the study index gets used and updated.
+        :return:
+        """
+        indexFile = os.path.join(self.dirPath, self.config.cacheFile())
+        self.assertTrue(os.path.isfile(indexFile))
+        # read study again -- should get RunRecords made from the index
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                     None, rootDir=self.dirPath, verbose=self.verbose)
+        self.assertEqual(len(mSubmit._models), 2)
+        for model in self.models:
+            key = mSubmit.genModelKey(model)
+            record = mSubmit._models[key]
+            self.assertIsInstance(record, Submit.RunRecord)
+            self.assertEqual(record.getParams(), model.getParams())
+            self.assertEqual(record.getObs(), model.getObs())
+            # and can get to the full model
+            self.assertEqual(record.model(), model)
+            self.assertEqual(record.ppOutputFile(), model.ppOutputFile())
+
+        # change obs for 1st model. It should be read again.
+        model = self.models[0]
+        obs = model.readObs(series=True)
+        obs.iloc[0] *= 2
+        model.writeObs(obs, verbose=self.verbose)
+        outFile = os.path.join(model.dirPath, self.config.postProcessOutput())
+        st = os.stat(outFile)
+        os.utime(outFile, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))  # make sure mtime changes.
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                     None, rootDir=self.dirPath, verbose=self.verbose)
+        got = mSubmit._models[mSubmit.genModelKey(model)]
+        self.assertEqual(got.getObs(series=True).iloc[0], obs.iloc[0])
+
+        # remove 2nd model. Its entry should go.
+        shutil.rmtree(self.models[1].dirPath, onerror=optClimLib.errorRemoveReadonly)
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                     None, rootDir=self.dirPath, verbose=self.verbose)
+        self.assertEqual(len(mSubmit._models), 1)
+        self.assertEqual(list(mSubmit._index.entries().keys()), ['zz001'])
+
+        # without the index or records full models get read.
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                     None, rootDir=self.dirPath, verbose=self.verbose, useIndex=False,
+                                     useRecords=False)
+        for m in mSubmit._models.values():
+            self.assertIsInstance(m, ModelSimulation.ModelSimulation)
+
+    def test_readDir(self):
+        """
+        Test that reading dirs in parallel gives the same as reading them serially.
+        :return:
+        """
+        serial = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                    None, rootDir=self.dirPath, verbose=self.verbose, useIndex=False)
+        for pool in ['thread', 'process']:
+            parallel = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                          None, rootDir=self.dirPath, verbose=self.verbose, useIndex=False,
+                                          readWorkers=2, readPool=pool)
+            self.assertEqual(list(serial._models.keys()), list(parallel._models.keys()))
+            for key, model in serial._models.items():
+                self.assertEqual(model, parallel._models[key])
+        with self.assertRaises(ValueError):
+            Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                               None, rootDir=self.dirPath, verbose=self.verbose, useIndex=False,
+                               readWorkers=2, readPool='fred')
 
     def test_genKey(self):
         """
@@ -195,6 +267,37 @@ class testSubmit(unittest.TestCase):
         pDict = {'zz': 1.0200001, 'aa': 1, 'nn': [0, 1]}
         key = self.mSubmit.genKey(pDict)
         self.assertEqual(key, expect)
+        # other formats
+        self.assertEqual(self.mSubmit.genKey(pDict, fpFmt='%.2f'), ('aa', '1', 'nn', '[0, 1]', 'zz', '1.02'))
+
+    def test_canonicalKey(self):
+        """
+        Tests for canonicalKey -- including that remembered keys are right.
+        :return:
+        """
+        pDict = {'zz': 1.02, 'aa': 1, 'RUNID': 'zz001', 'bb': True}
+        expect = ((('aa', 1), ('bb', True), ('zz', 1.02)), ('aa', '1', 'bb', 'True', 'zz', '1.02'))
+        self.assertEqual(self.mSubmit.canonicalKey(pDict), expect)
+        self.assertEqual(self.mSubmit.canonicalKey(dict(pDict)), expect)  # remembered.
+        # values that compare equal but are of different types are different.
+        pDict2 = dict(pDict, bb=1)
+        self.assertEqual(self.mSubmit.canonicalKey(pDict2)[1], ('aa', '1', 'bb', '1', 'zz', '1.02'))
+        # cache is bounded.
+        self.mSubmit.keyCacheSize = 5
+        for v in range(10):
+            self.mSubmit.canonicalKey(dict(pDict, zz=float(v)))
+        self.assertEqual(len(self.mSubmit._keyCache), 5)
+        self.assertEqual(self.mSubmit.canonicalKey(pDict), expect)
+        # changing rules forgets remembered keys.
+        self.mSubmit.ignoreKeys = ['RUNID', 'bb']
+        self.assertEqual(self.mSubmit.canonicalKey(pDict)[1], ('aa', '1', 'zz', '1.02'))
+        self.mSubmit.keyFn = {'aa': lambda v: v * 2}
+        self.assertEqual(self.mSubmit.canonicalKey(pDict)[1], ('aa', '2', 'zz', '1.02'))
+        # refDir gets rewritten.
+        self.mSubmit.renameRefDir = {'ref1': 'ctl'}
+        pDict = dict(pDict, refDir='ref1')
+        self.assertEqual(self.mSubmit.canonicalKey(pDict)[1], ('aa', '2', 'refDir', "'ctl'", 'zz', '1.02'))
+        self.assertEqual(pDict['refDir'], 'ctl')
 
     def test_transMatrix(self):
         """
@@ -233,6 +336,83 @@ class testSubmit(unittest.TestCase):
 
         m2 = self.mSubmit.model(params)
         self.assertEqual(m, m2)
+        # shift a parameter by 0.5% of its range. Should not find it.
+        name = self.config.paramNames()[0]
+        ranges = self.config.paramRanges()
+        delta = 0.005 * (ranges.loc['maxParam', name] - ranges.loc['minParam', name])
+        params[name] += delta
+        self.assertIsNone(self.mSubmit.model(params))
+        # unless we allow some tolerance
+        self.mSubmit.paramTol = 0.01
+        self.assertEqual(self.mSubmit.model(params), m)
+        self.mSubmit.paramTol = 0.001
+        self.assertIsNone(self.mSubmit.model(params))
+        # exact hits (including parameters that give the same key) never need the numeric index.
+        params = m.getParams()
+        params[name] *= 1 + 1e-6
+        with unittest.mock.patch.object(self.mSubmit, '_paramIndex') as index:
+            self.assertEqual(self.mSubmit.model(params), m)
+            index.nearest.assert_not_called()
+            index.lookup.assert_not_called()
+
+    def test_importModel(self):
+        """
+        Test that models get imported from a run registry and that missing observations get computed.
+        :return:
+        """
+        regDir = tempfile.TemporaryDirectory()
+        otherDir = tempfile.TemporaryDirectory()
+        self.addCleanup(optClimLib.delDirContents, otherDir.name)
+        self.addCleanup(optClimLib.delDirContents, regDir.name)
+        registry = os.path.join(regDir.name, 'registry.db')
+        # make the existing simulations miss an observation.
+        obsNames = self.config.obsNames()
+        dropName = self.config.obsNames(add_constraint=False)[-1]
+        keepNames = [k for k in obsNames if k != dropName]
+        configA = copy.deepcopy(self.config)
+        configA.obsNames(self.config.obsNames(add_constraint=False)[:-1])
+        self.assertEqual(configA.obsNames(), keepNames)
+        for dir in self.modelDirs:
+            m = ModelSimulation.ModelSimulation(dir, obsNames=obsNames)
+            obs = m.readObs(series=True)
+            m.writeObs(obs.loc[keepNames])
+        studyA = Submit.ModelSubmit(configA, ModelSimulation.ModelSimulation, None, rootDir=self.dirPath,
+                                    registry=registry)
+        self.assertEqual(len(studyA._models), 2)
+        # now a new study with all the observations.
+        studyB = Submit.ModelSubmit(copy.deepcopy(self.config), ModelSimulation.ModelSimulation, None,
+                                    fakeFn=config.fake_fn, rootDir=otherDir.name, registry=registry)
+        self.assertEqual(len(studyB._models), 0)
+        src = ModelSimulation.ModelSimulation(self.modelDirs[0], obsNames=keepNames)
+        params = src.getParams()
+        m = studyB.model(params, update=True)
+        self.assertIsNotNone(m)
+        self.assertEqual(len(studyB._modelsToSubmit), 0)
+        self.assertEqual(os.path.dirname(m.dirPath), otherDir.name)
+        self.assertEqual(m.getParams(), params)
+        obs = m.getObs()
+        for k in keepNames:  # obs we had are kept
+            self.assertEqual(obs[k], src.getObs()[k])
+        self.assertIsNotNone(obs[dropName])  # and missing one computed.
+        # original not changed.
+        src = ModelSimulation.ModelSimulation(self.modelDirs[0], obsNames=obsNames)
+        self.assertIsNone(src.getObs()[dropName])
+        cfgFile = os.path.basename(src._configFilePath)  # configuration never shared with the original.
+        self.assertFalse(os.path.samefile(os.path.join(m.dirPath, cfgFile), os.path.join(src.dirPath, cfgFile)))
+        # now have it so just found.
+        self.assertEqual(studyB.model(params, update=True), m)
+        dirs = [d for d in os.listdir(otherDir.name) if os.path.isdir(os.path.join(otherDir.name, d))]
+        self.assertEqual(dirs, [os.path.basename(m.dirPath)])
+        # and something not in the registry gets queued.
+        params[self.config.paramNames()[0]] *= 1.1
+        self.assertIsNone(studyB.model(params, update=True))
+        self.assertEqual(len(studyB._modelsToSubmit), 1)
+        # and study B's model got registered so a new study finds it with all observations.
+        studyB.commit()
+        fingerprint = studyB._registry.refDirFingerprint(studyB.refDir)
+        keyParams = studyB.keyParams(studyB.modelParams(m))
+        got = studyB._registry.find(fingerprint, studyB.registryKey(keyParams))
+        self.assertEqual(len(got), 2)
 
     def test_nextName(self):
         """
@@ -276,6 +456,55 @@ class testSubmit(unittest.TestCase):
         with self.assertRaises(ValueError):
             result = next(nameGen3)  # should trigger an error
 
+        # counter is only stored once a directory is created so names not used get given again.
+        self.mSubmit.config.baseRunID('zz')
+        self.mSubmit.config.maxDigits(3)
+        dir, name = next(self.mSubmit.nextName())
+        self.assertEqual(name, 'zz013')
+        self.assertEqual(next(self.mSubmit.nextName()), (dir, name))
+        self.assertIsNone(self.mSubmit.nameCounter('zz:3:10'))
+        dir.mkdir()
+        self.mSubmit.nameUsed(dir)
+        self.assertEqual(self.mSubmit.nameCounter('zz:3:10'), 13)
+        self.assertEqual(next(self.mSubmit.nextName()), (self.mSubmit.rootDir / 'zz014', 'zz014'))
+        # and never stored when read only.
+        self.mSubmit.readOnly = True
+        dir, name = next(self.mSubmit.nextName())
+        dir.mkdir()
+        self.mSubmit.nameUsed(dir)
+        self.assertEqual(self.mSubmit.nameCounter('zz:3:10'), 13)
+        self.mSubmit.readOnly = False
+        self.assertEqual(next(self.mSubmit.nextName()), (self.mSubmit.rootDir / 'zz015', 'zz015'))
+
+        # base 36 and 62 names.
+        self.mSubmit.config.baseRunID('ab')
+        for radix, expect in [(36, ['ab009', 'ab00a', 'ab00b']), (62, ['ab00c', 'ab00d', 'ab00e'])]:
+            self.mSubmit.config.nameRadix(radix)
+            if radix == 36:  # start from an existing directory
+                (self.mSubmit.rootDir / 'ab008').mkdir()
+            else:  # carry on from base 36 names
+                (self.mSubmit.rootDir / 'ab00b').mkdir()
+            got = [name for (dir, name), indx in zip(self.mSubmit.nextName(), range(3))]
+            self.assertEqual(got, expect)
+
+    def test_encodeRunNumber(self):
+        """
+        Test encodeRunNumber and decodeRunNumber
+        :return:
+        """
+        for num in [0, 7, 99, 999]:
+            self.assertEqual(optClimLib.encodeRunNumber(num, 3), '%3.3d' % num)
+        self.assertEqual(optClimLib.encodeRunNumber(35, 2, radix=36), '0z')
+        self.assertEqual(optClimLib.encodeRunNumber(36 ** 2 - 1, 2, radix=36), 'zz')
+        self.assertEqual(optClimLib.encodeRunNumber(61, 2, radix=62), '0Z')
+        with self.assertRaises(ValueError):
+            optClimLib.encodeRunNumber(1000, 3)
+        for radix in [10, 36, 62]:
+            for num in [0, 1, 35, 61, 200]:
+                self.assertEqual(optClimLib.decodeRunNumber(optClimLib.encodeRunNumber(num, 3, radix=radix),
+                                                            radix=radix), num)
+        self.assertIsNone(optClimLib.decodeRunNumber('0a', radix=10))
+
     def test_submit(self):
         """
         Test submission works.
@@ -324,6 +553,80 @@ class testSubmit(unittest.TestCase):
 
         # now read in everything and rerun a case. Should have the same no of directories but only one case submitted
 
+    def test_readNewDirs(self):
+        """
+        Test that readNewDirs picks up models made by another ModelSubmit and they do not get made again.
+        :return:
+        """
+        other = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                   None, fakeFn=config.fake_fn, rootDir=self.dirPath, verbose=self.verbose)
+        params = self.config.beginParam().to_dict()
+        params.update(ensembleMember=0)
+        for value in [2.0, 3.0]:
+            params['VF1'] = value
+            self.assertIsNone(self.mSubmit.model(params, update=True))
+            if value == 2.0:  # other one makes the first.
+                self.assertIsNone(other.model(params, update=True))
+        status, nmodels, finalConfig = other.submit()
+        self.assertEqual(nmodels, 1)
+        self.assertEqual(self.mSubmit.readNewDirs(), ['zz003'])
+        self.assertEqual(len(list(self.mSubmit.modelSubmit())), 1)  # only one left to make
+        params['VF1'] = 2.0
+        self.assertIsNotNone(self.mSubmit.model(params))
+        self.assertEqual(self.mSubmit.readNewDirs(), [])  # nothing new.
+        # and submitting makes the remaining one with the next name. No temporary dirs left behind.
+        self.mSubmit.fakeFn = config.fake_fn
+        status, nmodels, finalConfig = self.mSubmit.submit()
+        self.assertEqual(nmodels, 1)
+        dirs = sorted([d.name for d in self.mSubmit.rootDir.iterdir() if d.is_dir()])
+        self.assertEqual(dirs, ['zz001', 'zz002', 'zz003', 'zz004'])
+        # a run without observations (e.g. still running) is only new once.
+        params['VF1'] = 5.0
+        dir = os.path.join(self.dirPath, 'zz005')
+        ModelSimulation.ModelSimulation(dir, create=True, name='zz005',
+                                        obsNames=self.config.obsNames(), parameters=params,
+                                        refDirPath=os.path.join(self.refPath, 'start'),
+                                        ppOutputFile=self.config.postProcessOutput())
+        self.mSubmit.setRunState(dir, 'RUNNING')
+        self.assertEqual(self.mSubmit.readNewDirs(), ['zz005'])
+        self.assertEqual(self.mSubmit.readNewDirs(), [])
+        # and nor is it new to a ModelSubmit which read it at start up.
+        fresh = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                   None, rootDir=self.dirPath, noObs='continue', verbose=self.verbose)
+        self.assertEqual(fresh.readNewDirs(), [])
+
+    def test_createModels(self):
+        """
+        Test createModels works -- serially, concurrently and that failures get cleaned up.
+        :return:
+        """
+        params = self.config.beginParam().to_dict()
+        params.update(ensembleMember=0)
+        for pool, workers in [('thread', 1), ('thread', 2), ('process', 2)]:
+            self.mSubmit.createWorkers = workers
+            self.mSubmit.createPool = pool
+            toCreate = []
+            for indx, value in enumerate([2.0, 3.0, 4.0]):
+                name = f'{pool[0]}{workers}{indx}'
+                params['VF1'] = value
+                toCreate.append((os.path.join(self.dirPath, name),
+                                 dict(obsNames=self.config.obsNames(), create=True, name=name,
+                                      refDirPath=os.path.join(self.refPath, 'start'),
+                                      ppOutputFile=self.config.postProcessOutput(), parameters=params.copy())))
+            models = self.mSubmit.createModels(toCreate)
+            self.assertEqual([m.name() for m in models], [kwargs['name'] for createDir, kwargs in toCreate])
+            for m, (createDir, kwargs) in zip(models, toCreate):
+                self.assertEqual(m.getParams(), kwargs['parameters'])
+                self.assertTrue(os.path.isdir(createDir))
+
+        # now fail to create one -- all should be cleaned up.
+        toCreate[1][1]['refDirPath'] = os.path.join(self.dirPath, 'not_there')
+        toCreate = [(createDir + 'f', kwargs) for createDir, kwargs in toCreate]
+        with self.assertRaises(Exception):
+            self.mSubmit.createModels(toCreate)
+        for createDir, kwargs in toCreate:
+            self.assertFalse(os.path.exists(createDir))
+
     def test_params(self):
         """
         Test params works works
@@ -367,6 +670,48 @@ class testSubmit(unittest.TestCase):
         expectObs *= scales
         self.assertTrue(np.all(expectObs == obs))
 
+    def test_storedObs(self):
+        """
+        Test storedObs gets observations from the study observation store.
+        :return:
+        """
+        self.assertIsNone(self.mSubmit.storedObs())  # no store.
+        expect = self.mSubmit.obs(scale=True)
+        self.mSubmit._obsStore.create()
+        self.assertIsNone(self.mSubmit.storedObs())  # store has nothing in it.
+        models = list(self.mSubmit._models.values())
+        models[0].writeObs(models[0].getObs())
+        self.assertIsNone(self.mSubmit.storedObs())  # store missing a model.
+        models[1].writeObs(models[1].getObs())
+        got = self.mSubmit.storedObs()
+        self.assertEqual(list(got.index), list(expect.index))
+        self.assertEqual(list(got.columns), list(expect.columns))
+        nptest.assert_allclose(got.values, expect.values)
+        nptest.assert_allclose(self.mSubmit.obs(scale=False).values, self.mSubmit.obsMatrix(scale=False)[2])
+        # observation file written (e.g. by a post-processing script) after the store so store not used.
+        obsFile = os.path.join(models[1].dirPath, self.config.postProcessOutput())
+        future = os.path.getmtime(obsFile) + 3600
+        os.utime(obsFile, (future, future))
+        self.assertIsNone(self.mSubmit.storedObs())
+
+    def test_obsMatrix(self):
+        """
+        Test obsMatrix works
+        :return:
+        """
+        names, obsNames, obs = self.mSubmit.obsMatrix(scale=False)
+        self.assertEqual(names, [m.name() for m in self.mSubmit._models.values()])
+        self.assertEqual(obsNames, self.mSubmit.obsNames())
+        expect = np.array([[m.getObs()[k] for k in obsNames] for m in self.mSubmit._models.values()])
+        nptest.assert_array_equal(obs, expect)
+        # scaled and subset of obs. Missing obs are nan.
+        want = obsNames[0:2] + ['missing']
+        names, obsNames, obs = self.mSubmit.obsMatrix(obsNames=want)
+        self.assertEqual(obsNames, want)
+        scales = self.config.scales(obsNames=want).values
+        nptest.assert_allclose(obs[:, 0:2], expect[:, 0:2] * scales[0:2])
+        self.assertTrue(np.all(np.isnan(obs[:, 2])))
+
     def test_rerunModel(self):
         """
         Test that rerunModel works
@@ -429,6 +774,93 @@ class testSubmit(unittest.TestCase):
         expect = expect @ Tmat.T
         expect = np.sqrt((expect ** 2).sum(1) / len(obs.columns))
         nptest.assert_allclose(expect, fConfig.cost())
+        self.assertEqual(fConfig.getv('bestEval'), expect.idxmin())
+        self.assertEqual(self.mSubmit.bestCost(), (expect.idxmin(), expect.min()))
+        # costs that are not finite never become the best.
+        for dirName in ['zz001', 'zz002']:
+            self.mSubmit.removeCost(dirName)
+        self.assertIsNone(self.mSubmit.bestCost())
+        self.mSubmit.addCosts([('zz009', 'zz009', np.nan), ('zz010', 'zz010', 2.0), ('zz011', 'zz011', -np.inf)])
+        self.assertEqual(self.mSubmit.bestCost(), ('zz010', 2.0))
+
+    def test_costLedger(self):
+        """
+        Test costs are kept in the ledger, only computed for new models and recomputed when obs change.
+        """
+        self.mSubmit.runCost(self.config)
+        signature = self.mSubmit._costSignature
+        ledger = self.mSubmit.costLedger(signature)
+        self.assertEqual(sorted(ledger.keys()), ['zz001', 'zz002'])
+        # a new instance gets costs from the index.
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation, None, rootDir=self.dirPath)
+        ledger2 = mSubmit.costLedger(signature)
+        self.assertEqual(ledger2, ledger)
+        self.assertEqual(mSubmit.bestCost(), self.mSubmit.bestCost())
+        # fake a cost so can tell it is not recomputed.
+        mSubmit.addCosts([('zz001', 'zz001', -1.0)])
+        fConfig = mSubmit.runCost(self.config)
+        self.assertEqual(fConfig.cost()['zz001'], -1.0)
+        self.assertEqual(fConfig.getv('bestEval'), 'zz001')
+        # change the observations and the cost gets recomputed.
+        obs = self.models[0].readObs(series=True)
+        obs.iloc[0] *= 1.1
+        self.models[0].writeObs(obs)
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation, None, rootDir=self.dirPath)
+        fConfig = mSubmit.runCost(self.config)
+        self.assertNotEqual(fConfig.cost()['zz001'], -1.0)
+        self.assertEqual(fConfig.cost()['zz002'], ledger['zz002'][1])
+        # and different targets give a different ledger.
+        config = copy.deepcopy(self.config)
+        tgt = config.targets()
+        tgt.iloc[0] *= 2
+        config.targets(targets=tgt)
+        mSubmit = Submit.ModelSubmit(config, ModelSimulation.ModelSimulation, None, rootDir=self.dirPath)
+        fConfig = mSubmit.runCost(config)
+        self.assertNotEqual(mSubmit._costSignature, signature)
+        self.assertNotEqual(fConfig.cost()['zz002'], ledger['zz002'][1])
+
+    def test_runStates(self):
+        """
+        Test run states get recorded and can be got without reading directories.
+        """
+        import pathlib
+        self.assertEqual(self.mSubmit.runStates(), {'zz001': 'DONE', 'zz002': 'DONE'})
+        self.assertEqual(self.mSubmit.stateCounts()['DONE'], 2)
+        # read only never creates the table.
+        statePath = pathlib.Path(self.mSubmit._runStates.path)
+        statePath.rename(statePath.with_suffix('.save'))
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation, None, rootDir=self.dirPath,
+                                     readOnly=True)
+        self.assertEqual(mSubmit.runStates(), {})
+        self.assertFalse(statePath.exists())
+        statePath.with_suffix('.save').rename(statePath)
+        # need a new model which gets created.
+        params = self.mSubmit.modelParams(self.models[0])
+        params.pop('refDir')
+        params[self.config.paramNames()[0]] *= 1.1
+        self.mSubmit.model(params, update=True)
+        self.mSubmit.submit(dryRun=True)
+        counts = self.mSubmit.stateCounts()
+        self.assertEqual(counts['CREATED'], 1)
+        self.assertEqual(counts['DONE'], 2)
+        # a model without obs is only a failure once it has finished.
+        dirName = [d for d, state in self.mSubmit.runStates().items() if state == 'CREATED'][0]
+        dir = pathlib.Path(self.dirPath) / dirName
+        model = ModelSimulation.ModelSimulation(dir)
+        self.mSubmit.noObs = 'continue'
+        self.mSubmit.storeModel(dir, model, model.getObs())
+        self.assertNotIn(f'{dirName} FAILED', statePath.read_text())
+        nRerun = len(self.mSubmit.rerunModels())
+        self.mSubmit.setRunState(dir, 'POSTPROCESSING')  # still post-processing so left alone.
+        self.assertIsNone(self.mSubmit.storeModel(dir, model, model.getObs()))
+        self.assertNotIn(f'{dirName} FAILED', statePath.read_text())
+        self.assertEqual(self.mSubmit.runStates()[dirName], 'POSTPROCESSING')
+        self.assertEqual(len(self.mSubmit.rerunModels()), nRerun)
+        self.mSubmit.setRunState(dir, 'DONE')  # finished without obs so a failure.
+        self.mSubmit.storeModel(dir, model, model.getObs())
+        self.assertIn(f'{dirName} FAILED', statePath.read_text())
+        self.assertEqual(self.mSubmit.runStates()[dirName], 'CREATED')  # marked for continuation.
+        self.assertEqual(len(self.mSubmit.rerunModels()), nRerun + 1)
 
     def test_clean(self):
         """
@@ -445,7 +877,9 @@ class testSubmit(unittest.TestCase):
         for jsonF in json_files:
             with open(pathD / (jsonF + '.json'), 'w') as fp:
                 print("Dummy JSON FILE", file=fp)
-        self.mSubmit.clean()
+        removed = self.mSubmit.clean()
+        self.assertEqual(sorted([p.name for p in removed if p.is_dir()]), [])  # dirs gone straight away.
+        self.mSubmit.waitClean()  # deletion happens in the background so wait for it.
         # and now check the dir. Expect there to be two json files.. (as we just made them)
         fileCount = 0
         for file in pathD.glob('*'):
@@ -460,6 +894,44 @@ class testSubmit(unittest.TestCase):
         with self.assertRaises(Exception):
             mSubmit.clean()
 
+    def test_cleanDryRun(self):
+        """
+        Test clean with dryRun removes nothing but reports what would be removed.
+        """
+        import pathlib
+        pathD = pathlib.Path(self.dirPath)
+        before = sorted(pathD.iterdir())
+        got = self.mSubmit.clean(dryRun=True)
+        self.assertEqual(sorted(pathD.iterdir()), before)
+        for dir in self.modelDirs:
+            self.assertIn(pathlib.Path(dir), got)
+        self.assertTrue(all([p.suffix != '.json' for p in got]))
+        self.assertEqual(self.mSubmit.cleanProgress(), (0, 0))
+
+    def test_waitClean(self):
+        """
+        Test waitClean and cleanProgress work -- including clearing up what an earlier clean left in the trash.
+        """
+        import pathlib
+        pathD = pathlib.Path(self.dirPath)
+        # something left from an earlier (interrupted) clean.
+        left = pathD / self.mSubmit.trashDir / 'old' / 'zz999'
+        left.mkdir(parents=True)
+        (left / 'file.txt').write_text('left over')
+        self.mSubmit.clean()
+        for dir in self.modelDirs:  # gone from the study.
+            self.assertFalse(os.path.exists(dir))
+        done, total = self.mSubmit.cleanProgress()
+        self.assertEqual(total, len(self.modelDirs) + 1)
+        got = self.mSubmit.waitClean()
+        self.assertEqual(len(got), total)
+        self.assertFalse((pathD / self.mSubmit.trashDir).exists())
+        self.assertEqual(self.mSubmit.cleanProgress(), (0, 0))
+        # and can carry on using the study.
+        mSubmit = Submit.ModelSubmit(self.config, ModelSimulation.ModelSimulation,
+                                     None, rootDir=pathD, verbose=self.verbose)
+        self.assertEqual(len(mSubmit._models), 0)
+
 
 if __name__ == "__main__":
     print("Running Test Cases")
@@ -4,12 +4,16 @@ This test routine needs OPTCLIMTOP specified sensibly.
 """
 
 import collections
+import datetime
+import io
 import json
 import math
 import os
+import pathlib
 import shutil
 import tempfile
 import unittest
+import unittest.mock
 
 import f90nml
 import pandas as pd
@@ -116,6 +120,29 @@ class testModelSimulation(unittest.TestCase):
         self.assertNotEqual(m.getObs(), expectObs)
         m.setParams({'aaa': 99.9}, addParam=True)
 
+    def test_createModelSimulation(self):
+        """
+        Test createModelSimulation refuses to overwrite an existing directory -- even an empty one.
+        :return:
+        """
+        with open(self.model._configFilePath, 'rb') as fp:
+            config = fp.read()
+        with self.assertRaises(FileExistsError):  # existing model.
+            ModelSimulation.ModelSimulation(self.testDir, name='new', create=True, refDirPath=self.refDirPath,
+                                            parameters={'one': 2.0}, obsNames=self.obsNames)
+        with open(self.model._configFilePath, 'rb') as fp:
+            self.assertEqual(fp.read(), config)  # existing model untouched.
+        self.assertTrue(os.path.exists(os.path.join(self.testDir, 'obs.nc')))
+        emptyDir = os.path.join(self.testDir, 'empty')
+        os.mkdir(emptyDir)
+        for refDirPath in [self.refDirPath, None]:
+            with self.assertRaises(FileExistsError):
+                ModelSimulation.ModelSimulation(emptyDir, name='new', create=True, refDirPath=refDirPath,
+                                                parameters={'one': 2.0}, obsNames=self.obsNames)
+            self.assertEqual(os.listdir(emptyDir), [])
+        # no temporary directories left behind.
+        self.assertEqual([d for d in os.listdir(self.testDir) if d.startswith('.')], [])
+
     def test_get(self):
         """
         Test that get works
@@ -167,6 +194,64 @@ class testModelSimulation(unittest.TestCase):
         m = ModelSimulation.ModelSimulation(self.model.dirPath, verbose=self.verbose)
         self.assertNotEqual(m.get(), self.model.get())
 
+    def test_readRecord(self):
+        """
+        Test that readRecord works
+        :return:
+        """
+        record = ModelSimulation.ModelSimulation.readRecord(self.model.dirPath, obsNames=self.obsNames)
+        self.assertEqual(record['name'], 'test')
+        self.assertEqual(record['dirPath'], self.model.dirPath)
+        self.assertEqual(record['params'], self.model.getParams())
+        self.assertEqual(record['refDirPath'], self.model.refDirPath())
+        self.assertEqual(record['obs'], self.model.getObs())
+
+    def test_configBackend(self):
+        """
+        Test configuration round trips through the JSON backend and is migrated from legacy pickle files.
+        :return:
+        """
+        self.assertTrue(os.path.isfile(os.path.join(self.dirPath, 'simulationConfig.json')))
+        self.assertFalse(os.path.isfile(os.path.join(self.dirPath, 'simulationConfig.cfg')))
+        config = collections.OrderedDict(when=datetime.datetime(2020, 1, 2, 3, 4, 5),
+                                         series=pd.Series({'VF1': 1.5, 'CT': 2}, name='params'),
+                                         path=pathlib.Path('/some/where'), nan=float('nan'), nested={'a': [1, 'b']},
+                                         tup=(1, 'a', (2.5, [3, (4,)])), tupList=[(1, 2), {'t': ()}])
+        backend = ModelSimulation.JsonConfig()
+        path = os.path.join(self.testDir, 'test.json')
+        backend.write(config, path)
+        got = backend.read(path)
+        self.assertEqual(list(got.keys()), list(config.keys()))
+        self.assertEqual(got['when'], config['when'])
+        pd.testing.assert_series_equal(got['series'], config['series'].astype(float))
+        self.assertEqual(got['path'], config['path'])
+        self.assertTrue(math.isnan(got['nan']))
+        self.assertEqual(got['nested'], config['nested'])
+        for key in ['tup', 'tupList']:  # tuples stay tuples.
+            self.assertEqual(got[key], config[key])
+        self.assertIsInstance(got['tup'][2][1][1], tuple)
+        self.assertIsInstance(got['tupList'][1]['t'], tuple)
+        # later schema cannot be read.
+        with open(path, 'w') as fp:
+            json.dump(dict(schema=backend.schema + 1, config={}), fp)
+        with self.assertRaises(ValueError):
+            backend.read(path)
+
+        # replace the JSON file with a legacy pickle file.
+        expect = self.model.readConfig()
+        jsonPath = os.path.join(self.dirPath, 'simulationConfig.json')
+        cfgPath = os.path.join(self.dirPath, 'simulationConfig.cfg')
+        ModelSimulation.PickleConfig().write(expect, cfgPath)
+        os.chmod(jsonPath, 0o600)
+        os.remove(jsonPath)
+        m = ModelSimulation.ModelSimulation(self.dirPath)
+        self.assertEqual(m.readConfig(), expect)
+        self.assertTrue(ModelSimulation.ModelSimulation.migrateConfig(self.dirPath))
+        self.assertFalse(ModelSimulation.ModelSimulation.migrateConfig(self.dirPath))  # nothing to do.
+        self.assertTrue(os.path.isfile(jsonPath))
+        self.assertFalse(os.path.isfile(cfgPath))
+        self.assertEqual(m.readConfig(), expect)
+
     def test_readObs(self):
         """
         Test that readObs works
@@ -214,6 +299,35 @@ class testModelSimulation(unittest.TestCase):
         expect = pd.Series(self.model.getObs())
         obs = self.model.getObs(verbose=self.verbose,series=True)
         self.assertTrue(expect.equals(obs),msg='series not as expected')
+
+    def test_readObsFile(self):
+        """
+        Test that readObsFile caches reads and notices when files change.
+        :return:
+        """
+        obsFile = os.path.join(self.dirPath, 'obs.nc')
+        ModelSimulation.clearObsCache()
+        got = ModelSimulation.readObsFile(obsFile, varsWant=self.obsNames)
+        self.assertEqual(list(got.keys()), self.obsNames)
+        self.assertIs(ModelSimulation.readObsFile(obsFile, varsWant=self.obsNames), got)  # cached.
+        self.assertEqual(self.model.getObs(), collections.OrderedDict(got))
+        # asking for more reads just those.
+        more = ModelSimulation.readObsFile(obsFile, varsWant=self.obsNames + ['rh@500_nhx', 'no_such_var'])
+        self.assertIn('rh@500_nhx', more)
+        self.assertNotIn('no_such_var', more)
+        self.assertIsNone(ModelSimulation.readObsFile(os.path.join(self.dirPath, 'missing.nc')))
+        # rewriting the file gets the new values.
+        m = ModelSimulation.ModelSimulation(self.dirPath, update=True)
+        newObs = collections.OrderedDict([(k, 1.0 + i) for i, k in enumerate(self.obsNames)])
+        m.writeObs(newObs)
+        self.assertEqual(self.model.getObs(), newObs)
+        # and a json file rewritten by something else.
+        jsonFile = os.path.join(self.dirPath, 'obs.json')
+        for value in [1.0, 2.0]:
+            with open(jsonFile, 'w') as fp:
+                json.dump({'fred': value, 'jim': 'x' * int(value)}, fp)
+            self.assertEqual(ModelSimulation.readObsFile(jsonFile)['fred'], value)
+
     def test_writeObs(self):
         """
         Test that write obs works.
@@ -230,6 +344,7 @@ class testModelSimulation(unittest.TestCase):
         # now make it write to a json file.
         # need to make a new config.
 
+        shutil.rmtree(self.testDir)  # creation refuses to overwrite an existing model.
         model = ModelSimulation.ModelSimulation(self.testDir,
                                                 name='test', create=True,
                                                 refDirPath=self.refDirPath,
@@ -249,6 +364,7 @@ class testModelSimulation(unittest.TestCase):
         obs = pd.Series(obs)
         model.writeObs(obs,verbose=self.verbose)
 
+        shutil.rmtree(self.testDir)  # creation refuses to overwrite an existing model.
         model = ModelSimulation.ModelSimulation(self.testDir,
                                                 name='test', create=True,
                                                 refDirPath=self.refDirPath,
@@ -276,6 +392,38 @@ class testModelSimulation(unittest.TestCase):
         self.assertEqual(m.get('fbg'), 1.0)
         self.assertNotEqual(m.get(), config)  # on disk config should have changed...
 
+    def test_batch(self):
+        """
+        Test that batch writes the configuration once at the end and restores it on failure.
+        :return:
+        """
+        m = ModelSimulation.ModelSimulation(self.model.dirPath, update=True)
+        config = m.readConfig()
+        with m.batch():
+            m.set2(fbg=1.0)
+            with m.batch():  # nested blocks write nothing.
+                m.set({'fbf': 2.0})
+            self.assertEqual(m.readConfig(), config)  # nothing written yet
+            self.assertEqual(m.get(['fbg', 'fbf']), [1.0, 2.0])
+        got = m.readConfig()
+        self.assertEqual([got['fbg'], got['fbf']], [1.0, 2.0])
+        self.assertEqual(os.listdir(self.dirPath).count('simulationConfig.json'), 1)
+        self.assertFalse(any(f.endswith('.tmp') for f in os.listdir(self.dirPath)))  # no temporary files left.
+        self.assertFalse(os.stat(m._configFilePath).st_mode & 0o222)  # read only.
+        # failure restores configuration and writes nothing.
+        with self.assertRaises(ZeroDivisionError):
+            with m.batch():
+                m.set2(fbg=3.0)
+                1 / 0
+        self.assertEqual(m.get('fbg'), 1.0)
+        self.assertEqual(m.readConfig()['fbg'], 1.0)
+        # read only checks still happen.
+        m.setReadOnly(True)
+        with self.assertRaises(Exception):
+            with m.batch():
+                m.set2(fbg=4.0)
+        self.assertEqual(m.readConfig()['fbg'], 1.0)
+
     def test_setParams(self):
         """
         Test that setParams works
@@ -433,6 +581,58 @@ class testModelSimulation(unittest.TestCase):
         self.assertEqual(nml['runcnst']['o2mmr'], 0.21)
         self.assertEqual(nml['runcnst']['rhcrit'], rhcv)
 
+    def test_nameListTemplate(self):
+        """
+        Test that patching namelists through templates gives exactly what f90nml writes and that
+        backups are optional.
+        """
+
+        def f90nmlPatch(text, values):
+            # what writeNameList used to do -- patch the whole namelist and write it with f90nml.
+            nl = f90nml.reads(text)
+            nl.end_comma = True
+            nl.uppercase = True
+            nl.logical_repr = ('.FALSE.', '.TRUE.')
+            for namelist, var, value in values:
+                if namelist not in nl:
+                    nl[namelist] = collections.OrderedDict()
+                nl[namelist][var] = value
+            stream = io.StringIO()
+            nl.write(stream)
+            return stream.getvalue()
+
+        with open(os.path.join(self.refDirPath, 'CNTLATM')) as fp:
+            text = fp.read()
+        template = ModelSimulation.nameListTemplate(text)
+        self.assertIs(template, ModelSimulation.nameListTemplate(text))  # parsed once.
+        self.assertTrue(template.splice)
+        for values in [[],
+                       [('SLBC21', 'VF1', 1.5)],
+                       [('slbc21', 'vf1', 1.5), ('runcnst', 'o2mmr', 0.21), ('runcnst', 'rhcrit', [0.65, 0.7] + [0.8] * 17)],
+                       [('runcnst', 'l_flag', True), ('runcnst', 'name', 'fred')],
+                       [('newnl', 'x', 2), ('slbc21', 'vf1', 1.0)]]:  # new namelist so f90nml writes it all.
+            self.assertEqual(template.patch(values), f90nmlPatch(text, values), msg=f"Patch {values} differs")
+        # if f90nml internals change whole namelists get written.
+        values = [('slbc21', 'vf1', 1.5)]
+        with unittest.mock.patch.object(f90nml.Namelist, '_write_nmlgrp', side_effect=AttributeError('changed')):
+            broken = ModelSimulation.NameListTemplate(text)
+        self.assertFalse(broken.splice)
+        self.assertEqual(broken.patch(values), f90nmlPatch(text, values))
+        broken = ModelSimulation.NameListTemplate(text)
+        broken._writeGroup = unittest.mock.Mock(side_effect=AttributeError('changed'))
+        self.assertEqual(broken.patch(values), f90nmlPatch(text, values))
+        self.assertFalse(broken.splice)
+        # no backups when nameListBackup is False.
+        outPath = os.path.join(self.dirPath, 'CNTLATM')
+        shutil.copyfile(os.path.join(self.refDirPath, 'CNTLATM'), outPath)
+        self.model._readOnly = False  # we can write to it.
+        self.model.nameListBackup = False
+        self.model.genVarToNameList('VF1', nameListVar='vf1', nameListName='slbc21', nameListFile='CNTLATM')
+        self.model.writeNameList(verbose=self.verbose, VF1=1.5)
+        self.assertFalse(os.path.exists(outPath + "_nl.bak"))
+        with open(outPath) as fp:
+            self.assertEqual(fp.read(), f90nmlPatch(text, [('slbc21', 'vf1', 1.5)]))
+
     def test_readNameList(self):
         """
         Test cases for readNameListVar
@@ -455,6 +655,34 @@ class testModelSimulation(unittest.TestCase):
         vars = self.model.readNameList(['RHCRIT', 'VF1'], fail=True)
         self.assertDictEqual(vars, expect)
 
+    def test_readNameListFile(self):
+        """
+        Test that namelist files are read once until they change.
+        """
+        outFile = 'CNTLATM'
+        nl = self.model.readNameListFile(outFile)
+        self.assertIs(nl, self.model.readNameListFile(outFile))  # cached
+        self.model.setReadOnly(False)
+        self.model.genVarToNameList('VF1', nameListVar='vf1', nameListName='slbc21', nameListFile=outFile)
+        self.model.registerMetaFn('ALPHAM', iceAlbedo)
+        self.model.writeNameList(verbose=self.verbose, VF1=1.75)
+        nl2 = self.model.readNameListFile(outFile)  # written so read again
+        self.assertIsNot(nl, nl2)
+        self.assertEqual(nl2['slbc21']['vf1'], 1.75)
+        vars = self.model.readNameList(['VF1', 'ALPHAM'], fail=True)
+        self.assertEqual(vars, collections.OrderedDict([('VF1', 1.75), ('ALPHAM', 0.5)]))
+        self.assertIs(nl2, self.model.readNameListFile(outFile))
+        # values returned are copies so changing them does not change the cache.
+        nlValue = self.model.readNameListVar(self.model._convNameList['VF1'])
+        nlValue[self.model._convNameList['VF1'][0]] = 2.0
+        self.assertEqual(self.model.readNameList(['VF1'])['VF1'], 1.75)
+        # a file changed outside the model gets read again.
+        with open(os.path.join(self.model.dirPath, outFile), 'a') as fp:
+            fp.write('\n&NEWNL\n/\n')
+        self.assertIsNot(nl2, self.model.readNameListFile(outFile))
+        self.model.clearNameListCache()
+        self.assertEqual(self.model._nameListCache, dict())
+
     def test_readMetaNameList(self):
         """
         test cases for readMetaNameList
@@ -570,6 +798,32 @@ class testModelSimulation(unittest.TestCase):
         self.assertEqual(len(modParams2), 2, 'Len of 2nd pertrubation  dict not 2')
         self.assertNotEqual(modParams1, modParams2, 'params the same..')
 
+    def test_runState(self):
+        """
+        Test runState is recorded through the lifecycle when the study has a state table.
+        :return: nada
+        """
+        self.assertIsNone(self.model.runState())  # no table so nothing recorded.
+        studyDir = tempfile.TemporaryDirectory()
+        self.addCleanup(optClimLib.delDirContents, studyDir.name)
+        stateFile = os.path.join(studyDir.name, ModelSimulation.ModelSimulation.runStateFile)
+        open(stateFile, 'w').close()
+        model = ModelSimulation.ModelSimulation(os.path.join(studyDir.name, 'zz001'), name='zz001', create=True,
+                                                refDirPath=self.refDirPath, ppOutputFile='obs.nc',
+                                                parameters=self.parameters, obsNames=self.obsNames)
+        self.assertEqual(model.runState(), 'CREATED')
+        model.submit()
+        self.assertEqual(model.runState(), 'SUBMITTED')
+        model.submit('continue')  # just asking for the script so no change
+        self.assertEqual(model.runState(), 'SUBMITTED')
+        self.assertEqual(model.runState('RUNNING'), 'RUNNING')
+        model.writeObs(pd.Series({k: 1.0 for k in self.obsNames}))
+        self.assertEqual(model.runState(), 'DONE')
+        model.continueSimulation()
+        self.assertEqual(model.runState(), 'CREATED')
+        with self.assertRaises(ValueError):
+            model.runState('fred')
+
     def test_submit(self):
         """
         Test submit
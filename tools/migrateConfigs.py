@@ -0,0 +1,32 @@
+#!/bin/env python
+"""
+Migrate the configurations of model simulations in a study from the legacy pickle file to JSON
+(see ModelSimulation.configBackend). Simulations already migrated are left alone.
+"""
+import argparse
+import concurrent.futures
+import os
+import pathlib
+
+import ModelSimulation
+
+
+def migrate(dir):
+    """
+    Migrate the configuration in dir
+    :param dir: model simulation directory
+    :return: True if migrated, False if not.
+    """
+    return ModelSimulation.ModelSimulation.migrateConfig(str(dir))
+
+
+parser = argparse.ArgumentParser(description="Migrate model simulation configurations in a study to JSON")
+parser.add_argument("dir", help="study directory")
+parser.add_argument("--workers", type=int, default=4, help="Number of processes to use")
+args = parser.parse_args()
+studyDir = pathlib.Path(os.path.expanduser(os.path.expandvars(args.dir)))
+legacyFiles = [backend.fileName for backend in ModelSimulation.ModelSimulation.legacyConfigBackends]
+dirs = sorted(d for d in studyDir.iterdir() if d.is_dir() and any((d / f).is_file() for f in legacyFiles))
+with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+    migrated = list(pool.map(migrate, dirs, chunksize=16))
+print(f"Migrated {sum(migrated)} of {len(dirs)} model simulations in {studyDir}")
@@ -89,6 +89,18 @@ helpStr = """Behaviour for model with no observations.
 parser.add_argument("--noobs", help=helpStr,
                     default='fail',
                     choices=['fail', 'continue', 'perturb', 'perturbc','clean'])
+parser.add_argument("--readWorkers", type=int, default=1,
+                    help="Number of workers used to read model simulation directories. Default 1 (serial)")
+parser.add_argument("--readPool", default='thread', choices=['thread', 'process'],
+                    help="Kind of pool used to read model simulation directories when readWorkers > 1")
+parser.add_argument("--paramTol", type=float, default=None,
+                    help="If set reuse existing simulations whose parameters are all within paramTol "
+                         "(as a fraction of the parameter range) of those wanted")
+parser.add_argument("--createWorkers", type=int, default=1,
+                    help="Number of workers used to create new model simulations. Default 1 (serial)")
+parser.add_argument("--registry", default=None,
+                    help="Path to a run registry shared between studies. "
+                         "Simulations already done by any study using it are imported rather than ran again")
 args = parser.parse_args()
 verbose = args.verbose
 resubmit = args.noresubmit
@@ -154,7 +166,9 @@ while doRun:
                                    configData.modelFunction(config.modelFunctions),  # model function
                                    configData.submitFunction(config.submitFunctions),  # submit function
                                    fakeFn=fakeFn, rootDir=rootDir, verbose=verbose,
-                                   readOnly=args.readOnly, noObs=args.noobs, restart=restart)
+                                   readOnly=args.readOnly, noObs=args.noobs, restart=restart,
+                                   readWorkers=args.readWorkers, readPool=args.readPool, paramTol=args.paramTol,
+                                   createWorkers=args.createWorkers, registry=args.registry)
     restart = False  # subsequently do not want to restart (i.e. clean up dir)
 
     try:
@@ -187,6 +201,9 @@ while doRun:
             raise Exception(f"Some problem. status = {status}")
     # end of try/except. Now clean up.
     finalConfig.save(filename=finalJsonFile)  # save the (updated) configuration file.
+    best = MODELRUN.bestCost()  # kept up to date as costs for new simulations are added.
+    if best is not None:
+        print(f"Best evaluation so far is {best[0]} with cost {best[1]:.4g}")
     if fakeFn is None:  # no fake fn so time to exit. This is "normal" behaviour.
         break  # exit the run for ever loop as no more runs should be submitted on this go.
     else:  # we have a fake function so keep going-- this is test mode
@@ -0,0 +1,27 @@
+#!/bin/env python
+"""
+Report the state (see RunState) of the model simulations in a study without reading their directories.
+"""
+import argparse
+import os
+import pathlib
+
+import RunState
+import ModelSimulation
+
+parser = argparse.ArgumentParser(description="Report states of model simulations in a study")
+parser.add_argument("dir", help="study directory")
+parser.add_argument("--list", nargs='*', default=None, choices=RunState.states,
+                    help="List model simulations in these states. If no states given list all.")
+args = parser.parse_args()
+studyDir = pathlib.Path(os.path.expanduser(os.path.expandvars(args.dir)))
+table = RunState.StateTable(studyDir / ModelSimulation.ModelSimulation.runStateFile)
+if not table.path.exists():
+    raise Exception(f"No run state table in {studyDir}")
+for state, count in table.counts().items():
+    print(f"{state:15s} {count:5d}")
+if args.list is not None:
+    wanted = args.list if len(args.list) > 0 else RunState.states
+    for dirName, state in sorted(table.states().items()):
+        if state in wanted:
+            print(dirName, state)
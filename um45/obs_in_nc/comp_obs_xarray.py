@@ -28,6 +28,7 @@ import pathlib
 import numpy as np
 import xarray
 
+import ObsStore
 import StudyConfig
 
 def genProcess(dataset, land_mask, latitude_coord='latitude',):
@@ -131,6 +132,8 @@ def do_work():
     parser.add_argument("CONFIG", help="The Name of the Config file")
     parser.add_argument("-d", "--dir", help="The Name of the input directory")
     parser.add_argument("-o", "--output", help="The name of the output file. Will override what is in the config file")
+    parser.add_argument("-s", "--store", help="Study observation store to append results to. "
+                                              "Default is studyObs.sqlite in the directory above the output file")
     parser.add_argument("-v", "--verbose", help="Provide verbose output", action="count", default=0)
     args = parser.parse_args()  # and parse the arguments
     # setup processing
@@ -199,6 +202,13 @@ def do_work():
     # now to write the data
     with open(output_file, 'w') as fp:
         json.dump(results, fp, indent=2)
+    # and append them to the study observation store (if there is one).
+    runDir = pathlib.Path(output_file).resolve().parent
+    store = args.store
+    if store is None:
+        store = runDir.parent / 'studyObs.sqlite'
+    if ObsStore.ObsStore(os.path.expandvars(store)).append(runDir.name, results) and verbose:
+        print(f"Appended results for {runDir.name} to {store}")
 
 # TODO add  some test cases...
 